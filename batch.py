@@ -0,0 +1,216 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+from flow import create_youtube_eli5_flow, create_youtube_eli5_async_flow
+from main import create_shared
+from nodes import get_report_path
+from utils.call_llm import set_llm_concurrency, get_llm_client_stats, get_rate_limit_stats
+from utils.token_usage import get_usage_tracker, usage_scope, format_usage_report
+from utils.tracing import trace_to
+from utils.log_config import configure_logging
+from utils.checkpoint import checkpointer_for
+from utils.youtube_processor import get_youtube_video_info, extract_video_id
+
+def read_urls(source):
+    """Read one URL per line from a file path, or from stdin when source is '-'. Blank lines and # comments are ignored."""
+    if source == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(source, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith("#")]
+
+def _split_duplicates(urls):
+    """
+    Indexes of the URLs to process, and skipped summary entries (by index) for URLs naming a video
+    already in the list. Duplicates would share one checkpoint file and one report, so they never run.
+    """
+    first_url, to_run, skipped = {}, [], {}
+    for idx, url in enumerate(urls):
+        video_id = extract_video_id(url)
+        key = url if video_id == "unknown_video_id" else video_id
+        if key in first_url:
+            skipped[idx] = {"url": url, "video_id": video_id, "status": "skipped",
+                            "duplicate_of": first_url[key], "seconds": 0.0}
+        else:
+            first_url[key] = url
+            to_run.append(idx)
+    return to_run, skipped
+
+def _describe_video(entry, skip_existing):
+    """Fill in the video id, title and report path of a summary entry; marks it skipped if the report exists."""
+    # Video info is stored locally after the first fetch, so looking it up here
+    # costs nothing extra once ProcessYouTubeURLNode asks for it again.
+    video_info = get_youtube_video_info(entry["url"])
+    entry["video_id"] = video_info.get("video_id")
+    entry["title"] = video_info.get("title")
+    entry["report"] = get_report_path(video_info.get("title", "unknown_video"))
+    if skip_existing and os.path.exists(entry["report"]):
+        entry["status"] = "skipped"
+
+def _enable_checkpoints(flow, entry, checkpoint, resume):
+    if checkpoint:
+        checkpointer = checkpointer_for(entry["video_id"])
+        entry["resumed"] = resume and checkpointer.exists()
+        flow.enable_checkpoints(checkpointer, resume=resume)
+
+def _record_result(entry, shared, flow):
+    entry["status"] = "ok"
+    entry["topics"] = len(shared.get("topics", []))
+    entry["node_stats"] = flow.collect_stats()
+    entry["usage"] = get_usage_tracker().summary(video=entry["video_id"])["total"]
+
+def process_video(url, topic_workers=5, skip_existing=True, checkpoint=True, resume=False, html_executor="inline"):
+    """
+    Run the ELI5 flow for a single video with its own shared store and flow instance. Never raises.
+    With checkpoint=True progress is saved per video_id after every node and topic; resume=True
+    continues a run that crashed or failed from its checkpoint instead of starting over.
+    """
+    started = time.perf_counter()
+    entry = {"url": url}
+    try:
+        _describe_video(entry, skip_existing)
+        if entry.get("status") != "skipped":
+            shared = create_shared(url)
+            # Reports are streamed to their files; nothing here needs the HTML in memory
+            flow = create_youtube_eli5_flow(max_topic_workers=topic_workers, keep_html_output=False, html_executor=html_executor)
+            _enable_checkpoints(flow, entry, checkpoint, resume)
+            with usage_scope(video=entry["video_id"]):
+                flow.run(shared)
+            _record_result(entry, shared, flow)
+    except Exception as e:
+        entry["status"] = "failed"
+        entry["error"] = f"{e.__class__.__name__}: {e}"
+    entry["seconds"] = round(time.perf_counter() - started, 3)
+    return entry
+
+async def process_video_async(url, topic_workers=5, skip_existing=True, checkpoint=True, resume=False, html_executor="inline"):
+    """process_video with the async flow, for run_batch_async. Never raises."""
+    started = time.perf_counter()
+    entry = {"url": url}
+    try:
+        await asyncio.to_thread(_describe_video, entry, skip_existing)
+        if entry.get("status") != "skipped":
+            shared = create_shared(url)
+            flow = create_youtube_eli5_async_flow(max_topic_workers=topic_workers, keep_html_output=False, html_executor=html_executor)
+            _enable_checkpoints(flow, entry, checkpoint, resume)
+            # Every task has its own context, so the usage of concurrent videos stays apart
+            with usage_scope(video=entry["video_id"]):
+                await flow.run_async(shared)
+            _record_result(entry, shared, flow)
+    except Exception as e:
+        entry["status"] = "failed"
+        entry["error"] = f"{e.__class__.__name__}: {e}"
+    entry["seconds"] = round(time.perf_counter() - started, 3)
+    return entry
+
+def _batch_summary(results, started_at, started, workers):
+    counts = {"ok": 0, "skipped": 0, "failed": 0}
+    for entry in results:
+        counts[entry["status"]] += 1
+    return {
+        "started_at": started_at,
+        "total_seconds": round(time.perf_counter() - started, 3),
+        "workers": workers,
+        "counts": counts,
+        "llm_client": get_llm_client_stats(),
+        "rate_limits": get_rate_limit_stats(),
+        "usage": get_usage_tracker().summary(),
+        "videos": results,
+    }
+
+def run_batch(urls, workers=4, topic_workers=5, skip_existing=True, checkpoint=True, resume=False, html_executor="inline"):
+    """
+    Process many videos concurrently (at most `workers` at a time). Returns the summary dict.
+    URLs naming a video already in the list are reported as skipped, with "duplicate_of".
+    """
+    started_at = datetime.now(timezone.utc).isoformat()
+    started = time.perf_counter()
+    to_run, skipped = _split_duplicates(urls)
+    results = [skipped.get(idx) for idx in range(len(urls))]
+    if skipped:
+        print(f"Skipping {len(skipped)} duplicate URLs")
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="video") as pool:
+        futures = {pool.submit(process_video, urls[idx], topic_workers, skip_existing, checkpoint, resume, html_executor): idx
+                   for idx in to_run}
+        for done_count, future in enumerate(as_completed(futures), start=1):
+            idx = futures[future]
+            results[idx] = future.result()
+            print(f"[{done_count}/{len(to_run)}] {results[idx]['status']}: {urls[idx]} ({results[idx]['seconds']}s)")
+
+    return _batch_summary(results, started_at, started, workers)
+
+async def run_batch_async(urls, workers=4, topic_workers=5, skip_existing=True, checkpoint=True, resume=False, html_executor="inline"):
+    """
+    run_batch on a single event loop: at most `workers` videos are in flight, as tasks rather
+    than threads, so hundreds of videos can run at once. The LLM concurrency limit still applies.
+    """
+    started_at = datetime.now(timezone.utc).isoformat()
+    started = time.perf_counter()
+    to_run, skipped = _split_duplicates(urls)
+    results = [skipped.get(idx) for idx in range(len(urls))]
+    if skipped:
+        print(f"Skipping {len(skipped)} duplicate URLs")
+    limit = asyncio.Semaphore(max(1, workers))
+
+    async def run_one(idx, url):
+        async with limit:
+            return idx, await process_video_async(url, topic_workers, skip_existing, checkpoint, resume, html_executor)
+
+    tasks = [asyncio.ensure_future(run_one(idx, urls[idx])) for idx in to_run]
+    for done_count, next_done in enumerate(asyncio.as_completed(tasks), start=1):
+        idx, results[idx] = await next_done
+        print(f"[{done_count}/{len(to_run)}] {results[idx]['status']}: {urls[idx]} ({results[idx]['seconds']}s)")
+
+    return _batch_summary(results, started_at, started, workers)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the ELI5 YouTube flow for a list of videos.")
+    parser.add_argument("input", nargs="?", default="-", help="File with one YouTube URL per line, or '-' for stdin (default).")
+    parser.add_argument("--workers", type=int, default=4, help="Number of videos processed concurrently.")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Run the videos as tasks on one event loop instead of threads (allows a much larger --workers).")
+    parser.add_argument("--topic-workers", type=int, default=5, help="Concurrent topics per video.")
+    parser.add_argument("--html-executor", choices=["inline", "thread", "process"], default="inline",
+                        help="Where reports are rendered; 'process' uses all CPU cores (pool size: FLOW_PROCESS_WORKERS).")
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="Maximum LLM requests in flight across all videos.")
+    parser.add_argument("--summary", default="batch_summary.json", help="Where to write the JSON summary.")
+    parser.add_argument("--force", action="store_true", help="Re-process videos whose report already exists in examples/.")
+    parser.add_argument("--resume", action="store_true", help="Continue videos from their checkpoints (left behind by crashed or failed runs).")
+    parser.add_argument("--no-checkpoint", action="store_true", help="Do not save per-video checkpoints.")
+    parser.add_argument("--log-level", default=None, help="Log level for progress messages (default: LOG_LEVEL, else INFO).")
+    parser.add_argument("--quiet", action="store_true", help="Only log warnings and errors.")
+    parser.add_argument("--trace", default=None, help="Record per-node timings: *.jsonl for JSON lines, otherwise a Chrome trace (default: FLOW_TRACE).")
+    args = parser.parse_args(argv)
+    configure_logging(args.log_level, quiet=args.quiet)
+
+    urls = read_urls(args.input)
+    if not urls:
+        print("No URLs to process.")
+        return 0
+
+    set_llm_concurrency(args.llm_concurrency)
+    print(f"Processing {len(urls)} videos with {args.workers} {'async ' if args.use_async else ''}workers (LLM concurrency {args.llm_concurrency})...")
+    options = dict(workers=args.workers, topic_workers=args.topic_workers, skip_existing=not args.force,
+                   checkpoint=not args.no_checkpoint, resume=args.resume, html_executor=args.html_executor)
+    with trace_to(args.trace):
+        if args.use_async:
+            summary = asyncio.run(run_batch_async(urls, **options))
+        else:
+            summary = run_batch(urls, **options)
+
+    with open(args.summary, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(f"Done in {summary['total_seconds']}s: {summary['counts']}. Summary written to {args.summary}")
+    print("LLM usage:")
+    print(format_usage_report(summary["usage"]))
+    return 1 if summary["counts"]["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from pocketflow import Instrument, add_instrument, remove_instrument
+
+WORDS = (
+    "galaxy planet orbit gravity rocket engine battery energy climate ocean forest volcano "
+    "language music rhythm memory neuron brain sleep dream robot sensor computer network "
+    "market money trade history empire culture recipe kitchen garden insect mammal dinosaur"
+).split()
+FILLER = "the a and of to in is that it for with as on we you this so really just like very".split()
+
+def synthetic_segments(num_chars, seed=0):
+    """Deterministic transcript segments (~80 characters each) totalling about `num_chars` characters."""
+    rng = random.Random(seed)
+    # A few recurring subjects per video so topic extraction and retrieval have something to find
+    subjects = rng.sample(WORDS, 8)
+    segments, total, start = [], 0, 0.0
+    while total < num_chars:
+        words = []
+        while sum(len(w) + 1 for w in words) < 80:
+            words.append(rng.choice(subjects) if rng.random() < 0.3 else rng.choice(FILLER + WORDS))
+        text = " ".join(words)
+        duration = round(len(text) / 15, 2) # ~15 characters per second of speech
+        segments.append({"text": text, "start": round(start, 2), "duration": duration})
+        total += len(text) + 1
+        start += duration
+    return segments
+
+class NodeTimer(Instrument):
+    """Sums span wall and CPU time per (node, phase)."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.totals = {}
+
+    def span_end(self, span):
+        with self._lock:
+            bucket = self.totals.setdefault(span["node"], {}).setdefault(span["phase"], {"count": 0, "wall_s": 0.0, "cpu_s": 0.0})
+            bucket["count"] += 1
+            bucket["wall_s"] += span["wall"]
+            bucket["cpu_s"] += span["cpu"]
+
+    def event(self, span):
+        if span["phase"] == "retry":
+            with self._lock:
+                node = self.totals.setdefault(span["node"], {})
+                node["retries"] = node.get("retries", 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return {node: {phase: (dict(value, wall_s=round(value["wall_s"], 4), cpu_s=round(value["cpu_s"], 4))
+                                   if isinstance(value, dict) else value)
+                           for phase, value in phases.items()}
+                    for node, phases in self.totals.items()}
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_size(size, runs, topic_workers, store, video_workers=1):
+    """Run the flow `runs` times on fresh synthetic videos of `size` characters. Returns the result dict."""
+    from flow import create_youtube_eli5_flow
+    from main import create_shared
+    from utils.token_usage import get_usage_tracker, usage_scope
+    from concurrent.futures import ThreadPoolExecutor
+
+    videos = []
+    for run in range(runs):
+        video_id = f"b{size:07d}{run:03d}" # 11 characters, like a real YouTube id
+        segments = synthetic_segments(size, seed=size + run)
+        store.save({"video_id": video_id, "title": f"Benchmark video {size} chars #{run}",
+                    "thumbnail_url": "", "segments": segments})
+        videos.append(video_id)
+
+    timer = NodeTimer()
+    tracker = get_usage_tracker()
+    tracker.reset()
+
+    def run_video(video_id):
+        shared = create_shared(f"https://www.youtube.com/watch?v={video_id}")
+        flow = create_youtube_eli5_flow(max_topic_workers=topic_workers)
+        started = time.perf_counter()
+        with usage_scope(video=video_id):
+            flow.run(shared)
+        return time.perf_counter() - started, len(shared.get("topics", []))
+
+    add_instrument(timer)
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, video_workers)) as pool:
+            outcomes = list(pool.map(run_video, videos))
+    finally:
+        remove_instrument(timer)
+    elapsed = time.perf_counter() - started
+
+    latencies = [seconds for seconds, _ in outcomes]
+    usage = tracker.summary()["total"]
+    return {
+        "transcript_chars": size,
+        "runs": runs,
+        "p50_s": round(percentile(latencies, 50), 4),
+        "p95_s": round(percentile(latencies, 95), 4),
+        "mean_s": round(sum(latencies) / len(latencies), 4),
+        "videos_per_minute": round(runs / elapsed * 60, 2),
+        "topics_per_video": round(sum(topics for _, topics in outcomes) / len(outcomes), 2),
+        "llm_calls": usage["calls"],
+        "input_tokens": usage["input_tokens"],
+        "output_tokens": usage["output_tokens"],
+        "peak_rss_mb": peak_rss_mb(), # Process-wide peak so far, so it only grows across sizes
+        "nodes": timer.snapshot(),
+    }
+
+def compare(results, baseline_path):
+    """Print p50 and throughput changes against a previous results file."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {r["transcript_chars"]: r for r in json.load(f)["results"]}
+    print(f"\nCompared to {baseline_path}:")
+    for result in results:
+        base = baseline.get(result["transcript_chars"])
+        if not base:
+            continue
+        p50_change = (result["p50_s"] / base["p50_s"] - 1) * 100 if base["p50_s"] else 0.0
+        throughput_change = (result["videos_per_minute"] / base["videos_per_minute"] - 1) * 100 if base["videos_per_minute"] else 0.0
+        print(f"  {result['transcript_chars']:>8} chars: p50 {p50_change:+.1f}%, throughput {throughput_change:+.1f}%")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ELI5 flow end to end with a simulated LLM and synthetic transcripts.")
+    parser.add_argument("--sizes", default="1000,10000,100000,500000", help="Comma-separated transcript sizes in characters.")
+    parser.add_argument("--runs", type=int, default=5, help="Videos per size.")
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated LLM latency per call (seconds).")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Random +/- variation of the latency (seconds).")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Probability that an LLM call is rate limited.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the simulated LLM.")
+    parser.add_argument("--topic-workers", type=int, default=5, help="Concurrent topics per video.")
+    parser.add_argument("--video-workers", type=int, default=1, help="Videos processed concurrently.")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results.")
+    parser.add_argument("--baseline", default=None, help="Previous results file to compare against.")
+    parser.add_argument("--keep-workdir", action="store_true", help="Keep the temporary directory with the synthetic store and reports.")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="eli5_bench_")
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    # Everything the flow touches (transcript store, reports, caches) lives in the temp directory
+    os.environ.update({
+        "TRANSCRIPT_STORE_DIR": os.path.join(workdir, "transcripts"),
+        "YOUTUBE_OFFLINE": "1",
+        "LLM_PROVIDER": "stub",
+        "LLM_CACHE_DISABLE": "1",
+        "LOG_QUIET": os.getenv("LOG_QUIET", "1"),
+    })
+    os.chdir(workdir)
+
+    from utils.log_config import configure_logging
+    from utils.llm_providers import StubProvider, register_provider
+    from utils.transcript_store import get_default_store
+    configure_logging()
+    register_provider("stub", StubProvider(latency=args.latency, jitter=args.jitter,
+                                           failure_rate=args.failure_rate, seed=args.seed))
+    store = get_default_store()
+
+    results = []
+    for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        result = run_size(size, args.runs, args.topic_workers, store, args.video_workers)
+        results.append(result)
+        print(f"{size:>8} chars: p50 {result['p50_s']:.3f}s, p95 {result['p95_s']:.3f}s, "
+              f"{result['videos_per_minute']:.1f} videos/min, {result['llm_calls']} LLM calls, peak RSS {result['peak_rss_mb']} MB")
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "keep_workdir")},
+        "results": results,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+    if args.keep_workdir:
+        print(f"Work directory kept: {workdir}")
+    else:
+        os.chdir(os.path.dirname(output))
+        shutil.rmtree(workdir, ignore_errors=True)
+    if baseline:
+        compare(results, baseline)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,17 @@
-from pocketflow import Flow, BatchFlow # Assuming pocketflow.py is available
+import logging
+from pocketflow import Flow, BatchFlow, AsyncFlow # Assuming pocketflow.py is available
 from nodes import (
     ProcessYouTubeURLNode,
     ExtractTopicsAndQuestionsNode,
-    ProcessTopicNode, # This is a BatchNode
-    GenerateHTMLNode
+    ProcessTopicNode, # This is a ParallelBatchNode
+    GenerateHTMLNode,
+    AsyncProcessYouTubeURLNode,
+    AsyncExtractTopicsAndQuestionsNode,
+    AsyncProcessTopicNode
 )
 
+logger = logging.getLogger(__name__)
+
 # The design doc shows: videoProcess --> topicsQuestions --> contentBatch --> htmlGen
 # contentBatch is a subgraph that processes each topic.
 # ProcessTopicNode is a BatchNode, which handles the iteration over topics internally.
@@ -13,27 +19,52 @@ from nodes import (
 
 # Option 1: Linear flow where ProcessTopicNode is a BatchNode
 # This aligns with ProcessTopicNode being defined as BatchNode in nodes.py
-def create_youtube_eli5_flow():
-    """Create the main ELI5 YouTube summarization flow."""
+def create_youtube_eli5_flow(max_topic_workers=5, keep_html_output=True, html_executor="inline"):
+    """
+    Create the main ELI5 YouTube summarization flow.
+    keep_html_output=False streams the report to its file without keeping it in shared["html_output"].
+    html_executor="process" renders reports on the shared process pool (see pocketflow.get_executor).
+    """
     
     # Instantiate nodes
     video_process_node = ProcessYouTubeURLNode()
     extract_topics_questions_node = ExtractTopicsAndQuestionsNode()
     
-    # ProcessTopicNode is a BatchNode. It will internally iterate over topics
-    # provided by its prep method (which reads shared["topics"]).
-    process_topic_node = ProcessTopicNode()
+    # ProcessTopicNode is a ParallelBatchNode. It will internally iterate over topics
+    # provided by its prep method (which reads shared["topics"]), processing up to
+    # max_workers topics concurrently.
+    process_topic_node = ProcessTopicNode(max_workers=max_topic_workers)
     
-    generate_html_node = GenerateHTMLNode()
+    generate_html_node = GenerateHTMLNode(keep_html_output=keep_html_output, executor=html_executor)
 
-    # Connect nodes in sequence
+    # Connect nodes in sequence.
+    # ExtractTopicsAndQuestionsNode is a StreamNode and ProcessTopicNode consumes its stream,
+    # so the Flow pipelines them: topics are processed while extraction is still streaming.
     video_process_node >> extract_topics_questions_node
     extract_topics_questions_node >> process_topic_node
     process_topic_node >> generate_html_node
     
     # Create flow starting with the first node
     main_flow = Flow(video_process_node)
-    print("YouTube ELI5 Flow (Linear with BatchNode) created.")
+    logger.debug("YouTube ELI5 Flow (Linear with BatchNode) created.")
+    return main_flow
+
+def create_youtube_eli5_async_flow(max_topic_workers=5, keep_html_output=True, html_executor="inline"):
+    """
+    Same pipeline as create_youtube_eli5_flow, as an AsyncFlow: run it with `await flow.run_async(shared)`
+    and many videos share one event loop. Topics are extracted in one response instead of streamed.
+    """
+    video_process_node = AsyncProcessYouTubeURLNode()
+    extract_topics_questions_node = AsyncExtractTopicsAndQuestionsNode()
+    process_topic_node = AsyncProcessTopicNode(max_workers=max_topic_workers)
+    generate_html_node = GenerateHTMLNode(keep_html_output=keep_html_output, executor=html_executor) # Sync; runs in a worker thread
+
+    video_process_node >> extract_topics_questions_node
+    extract_topics_questions_node >> process_topic_node
+    process_topic_node >> generate_html_node
+
+    main_flow = AsyncFlow(video_process_node)
+    logger.debug("YouTube ELI5 async flow created.")
     return main_flow
 
 # Option 2: Using a BatchFlow for contentBatch (more explicit for the diagram)
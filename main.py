@@ -1,14 +1,20 @@
 from flow import create_youtube_eli5_flow
+from utils.token_usage import get_usage_tracker, usage_scope, format_usage_report
+from utils.tracing import trace_to
+from utils.log_config import configure_logging
+from utils.checkpoint import checkpointer_for
+import os
+from utils.youtube_processor import extract_video_id
 import json
 
-# Example main function based on docs/design.md
-def main():
-    # Initialize shared data structure
-    shared = {
+def create_shared(youtube_url=""):
+    """Initialize a fresh shared data structure (see docs/design.md) for one video."""
+    return {
         "video_info": {
-            "url": "",            # YouTube URL to be provided by user
+            "url": youtube_url,   # YouTube URL to be processed
             "title": "",          # Video title - will be filled by ProcessYouTubeURLNode
             "transcript": "",     # Full transcript - will be filled by ProcessYouTubeURLNode
+            "segments": [],       # Timed transcript segments - will be filled by ProcessYouTubeURLNode
             "thumbnail_url": "",  # Thumbnail image URL - will be filled by ProcessYouTubeURLNode
             "video_id": ""        # YouTube video ID - will be filled by ProcessYouTubeURLNode
         },
@@ -29,6 +35,14 @@ def main():
         "html_output": ""  # Final HTML content - will be filled by GenerateHTMLNode
     }
 
+# Example main function based on docs/design.md
+def main():
+    # Progress goes to the log (LOG_LEVEL, LOG_QUIET=1); results below are printed
+    configure_logging()
+
+    # Initialize shared data structure
+    shared = create_shared()
+
     # Get YouTube URL from user input or set a default for testing
     youtube_url = input("Enter the YouTube video URL: ")
     if not youtube_url:
@@ -64,11 +78,21 @@ def main():
 
     # Create the flow
     eli5_flow = create_youtube_eli5_flow()
+    # Progress is checkpointed per video; FLOW_RESUME=1 continues an interrupted run of the same video
+    eli5_flow.enable_checkpoints(checkpointer_for(extract_video_id(youtube_url)),
+                                 resume=os.getenv("FLOW_RESUME", "").lower() in ("1", "true", "yes"))
 
     # Run the flow
     print("\nStarting ELI5 YouTube Flow...")
-    eli5_flow.run(shared)
+    # Set FLOW_TRACE=trace.json (Chrome trace) or trace.jsonl to record per-node timings
+    with trace_to(), usage_scope(video=extract_video_id(youtube_url)):
+        eli5_flow.run(shared)
     print("ELI5 YouTube Flow finished.")
+    for node_name, node_stats in eli5_flow.collect_stats().items():
+        if node_stats.get("retries") or node_stats.get("fallbacks"):
+            print(f"  {node_name}: {node_stats['retries']} retries, {node_stats['fallbacks']} fallbacks")
+    print("LLM usage:")
+    print(format_usage_report(get_usage_tracker().summary()))
 
     # Output the results
     print("\n--- Final Shared Data ---")
@@ -1,48 +1,237 @@
+import asyncio
+import contextvars
 import json
-from pocketflow import Node, BatchNode, BatchFlow # Assuming pocketflow.py is in the same directory or PYTHONPATH
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pocketflow import Node, ParallelBatchNode, StreamNode, AsyncNode, AsyncParallelBatchNode # Assuming pocketflow.py is in the same directory or PYTHONPATH
 from utils.youtube_processor import get_youtube_video_info
-from utils.call_llm import call_llm
-from utils.html_generator import generate_html_report
+from utils.call_llm import call_llm, call_llm_async, call_llm_stream, is_retryable_llm_error
+from utils.stream_parser import IncrementalJSONListParser
+from utils.transcript_index import TranscriptIndex, transcript_fingerprint, build_chunks, estimate_tokens, tokenize
+from utils.transcript_store import get_default_store
+from utils.token_usage import trim_to_budget
+from utils.log_config import truncated
+from utils.structured_output import parse_structured, StructuredOutputError, REASK_SYSTEM_MESSAGE
+from utils.html_generator import generate_html_report, write_html_report, save_report_artifact, artifact_path_for
 import os
 import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+def clean_filename(filename):
+    """简单的文件名清理函数: 移除非法字符并将空格替换为下划线"""
+    return re.sub(r'[^\w\-_\. ]', '', filename).replace(' ', '_')[:200]
+
+def get_report_path(video_title):
+    """HTML报告在examples目录下的保存路径，由视频标题生成安全的文件名"""
+    safe_filename = clean_filename(video_title)
+
+    # 如果文件名为空，使用默认名称
+    if not safe_filename:
+        safe_filename = "youtube_eli5_summary"
+
+    # 添加.html扩展名
+    return os.path.join(os.getcwd(), "examples", f"{safe_filename}.html")
 
 class ProcessYouTubeURLNode(Node):
     """Process YouTube URL to extract video information."""
     def prep(self, shared):
-        print(f"Node: Preparing to process YouTube URL: {shared['video_info']['url']}")
+        logger.debug("Preparing to process YouTube URL: %s", shared["video_info"]["url"])
         return shared["video_info"]["url"]
 
     def exec(self, prep_res): # prep_res is the URL from shared_store["video_info"]["url"]
-        print(f"Node: Processing YouTube URL: {prep_res}")
+        logger.info("Processing YouTube URL: %s", prep_res)
         return get_youtube_video_info(prep_res)
 
     def post(self, shared, prep_res, exec_res):
         shared["video_info"] = exec_res # exec_res is the dict from get_youtube_video_info
-        print(f"Node: Stored video_info: Title '{shared['video_info']['title']}'")
+        logger.info("Stored video_info: title '%s'", shared["video_info"]["title"])
         return "default"
 
-class ExtractTopicsAndQuestionsNode(Node):
-    """Extract interesting topics from transcript and generate questions for each topic."""
+def fallback_topics():
+    """Placeholder topic list used when no topics could be extracted."""
+    return [{
+        "title": "Fallback Topic: Could not parse LLM response",
+        "rephrased_title": "",
+        "questions": [
+            {"original": "Fallback Question: What went wrong with LLM output?", "rephrased": "", "answer": ""}
+        ]
+    }]
+
+TOPICS_SYSTEM_MESSAGE = "You are an AI assistant that processes text and outputs structured data in JSON format."
+
+TOPICS_JSON_FORMAT = """{
+  "topics": [
+    {
+      "title": "First extracted topic title (should be a concise summary of the topic)",
+      "questions": [
+        "First question related to the first topic?",
+        "Second question related to the first topic?",
+        "Third question related to the first topic (if applicable)."
+      ]
+    },
+    {
+      "title": "Second extracted topic title",
+      "questions": [
+        "First question related to the second topic?"
+      ]
+    }
+  ]
+}
+
+Include up to 3 questions per topic and up to 5 topics in total.
+"""
+
+TOPICS_SCHEMA = {
+    "type": "object",
+    "required": ["topics"],
+    "properties": {
+        "topics": {"type": "array", "items": {
+            "type": "object",
+            "required": ["title", "questions"],
+            "properties": {
+                "title": {"type": "string", "minLength": 1},
+                "questions": {"type": "array", "minItems": 1, "items": {"type": "string"}},
+            },
+        }},
+    },
+}
+
+PROCESSED_TOPIC_SCHEMA = {
+    "type": "object",
+    "required": ["rephrased_title", "questions"],
+    "properties": {
+        "rephrased_title": {"type": "string"},
+        "questions": {"type": "array", "items": {
+            "type": "object",
+            "required": ["rephrased", "answer"],
+            "properties": {
+                "original": {"type": "string"},
+                "rephrased": {"type": "string"},
+                "answer": {"type": "string"},
+            },
+        }},
+    },
+}
+
+PROCESS_TOPIC_SYSTEM_MESSAGE = "You are an AI assistant that processes text and outputs structured data in JSON format following specific guidelines for content and HTML formatting."
+
+def make_reask(caller):
+    """Follow-up LLM call used by parse_structured to fix just the broken part of a response."""
+    return lambda prompt: call_llm(prompt, system_message=REASK_SYSTEM_MESSAGE, caller=caller)
+
+def format_extracted_topic(raw_topic):
+    """Normalize one parsed topic from the LLM into the shared-store shape, or None if unusable."""
+    if not (isinstance(raw_topic, dict) and "title" in raw_topic and "questions" in raw_topic):
+        return None
+    topic_title = str(raw_topic["title"]).strip()
+
+    formatted_questions = []
+    if isinstance(raw_topic["questions"], list):
+        for j, q_text in enumerate(raw_topic["questions"][:3]): # Max 3 questions
+            formatted_questions.append({
+                "original": str(q_text).strip(),
+                "rephrased": "", # To be filled later
+                "answer": ""      # To be filled later
+            })
+
+    if not (topic_title and formatted_questions): # Ensure topic has title and questions
+        return None
+    return {
+        "title": topic_title,
+        "rephrased_title": "", # To be filled later
+        "questions": formatted_questions
+    }
+
+def parse_topics_response(llm_response_str, reask=None):
+    """
+    Parse a complete topic-extraction response into at most 5 formatted topics.
+    With `reask` (see make_reask), a malformed or invalid response is repaired by a small
+    follow-up call instead of being thrown away.
+    """
+    try:
+        parsed_data = parse_structured(llm_response_str, TOPICS_SCHEMA, reask=reask)
+    except StructuredOutputError as e:
+        logger.warning("Could not parse topics from LLM response: %s. Raw response: %s", e, truncated(llm_response_str))
+        return []
+    return format_extracted_topics(parsed_data)
+
+def format_extracted_topics(parsed_data):
+    """At most 5 formatted topics from a response validated against TOPICS_SCHEMA."""
+    result_topics = []
+    for raw_topic in parsed_data["topics"]:
+        topic = format_extracted_topic(raw_topic)
+        if topic:
+            result_topics.append(topic)
+        if len(result_topics) == 5: # Max 5 topics
+            break
+    return result_topics
+
+def merge_candidate_topics(candidates):
+    """
+    Merge candidate topics from the map step whose titles share most of their words, keeping
+    the union of their questions (max 3). Topics mentioned by more parts come first.
+    """
+    merged = [] # [(title_tokens, mentions, topic)]
+    for topic in candidates:
+        tokens = set(tokenize(topic["title"]))
+        for entry in merged:
+            union = tokens | entry[0]
+            if union and len(tokens & entry[0]) / len(union) >= 0.6:
+                entry[1] += 1
+                known = {q["original"] for q in entry[2]["questions"]}
+                for question in topic["questions"]:
+                    if question["original"] not in known and len(entry[2]["questions"]) < 3:
+                        entry[2]["questions"].append(question)
+                break
+        else:
+            merged.append([tokens, 1, {**topic, "questions": list(topic["questions"])}])
+    merged.sort(key=lambda entry: -entry[1]) # Stable, so ties keep transcript order
+    return [entry[2] for entry in merged]
+
+class ExtractTopicsAndQuestionsNode(StreamNode):
+    """Extract interesting topics from transcript and generate questions for each topic.
+
+    As a StreamNode it yields topics while the LLM response is still streaming, so the
+    following ProcessTopicNode can start on the first topic before extraction finishes.
+    """
+    def __init__(self, max_retries=3, wait=2):
+        super().__init__(max_retries, wait)
+
+    def should_retry(self, exc):
+        # Only transient LLM failures (rate limits, timeouts) are worth another attempt
+        return is_retryable_llm_error(exc)
+
+    def exec_fallback(self, prep_res, exc):
+        logger.error("Topic extraction failed after retries: %s. Populating with fallback.", exc)
+        return fallback_topics()
+
+    # Transcripts estimated above this many tokens are summarized map-reduce style instead of in one prompt
+    chunk_threshold_tokens = int(os.getenv("EXTRACT_CHUNK_THRESHOLD_TOKENS", "30000"))
+    map_chunk_tokens = 12000 # Target size of each transcript part in the map step
+    map_workers = 4          # Parts summarized concurrently
+    # Hard cap on the transcript or candidate context of any single prompt; anything beyond is trimmed
+    prompt_token_budget = int(os.getenv("EXTRACT_PROMPT_TOKEN_BUDGET", "32000"))
+
     def prep(self, shared):
-        print("Node: Preparing to extract topics and questions.")
+        logger.debug("Preparing to extract topics and questions")
         transcript = shared.get("video_info", {}).get("transcript", "")
         title = shared.get("video_info", {}).get("title", "Untitled Video")
+        segments = shared.get("video_info", {}).get("segments") or []
         if not transcript:
-            print("Warning: Transcript is empty in ExtractTopicsAndQuestionsNode.prep")
-        return transcript, title
-
-    def exec(self, prep_res):
-        transcript, title = prep_res
-        print(f"Node: Extracting topics and questions for video '{title}' (transcript first 50 chars): '{transcript[:50]}...'")
-        
-        if not transcript:
-            print("Warning: Transcript is empty in ExtractTopicsAndQuestionsNode.exec, returning empty topics.")
-            return []
-
-        # Single prompt to extract topics and questions together
-        prompt = f"""
+            logger.warning("Transcript is empty in ExtractTopicsAndQuestionsNode.prep")
+        return transcript, title, segments
+
+    def build_prompt(self, transcript, title, part=None):
+        # Single prompt to extract topics and questions together.
+        # In the map step of a long transcript, `part` is (index, total) and only that part is included.
+        source = "full transcript" if part is None else f"transcript excerpt (part {part[0]} of {part[1]})"
+        transcript = trim_to_budget(transcript, self.prompt_token_budget)
+        return f"""
 An expert content analyzer has been tasked with identifying the most engaging aspects of a YouTube video. 
-Based on the video's title and full transcript, please perform the following:
+Based on the video's title and {source}, please perform the following:
 
 1. Identify a maximum of 5 distinct and most interesting topics discussed in the video.
 2. For each of these topics, generate a maximum of 3 thought-provoking questions. These questions should encourage deeper thinking about the topic and do not necessarily need to be explicitly answered in the video. Clarification questions or questions that explore implications are good.
@@ -52,116 +241,244 @@ VIDEO TITLE: {title}
 TRANSCRIPT:
 {transcript}
 
-Format your entire response strictly in YAML, following this structure exactly:
-
-```yaml
-topics:
-  - title: |
-      First extracted topic title (should be a concise summary of the topic)
-    questions:
-      - |
-        First question related to the first topic?
-      - |
-        Second question related to the first topic?
-      - |
-        Third question related to the first topic (if applicable).
-  - title: |
-      Second extracted topic title
-    questions:
-      - |
-        First question related to the second topic?
-      # ... more questions for the second topic, up to 3
-  # ... more topics, up to 5 in total
+Format your entire response strictly as JSON, following this structure exactly:
+
+{TOPICS_JSON_FORMAT}"""
+
+    def build_reduce_prompt(self, candidates, title):
+        candidates = list(candidates)
+        while True:
+            candidates_json = json.dumps(
+                {"topics": [{"title": t["title"], "questions": [q["original"] for q in t["questions"]]} for t in candidates]},
+                ensure_ascii=False
+            )
+            # Candidates are ranked, so the least frequent ones are dropped first to stay within budget
+            if len(candidates) <= 5 or estimate_tokens(candidates_json) <= self.prompt_token_budget:
+                break
+            candidates = candidates[:max(5, len(candidates) * 3 // 4)]
+        return f"""
+An expert content analyzer summarized a long YouTube video part by part. Each part produced candidate topics with questions;
+the candidates below are listed roughly from most to least frequently mentioned across parts.
+
+Please perform the following:
+
+1. Merge candidates that describe the same topic, and select the 5 most distinct and interesting topics for the whole video.
+2. For each selected topic, keep or refine a maximum of 3 thought-provoking questions from its candidates.
+
+VIDEO TITLE: {title}
+
+CANDIDATE TOPICS:
+```json
+{candidates_json}
 ```
-"""
-        
-        llm_response_yaml_str = call_llm(prompt, system_message="You are an AI assistant that processes text and outputs structured data in YAML format.")
-        
-        result_topics = []
-        try:
-            # Clean up the response to get only the YAML part
-            if "```yaml" in llm_response_yaml_str:
-                yaml_content = llm_response_yaml_str.split("```yaml")[1].split("```")[0].strip()
-            elif "```" in llm_response_yaml_str: # Simpler ``` block
-                 yaml_content = llm_response_yaml_str.split("```")[1].strip()
-            else:
-                yaml_content = llm_response_yaml_str # Assume the whole response is YAML if no fences
-
-            parsed_data = yaml.safe_load(yaml_content)
-            
-            if parsed_data and "topics" in parsed_data and isinstance(parsed_data["topics"], list):
-                raw_topics = parsed_data["topics"]
-                for i, raw_topic in enumerate(raw_topics[:5]): # Max 5 topics
-                    if isinstance(raw_topic, dict) and "title" in raw_topic and "questions" in raw_topic:
-                        topic_title = str(raw_topic["title"]).strip()
-                        
-                        formatted_questions = []
-                        if isinstance(raw_topic["questions"], list):
-                            for j, q_text in enumerate(raw_topic["questions"][:3]): # Max 3 questions
-                                formatted_questions.append({
-                                    "original": str(q_text).strip(),
-                                    "rephrased": "", # To be filled later
-                                    "answer": ""      # To be filled later
-                                })
-                        
-                        if topic_title and formatted_questions: # Ensure topic has title and questions
-                            result_topics.append({
-                                "title": topic_title,
-                                "rephrased_title": "", # To be filled later
-                                "questions": formatted_questions
-                            })
-            else:
-                print(f"Warning: LLM response YAML was not in the expected format or no topics found. Response: {llm_response_yaml_str}")
 
-        except yaml.YAMLError as e:
-            print(f"Error parsing YAML from LLM: {e}")
-            print(f"LLM Raw Response was: {llm_response_yaml_str}")
-        except Exception as e:
-            print(f"An unexpected error occurred during YAML processing: {e}")
-            print(f"LLM Raw Response was: {llm_response_yaml_str}")
+Format your entire response strictly as JSON, following this structure exactly:
 
-        if not result_topics:
-            print("Warning: No topics were successfully extracted. Populating with fallback.")
+{TOPICS_JSON_FORMAT}"""
+
+    def exec(self, prep_res):
+        transcript = prep_res[0]
+        if not transcript:
+            logger.warning("Transcript is empty in ExtractTopicsAndQuestionsNode.exec, returning empty topics")
+            return []
+
+        return list(self.exec_stream(prep_res))
+
+    def exec_stream(self, prep_res):
+        """
+        Yield each topic as soon as its JSON object has fully arrived from the streaming LLM response.
+        If no topic could be extracted, the fallback topics are yielded instead.
+        """
+        transcript, title, segments = prep_res
+        logger.info("Extracting topics and questions for video '%s' (%d transcript chars)", title, len(transcript))
+        if not transcript:
+            return
+
+        transcript_tokens = estimate_tokens(transcript)
+        if transcript_tokens > self.chunk_threshold_tokens:
+            logger.info("Transcript is ~%d tokens, extracting topics map-reduce style", transcript_tokens)
+            topics = self._map_reduce_topics(transcript, title, segments, transcript_tokens)
+        else:
+            topics = self._stream_topics(self.build_prompt(transcript, title))
+
+        emitted = False
+        for topic in topics:
+            emitted = True
+            yield topic
+        if not emitted:
+            logger.warning("No topics were successfully extracted. Populating with fallback.")
             # Fallback if parsing fails or LLM output is bad
-            result_topics.append({
-                "title": "Fallback Topic: Could not parse LLM response",
-                "rephrased_title": "",
-                "questions": [
-                    {"original": "Fallback Question: What went wrong with LLM output?", "rephrased": "", "answer": ""}
-                ]
-            })
-            
-        return result_topics
+            yield from fallback_topics()
+
+    def _stream_topics(self, prompt):
+        parser = IncrementalJSONListParser("topics")
+        started = time.perf_counter()
+        emitted = 0
+
+        def completed_topics(raw_topics):
+            nonlocal emitted
+            for raw_topic in raw_topics:
+                topic = format_extracted_topic(raw_topic)
+                if topic and emitted < 5: # Max 5 topics
+                    emitted += 1
+                    if emitted == 1:
+                        logger.info("First topic ready after %.2fs", time.perf_counter() - started)
+                    yield topic
+
+        for chunk in call_llm_stream(prompt, system_message=TOPICS_SYSTEM_MESSAGE, caller=type(self).__name__,
+                                     response_schema=TOPICS_SCHEMA):
+            yield from completed_topics(parser.feed(chunk))
+        yield from completed_topics(parser.close())
+
+        if emitted == 0:
+            # The stream did not have the expected shape; try the whole response at once
+            yield from parse_topics_response(parser.text, reask=make_reask(type(self).__name__))
+
+    def split_transcript(self, transcript, segments, transcript_tokens):
+        """Transcript parts of about map_chunk_tokens each, split on segment boundaries, for the map step."""
+        chars_per_token = len(transcript) / max(1, transcript_tokens)
+        return build_chunks(segments, transcript, target_chars=int(self.map_chunk_tokens * chars_per_token))
+
+    def merge_part_results(self, part_results, part_count):
+        """Merged, ranked candidate topics from the map step; each result is a topic list or the exception of a failed part."""
+        candidates, last_error = [], None
+        for result in part_results:
+            if isinstance(result, Exception):
+                # A failed part only loses its own candidates; the node retries if every part failed
+                logger.warning("Topic extraction for one transcript part failed: %s", result)
+                last_error = result
+            else:
+                candidates.extend(result)
+        if not candidates:
+            if last_error is not None:
+                raise last_error
+            return []
+        logger.info("Map step produced %d candidate topics from %d parts", len(candidates), part_count)
+        return merge_candidate_topics(candidates)
+
+    def _map_reduce_topics(self, transcript, title, segments, transcript_tokens):
+        # Map: split on segment boundaries and extract candidate topics from every part in parallel
+        parts = self.split_transcript(transcript, segments, transcript_tokens)
+
+        def extract_part(numbered_part):
+            number, part = numbered_part
+            prompt = self.build_prompt(part["text"], title, part=(number, len(parts)))
+            try:
+                parsed = call_llm(prompt, system_message=TOPICS_SYSTEM_MESSAGE, caller=type(self).__name__,
+                                  response_schema=TOPICS_SCHEMA)
+            except StructuredOutputError as e:
+                logger.warning("Could not parse topics for transcript part %d: %s", number, e)
+                return []
+            return format_extracted_topics(parsed)
+
+        part_results = []
+        with ThreadPoolExecutor(max_workers=max(1, min(self.map_workers, len(parts)))) as pool:
+            # Each part runs in a copy of this context so its LLM usage is attributed to the current video
+            futures = [pool.submit(contextvars.copy_context().run, extract_part, numbered)
+                       for numbered in enumerate(parts, start=1)]
+            for future in futures:
+                try:
+                    part_results.append(future.result())
+                except Exception as e:
+                    part_results.append(e)
+
+        # Reduce: merge duplicates locally, then let the LLM pick the top 5 if there are more than that
+        candidates = self.merge_part_results(part_results, len(parts))
+        if len(candidates) <= 5:
+            yield from candidates
+            return
+        reduced = list(self._stream_topics(self.build_reduce_prompt(candidates, title)))
+        yield from (reduced or candidates[:5])
 
     def post(self, shared, prep_res, exec_res):
         shared["topics"] = exec_res # exec_res is the list of topics with questions
-        print(f"Node: Stored {len(shared['topics'])} topics with their initial questions.")
+        logger.info("Stored %d topics with their initial questions", len(shared["topics"]))
         return "default"
 
-class ProcessTopicNode(BatchNode):
-    """Batch process each topic for rephrasing titles, questions, and generating ELI5 answers."""
+class ProcessTopicNode(ParallelBatchNode):
+    """Batch process each topic for rephrasing titles, questions, and generating ELI5 answers.
+
+    Topics are independent LLM calls, so they run concurrently (up to max_workers at a time).
+    In a flow it consumes ExtractTopicsAndQuestionsNode's stream, processing each topic as it arrives.
+    """
+    consumes_stream = True
+    _lock_attrs = ParallelBatchNode._lock_attrs + ("_index_lock",)
+    excerpt_token_budget = 500 # Transcript context sent with each topic
+    excerpt_top_k = 6          # Candidate chunks considered per topic
+    chunk_chars = 600          # Target size of the indexed transcript chunks
+
+    def __init__(self, max_retries=3, wait=2, max_workers=5):
+        super().__init__(max_retries, wait, max_workers=max_workers)
+        self._index = None
+        self._index_lock = threading.Lock()
+
+    def should_retry(self, exc):
+        # Retries are per topic: a rate-limited topic is retried without redoing the others
+        return is_retryable_llm_error(exc)
+
+    def exec_fallback(self, prep_res_item, exc):
+        topic_item, _ = prep_res_item
+        logger.error("Processing topic '%s' failed after retries: %s. Keeping original topic.", topic_item["title"], exc)
+        return topic_item.copy()
+
     def prep(self, shared):
-        print(f"Node: Preparing to batch process {len(shared.get('topics', []))} topics.")
+        logger.debug("Preparing to batch process %d topics", len(shared.get("topics", [])))
         topics = shared.get("topics", [])
-        transcript = shared.get("video_info", {}).get("transcript", "")
-        # Returns a list of (topic_item, transcript) tuples. Each tuple will be passed to exec().
-        # We pass the full transcript for now; a more advanced version might pass relevant excerpts.
-        return [(topic, transcript) for topic in topics]
-
-    def exec(self, prep_res_item):
-        topic_item, transcript = prep_res_item # Unpack the tuple
-        
+        # Returns a list of (topic_item, transcript_excerpt) tuples. Each tuple will be passed to exec().
+        return [self.prep_item(shared, topic) for topic in topics]
+
+    def prep_item(self, shared, topic):
+        # Each topic gets the transcript chunks most relevant to its title and questions, within a token budget
+        index = self.get_transcript_index(shared.get("video_info", {}))
+        query = " ".join([topic.get("title", "")] + [q.get("original", "") for q in topic.get("questions", [])])
+        excerpt = index.excerpt(query, max_tokens=self.excerpt_token_budget, k=self.excerpt_top_k)
+        return (topic, trim_to_budget(excerpt, self.excerpt_token_budget))
+
+    def get_transcript_index(self, video_info):
+        """BM25 index over the video's transcript chunks: built once per video and cached next to the stored transcript."""
+        transcript = video_info.get("transcript", "")
+        fingerprint = transcript_fingerprint(transcript, self.chunk_chars)
+        with self._index_lock:
+            if self._index is not None and self._index.fingerprint == fingerprint:
+                return self._index
+
+            video_id = video_info.get("video_id", "")
+            store = get_default_store() if video_id and video_id != "unknown_video_id" else None
+            index = None
+            cached = store.load_index(video_id) if store is not None else None
+            if cached and cached.get("fingerprint") == fingerprint:
+                try:
+                    index = TranscriptIndex.from_dict(cached)
+                except (ValueError, KeyError) as e:
+                    logger.warning("Ignoring cached transcript index for %s: %s", video_id, e)
+            if index is None:
+                index = TranscriptIndex.build(video_info.get("segments") or [], transcript, self.chunk_chars)
+                logger.info("Built transcript index with %d chunks", len(index.chunks))
+                if store is not None:
+                    store.save_index(video_id, index.to_dict())
+            self._index = index
+            return index
+
+    def build_prompt(self, topic_item, transcript_excerpt):
         original_topic_title = topic_item['title']
         original_questions_list = [q["original"] for q in topic_item["questions"]]
 
-        print(f"Node: Batch processing topic: '{original_topic_title}'")
-
         # Construct the detailed prompt for a single LLM call per topic
         questions_str_for_prompt = "\n".join([f"- {q}" for q in original_questions_list])
+        response_example = json.dumps({
+            "rephrased_title": "Rephrased catchy topic title (approx. 10 words)",
+            "questions": [
+                {
+                    "original": question,
+                    "rephrased": f"Rephrased interesting question {i} (approx. 15 words)",
+                    "answer": f"ELI5 HTML answer for question {i} (approx. 100 words)." + (
+                        " Example: <p><b>Gravity</b> is like an invisible glue that keeps everything stuck to the Earth!</p><ol><li><b>It pulls things down:</b> That's why your toys fall!</li><li><b>It keeps us on the ground:</b> So we don't float away!</li></ol>"
+                        if i == 1 else ""),
+                }
+                for i, question in enumerate(original_questions_list, start=1)
+            ],
+        }, ensure_ascii=False, indent=2)
         
-        # For transcript excerpt, we can use a snippet or a more sophisticated selection. Using first N chars for simplicity.
-        transcript_excerpt = transcript[:1500] # Use a portion of the transcript
-
         prompt = f"""You are a content simplifier and engager for children. 
 Given a topic, a list of original questions related to it from a YouTube video, and an excerpt from the video's transcript, your task is to:
 1. Rephrase the topic title to be catchy, interesting, and short (around 10 words).
@@ -183,135 +500,198 @@ ORIGINAL QUESTIONS:
 TRANSCRIPT EXCERPT (for context, not for direct quotation unless a term needs defining):
 {transcript_excerpt}
 
-Now, provide your full response strictly in YAML format as specified below:
-
-```yaml
-rephrased_title: |
-    Rephrased catchy topic title (approx. 10 words)
-questions:
-  - original: |
-      {original_questions_list[0] if len(original_questions_list) > 0 else 'Question 1 not provided'}
-    rephrased: |
-      Rephrased interesting question 1 (approx. 15 words)
-    answer: |-
-      ELI5 HTML answer for question 1 (approx. 100 words). Example: <p><b>Gravity</b> is like an invisible glue that keeps everything stuck to the Earth!</p><ol><li><b>It pulls things down:</b> That's why your toys fall!</li><li><b>It keeps us on the ground:</b> So we don't float away!</li></ol>
-  - original: |
-      {original_questions_list[1] if len(original_questions_list) > 1 else 'Question 2 not provided'}
-    rephrased: |
-      Rephrased interesting question 2 (approx. 15 words)
-    answer: |-
-      ELI5 HTML answer for question 2 (approx. 100 words).
-  # Add more questions here if present in the input, up to the number of original questions provided.
-  # Ensure the 'original' fields exactly match the questions provided above.
-```
-"""
-        
-        llm_response_yaml_str = call_llm(prompt, system_message="You are an AI assistant that processes text and outputs structured data in YAML format following specific guidelines for content and HTML formatting.")
+Now, provide your full response strictly as JSON, following this structure exactly (one entry per original question, in the same order, with each 'original' field exactly matching the question provided above):
 
-        updated_topic_item = topic_item.copy() # Start with a copy to preserve original data if parsing fails
+{response_example}
+"""
+        return prompt
 
-        try:
-            if "```yaml" in llm_response_yaml_str:
-                yaml_content = llm_response_yaml_str.split("```yaml")[1].split("```")[0].strip()
-            elif "```" in llm_response_yaml_str:
-                 yaml_content = llm_response_yaml_str.split("```")[1].strip()
-            else:
-                yaml_content = llm_response_yaml_str
-            
-            parsed_llm_data = yaml.safe_load(yaml_content)
-
-            if parsed_llm_data and isinstance(parsed_llm_data, dict):
-                updated_topic_item["rephrased_title"] = parsed_llm_data.get("rephrased_title", original_topic_title).strip()
-                
-                llm_questions = parsed_llm_data.get("questions", [])
-                processed_questions_from_llm = []
-                
-                # Match LLM questions back to original questions if necessary, or assume order
-                # For simplicity, we'll map them by order, ensuring we don't create more than we had.
-                for i, q_data_orig in enumerate(updated_topic_item["questions"]):
-                    if i < len(llm_questions) and isinstance(llm_questions[i], dict):
-                        llm_q_item = llm_questions[i]
-                        processed_questions_from_llm.append({
-                            "original": q_data_orig["original"], # Keep original from before LLM
-                            "rephrased": str(llm_q_item.get("rephrased", q_data_orig["original"])).strip(),
-                            "answer": str(llm_q_item.get("answer", "Answer not provided by LLM.")).strip()
-                        })
-                    else:
-                        # If LLM provided fewer questions than original, keep original with no answer
-                        processed_questions_from_llm.append({
-                            "original": q_data_orig["original"],
-                            "rephrased": q_data_orig["original"], # Fallback
-                            "answer": "Answer not generated."
-                        })
-                updated_topic_item["questions"] = processed_questions_from_llm
+    def apply_response(self, topic_item, parsed_llm_data):
+        """The topic with the rephrased title, questions and answers from a response validated against PROCESSED_TOPIC_SCHEMA."""
+        original_topic_title = topic_item['title']
+        updated_topic_item = topic_item.copy()
+        updated_topic_item["rephrased_title"] = parsed_llm_data["rephrased_title"].strip() or original_topic_title
+
+        llm_questions = parsed_llm_data["questions"]
+        processed_questions_from_llm = []
+
+        # Match LLM questions back to original questions if necessary, or assume order
+        # For simplicity, we'll map them by order, ensuring we don't create more than we had.
+        for i, q_data_orig in enumerate(updated_topic_item["questions"]):
+            if i < len(llm_questions):
+                llm_q_item = llm_questions[i]
+                processed_questions_from_llm.append({
+                    "original": q_data_orig["original"], # Keep original from before LLM
+                    "rephrased": llm_q_item["rephrased"].strip() or q_data_orig["original"],
+                    "answer": llm_q_item["answer"].strip() or "Answer not provided by LLM."
+                })
             else:
-                print(f"Warning: LLM response for topic '{original_topic_title}' was not in expected dict format or empty. LLM Raw: {llm_response_yaml_str}")
-                # Keep original data if parsing fails for this item
+                # If LLM provided fewer questions than original, keep original with no answer
+                processed_questions_from_llm.append({
+                    "original": q_data_orig["original"],
+                    "rephrased": q_data_orig["original"], # Fallback
+                    "answer": "Answer not generated."
+                })
+        updated_topic_item["questions"] = processed_questions_from_llm
 
-        except yaml.YAMLError as e:
-            print(f"Error parsing YAML for topic '{original_topic_title}': {e}. LLM Raw: {llm_response_yaml_str}")
-        except Exception as e:
-            print(f"An unexpected error occurred during YAML processing for topic '{original_topic_title}': {e}. LLM Raw: {llm_response_yaml_str}")
-            
-        return updated_topic_item # Return the (potentially) modified topic_item
+        return updated_topic_item
+
+    def exec(self, prep_res_item):
+        topic_item, transcript_excerpt = prep_res_item # Unpack the tuple
+        logger.debug("Batch processing topic: '%s'", topic_item['title'])
+        prompt = self.build_prompt(topic_item, transcript_excerpt)
+
+        try:
+            parsed_llm_data = call_llm(prompt, system_message=PROCESS_TOPIC_SYSTEM_MESSAGE,
+                                       caller=type(self).__name__, response_schema=PROCESSED_TOPIC_SCHEMA)
+        except StructuredOutputError as e:
+            # Keep original data if parsing fails for this item
+            logger.warning("Could not parse LLM response for topic '%s': %s. Raw response: %s", topic_item['title'], e, truncated(e.text))
+            return topic_item.copy()
+        return self.apply_response(topic_item, parsed_llm_data) # Return the modified topic_item
 
     def post(self, shared, prep_res, exec_res_list):
         # exec_res_list contains the processed topic_items from each exec() call
         shared["topics"] = exec_res_list # Update shared store with fully processed topics
-        print(f"Node: Finished batch processing. Stored {len(shared['topics'])} fully processed topics.")
+        logger.info("Finished batch processing. Stored %d fully processed topics", len(shared["topics"]))
         return "default"
 
 
 class GenerateHTMLNode(Node):
-    """Create final HTML output."""
+    """Create final HTML output.
+
+    With keep_html_output=False (batch mode) the report is streamed straight to its file and
+    never held in memory as a whole; shared["html_output"] is then left empty.
+    The report's inputs are saved next to it as JSON, so rerender.py can rebuild it without the LLM.
+    Rendering and writing happen in exec, so executor="process" moves them off the GIL for big batches.
+    """
+    def __init__(self, max_retries=1, wait=0, keep_html_output=True, executor="inline"):
+        super().__init__(max_retries, wait)
+        self.keep_html_output = keep_html_output
+        self.executor = executor
+
     def prep(self, shared):
-        print("Node: Preparing to generate HTML report.")
-        return shared.get("video_info", {}), shared.get("topics", [])
+        logger.debug("Preparing to generate HTML report")
+        video_info = shared.get("video_info", {})
+        output_path = get_report_path(video_info.get("title", "unknown_video"))
+        # The report doesn't use the transcript; leaving it out keeps the prep result cheap to send to a worker process
+        video_info = {k: v for k, v in video_info.items() if k not in ("transcript", "segments")}
+        return video_info, shared.get("topics", []), output_path
 
     def exec(self, prep_res):
-        video_info, topics_data = prep_res
-        print(f"Node: Generating HTML with video title '{video_info.get('title', 'N/A')}' and {len(topics_data)} topics.")
+        video_info, topics_data, output_path = prep_res
+        logger.debug("Generating HTML with video title '%s' and %d topics", video_info.get("title", "N/A"), len(topics_data))
         if not video_info:
-            print("Warning: Video info is missing for HTML generation.")
+            logger.warning("Video info is missing for HTML generation")
             video_info = {"title": "Error: Video Info Missing", "thumbnail_url": ""}
-        return generate_html_report(video_info, topics_data)
 
-    def post(self, shared, prep_res, exec_res):
-        shared["html_output"] = exec_res # exec_res is the HTML string
-        
         # 确保examples目录存在
-        examples_dir = os.path.join(os.getcwd(), "examples")
+        examples_dir = os.path.dirname(output_path)
         if not os.path.exists(examples_dir):
-            os.makedirs(examples_dir)
-            print(f"Created directory: {examples_dir}")
-        
-        # 从视频标题生成安全的文件名
-        video_title = shared.get("video_info", {}).get("title", "unknown_video")
-        
-        # 简单的文件名清理函数
-        def clean_filename(filename):
-            # 移除非法字符并将空格替换为下划线
-            return re.sub(r'[^\w\-_\. ]', '', filename).replace(' ', '_')[:200]
-        
-        safe_filename = clean_filename(video_title)
-        
-        # 如果文件名为空，使用默认名称
-        if not safe_filename:
-            safe_filename = "youtube_eli5_summary"
-        
-        # 添加.html扩展名
-        html_filename = f"{safe_filename}.html"
-        output_path = os.path.join(examples_dir, html_filename)
-        
+            os.makedirs(examples_dir, exist_ok=True) # 批量模式下可能有多个线程同时创建
+            logger.info("Created directory: %s", examples_dir)
+
+        save_report_artifact(video_info, topics_data, artifact_path_for(output_path))
+
         # 保存HTML文件
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(exec_res)
-        
-        print(f"Node: Stored HTML output (length: {len(shared['html_output'])} chars).")
-        print(f"Node: Saved HTML report to {output_path}")
-        
+        html = None
+        if self.keep_html_output:
+            html = generate_html_report(video_info, topics_data)
+            with open(output_path, "w", encoding="utf-8") as f:
+                f.write(html)
+        else:
+            write_html_report(video_info, topics_data, output_path)
+        return html, os.path.getsize(output_path)
+
+    def post(self, shared, prep_res, exec_res):
+        html, report_size = exec_res
+        if html is not None:
+            shared["html_output"] = html
+        logger.info("Saved HTML report (%d bytes) to %s", report_size, prep_res[2])
         return "default"
 
+# Async variants for create_youtube_eli5_async_flow: the LLM calls are awaited on the event loop
+# instead of holding a thread each, so one loop can drive many videos at once.
+
+class AsyncProcessYouTubeURLNode(AsyncNode, ProcessYouTubeURLNode):
+    """ProcessYouTubeURLNode for async flows; the blocking fetch runs in a worker thread."""
+    async def exec_async(self, prep_res):
+        return await asyncio.to_thread(self.exec, prep_res)
+
+class AsyncExtractTopicsAndQuestionsNode(AsyncNode, ExtractTopicsAndQuestionsNode):
+    """ExtractTopicsAndQuestionsNode for async flows.
+
+    Topics come from one JSON response instead of a stream (async flows don't pipeline);
+    the parts of a long transcript are extracted concurrently on the loop.
+    """
+    async def exec_async(self, prep_res):
+        transcript, title, segments = prep_res
+        logger.info("Extracting topics and questions for video '%s' (%d transcript chars)", title, len(transcript))
+        if not transcript:
+            logger.warning("Transcript is empty in AsyncExtractTopicsAndQuestionsNode.exec_async, returning empty topics")
+            return []
+
+        transcript_tokens = estimate_tokens(transcript)
+        if transcript_tokens > self.chunk_threshold_tokens:
+            logger.info("Transcript is ~%d tokens, extracting topics map-reduce style", transcript_tokens)
+            result_topics = await self._map_reduce_topics_async(transcript, title, segments, transcript_tokens)
+        else:
+            result_topics = await self._extract_topics_async(self.build_prompt(transcript, title))
+
+        if not result_topics:
+            logger.warning("No topics were successfully extracted. Populating with fallback.")
+            result_topics = fallback_topics()
+        return result_topics
+
+    async def _extract_topics_async(self, prompt, part_number=None):
+        try:
+            parsed = await call_llm_async(prompt, system_message=TOPICS_SYSTEM_MESSAGE, caller=type(self).__name__,
+                                          response_schema=TOPICS_SCHEMA)
+        except StructuredOutputError as e:
+            if part_number is None:
+                logger.warning("Could not parse topics from LLM response: %s. Raw response: %s", e, truncated(e.text))
+            else:
+                logger.warning("Could not parse topics for transcript part %d: %s", part_number, e)
+            return []
+        return format_extracted_topics(parsed)
+
+    async def _map_reduce_topics_async(self, transcript, title, segments, transcript_tokens):
+        parts = self.split_transcript(transcript, segments, transcript_tokens)
+        limit = asyncio.Semaphore(self.map_workers)
+
+        async def extract_part(number, part):
+            async with limit:
+                return await self._extract_topics_async(
+                    self.build_prompt(part["text"], title, part=(number, len(parts))), part_number=number)
+
+        part_results = await asyncio.gather(*(extract_part(number, part) for number, part in enumerate(parts, start=1)),
+                                            return_exceptions=True)
+        candidates = self.merge_part_results(part_results, len(parts))
+        if len(candidates) <= 5:
+            return candidates
+        reduced = await self._extract_topics_async(self.build_reduce_prompt(candidates, title))
+        return reduced or candidates[:5]
+
+class AsyncProcessTopicNode(AsyncParallelBatchNode, ProcessTopicNode):
+    """ProcessTopicNode for async flows: up to max_workers topics are awaited concurrently on the loop."""
+    def __init__(self, max_retries=3, wait=2, max_workers=5):
+        super().__init__(max_retries, wait, max_workers=max_workers)
+
+    async def prep_async(self, shared):
+        # Building or loading the transcript index is blocking work
+        return await asyncio.to_thread(self.prep, shared)
+
+    async def exec_async(self, prep_res_item):
+        topic_item, transcript_excerpt = prep_res_item
+        logger.debug("Batch processing topic: '%s'", topic_item['title'])
+        try:
+            parsed_llm_data = await call_llm_async(self.build_prompt(topic_item, transcript_excerpt), system_message=PROCESS_TOPIC_SYSTEM_MESSAGE,
+                                                   caller=type(self).__name__, response_schema=PROCESSED_TOPIC_SCHEMA)
+        except StructuredOutputError as e:
+            logger.warning("Could not parse LLM response for topic '%s': %s. Raw response: %s", topic_item['title'], e, truncated(e.text))
+            return topic_item.copy()
+        return self.apply_response(topic_item, parsed_llm_data)
+
 # According to design.md, Content Processing is a subgraph containing ProcessTopic.
 # In PocketFlow, this can be represented by a Flow that is then run by a BatchFlow or as a BatchNode directly.
 # For simplicity with the current design, ProcessTopicNode is a BatchNode.
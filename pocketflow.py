@@ -1,10 +1,144 @@
+import asyncio
+import atexit
+import contextvars
+import copy
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import threading
+import time
+from collections.abc import MutableMapping
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+
+logger = logging.getLogger("pocketflow")
+
+class Instrument:
+    """Receives timing spans from nodes and flows. Register one with add_instrument().
+
+    A span is a dict: {"node", "phase", "start" (epoch seconds), "wall", "cpu" (seconds),
+    "thread", "error" (None or "Type: message")} plus phase-specific fields such as "attempt".
+    Phases: "flow", "prep", "exec" (one span per attempt), "post", "item" (one BatchNode item,
+    including its retries), "prep_item" and "exec_stream" (pipelined stages).
+    Retries are reported through event() as a "retry" span without timing.
+    Callbacks may run on worker threads concurrently, so implementations must be thread-safe.
+    """
+    def span_end(self, span):
+        pass
+
+    def event(self, span):
+        pass
+
+_instruments = () # Replaced, never mutated, so readers can iterate it without a lock
+_instruments_lock = threading.Lock()
+
+def add_instrument(instrument):
+    global _instruments
+    with _instruments_lock:
+        _instruments = _instruments + (instrument,)
+
+def remove_instrument(instrument):
+    global _instruments
+    with _instruments_lock:
+        _instruments = tuple(i for i in _instruments if i is not instrument)
+
+@contextmanager
+def _span(node, phase, **fields):
+    # Times the enclosed block for every registered instrument; a no-op when there are none
+    instruments = _instruments
+    if not instruments:
+        yield
+        return
+    span = {"node": node.__class__.__name__, "phase": phase, "start": time.time(),
+            "thread": threading.current_thread().name, **fields}
+    wall_start, cpu_start = time.perf_counter(), time.thread_time()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        span["wall"] = time.perf_counter() - wall_start
+        span["cpu"] = time.thread_time() - cpu_start
+        span["error"] = f"{error.__class__.__name__}: {error}" if error is not None else None
+        for instrument in instruments:
+            instrument.span_end(span)
+
+def _event(node, phase, **fields):
+    instruments = _instruments
+    if instruments:
+        span = {"node": node.__class__.__name__, "phase": phase, "start": time.time(),
+                "thread": threading.current_thread().name, **fields}
+        for instrument in instruments:
+            instrument.event(span)
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+def get_executor(kind):
+    """
+    The process-wide pool for nodes with executor="thread" or "process", created on first use and
+    reused by every node, flow and run. Sizes come from FLOW_THREAD_WORKERS (default 32) and
+    FLOW_PROCESS_WORKERS (default: number of CPUs). Worker processes are spawned, not forked,
+    so they are safe to start from a multi-threaded batch.
+    """
+    with _executors_lock:
+        pool = _executors.get(kind)
+        if pool is None:
+            if kind == "thread":
+                pool = ThreadPoolExecutor(max_workers=int(os.getenv("FLOW_THREAD_WORKERS", "32")), thread_name_prefix="flow-exec")
+            elif kind == "process":
+                pool = ProcessPoolExecutor(max_workers=int(os.getenv("FLOW_PROCESS_WORKERS", "0")) or os.cpu_count(),
+                                           mp_context=multiprocessing.get_context("spawn"))
+            else:
+                raise ValueError(f"executor must be 'inline', 'thread' or 'process', not {kind!r}")
+            _executors[kind] = pool
+        return pool
+
+def shutdown_executors(wait=True):
+    """Shut down the shared pools; get_executor creates new ones if they are needed again."""
+    with _executors_lock:
+        pools = list(_executors.values())
+        _executors.clear()
+    for pool in pools:
+        pool.shutdown(wait=wait)
+
+atexit.register(shutdown_executors)
+
+def _detached(node):
+    # Copy of a node without its successors, so only the node itself is pickled for a worker process
+    clone = copy.copy(node)
+    clone._transitions = {}
+    return clone
+
+def _exec_in_process(node, prep_res):
+    # Runs in a worker process: exec with retries, returning (result, stats counted here, exception)
+    node.stats = dict.fromkeys(node.stats, 0)
+    try:
+        return node._exec_attempts(prep_res), node.stats, None
+    except Exception as e:
+        return None, node.stats, e
+
 class Node:
+    max_wait = 60 # Upper bound (seconds) for a single backoff delay
+    _lock_attrs = ("_stats_lock",) # Not picklable: dropped by __getstate__ and recreated on unpickling
+    # Where exec runs: "inline" in the calling thread, or on the shared "thread" or "process" pool (get_executor).
+    # "process" suits CPU-bound exec; the node and its prep result (or batch items) must then be picklable.
+    # prep and post always run inline, since they use the shared store.
+    executor = "inline"
+
     def __init__(self, max_retries=1, wait=0):
-        self.max_retries = max_retries
-        self.wait = wait
+        self.max_retries = max_retries # Total attempts per exec, including the first one
+        self.wait = wait # Base backoff delay in seconds, doubled after every failed attempt
         self.cur_retry = 0
         self._transitions = {}
         self.params = {}
+        self.stats = {"retries": 0, "fallbacks": 0}
+        self._stats_lock = threading.Lock()
 
     def prep(self, shared):
         return None
@@ -18,17 +152,92 @@ class Node:
     def exec_fallback(self, prep_res, exc):
         raise exc
 
-    def run(self, shared_store):
-        # Simplified run logic for placeholder
-        prep_result = self.prep(shared_store)
+    def should_retry(self, exc):
+        # Retry-on predicate: override to retry only transient errors (e.g. rate limits)
+        return True
+
+    def retry_delay(self, attempt):
+        # Exponential backoff with jitter: a random delay in [cap/2, cap],
+        # where cap = wait * 2**attempt, bounded by max_wait
+        if not self.wait:
+            return 0
+        cap = min(self.max_wait, self.wait * (2 ** attempt))
+        return random.uniform(cap / 2, cap)
+
+    def on_retry(self, prep_res, exc, attempt, delay):
+        # Hook called before sleeping for a retry; attempt is the number of failed attempts so far
+        logger.warning("%s: attempt %d failed (%s: %s), retrying in %.1fs",
+                       self.__class__.__name__, attempt, exc.__class__.__name__, exc, delay)
+
+    def _record(self, stat, amount=1):
+        with self._stats_lock:
+            self.stats[stat] = self.stats.get(stat, 0) + amount
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in self._lock_attrs:
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for name in self._lock_attrs:
+            setattr(self, name, threading.Lock())
+
+    def _exec(self, prep_res):
+        # exec with retries; BatchNode calls this once per item so each item retries independently
         try:
-            exec_result = self.exec(prep_result)
+            return self._exec_attempts(prep_res)
         except Exception as e:
-            # Simplified retry/fallback, real PocketFlow is more complex
-            # print(f"Node {self.__class__.__name__} exec error: {e}")
-            exec_result = self.exec_fallback(prep_result, e)
-        
-        action = self.post(shared_store, prep_result, exec_result)
+            self._record("fallbacks")
+            return self.exec_fallback(prep_res, e)
+
+    def _dispatch_exec(self, prep_res):
+        # _exec on the node's executor
+        if self.executor == "inline":
+            return self._exec(prep_res)
+        if self.executor == "thread":
+            return get_executor("thread").submit(contextvars.copy_context().run, self._exec, prep_res).result()
+        try:
+            return self._exec_remote(get_executor("process").submit(_exec_in_process, _detached(self), prep_res))
+        except Exception as e:
+            self._record("fallbacks")
+            return self.exec_fallback(prep_res, e)
+
+    def _exec_remote(self, future):
+        # Result of _exec_in_process; the retries counted in the worker are added to this node's stats
+        with _span(self, "exec", executor="process"):
+            result, stats, exc = future.result()
+        for stat, amount in stats.items():
+            if amount:
+                self._record(stat, amount)
+        if exc is not None:
+            raise exc
+        return result
+
+    def _exec_attempts(self, prep_res):
+        # Retry loop without the fallback: raises the last exception once retries are exhausted
+        for attempt in range(max(1, self.max_retries)):
+            try:
+                with _span(self, "exec", attempt=attempt + 1):
+                    return self.exec(prep_res)
+            except Exception as e:
+                if attempt >= self.max_retries - 1 or not self.should_retry(e):
+                    raise
+                delay = self.retry_delay(attempt)
+                self._record("retries")
+                _event(self, "retry", attempt=attempt + 1, delay=delay, error=f"{e.__class__.__name__}: {e}")
+                self.on_retry(prep_res, e, attempt + 1, delay)
+                time.sleep(delay)
+
+    def run(self, shared_store):
+        # Simplified run logic for placeholder
+        with _span(self, "prep"):
+            prep_result = self.prep(shared_store)
+        exec_result = self._dispatch_exec(prep_result)
+
+        with _span(self, "post"):
+            action = self.post(shared_store, prep_result, exec_result)
         return action if action is not None else "default"
 
     def __rshift__(self, other_node):
@@ -52,43 +261,291 @@ class Node:
         self.params.update(params_dict)
 
 class BatchNode(Node):
+    consumes_stream = False # Set to True (and implement prep_item) to consume a preceding StreamNode's items as they arrive
+
     def exec(self, item): # exec for BatchNode processes one item
         raise NotImplementedError
 
+    def prep_item(self, shared, item):
+        # Maps one item streamed by an upstream StreamNode to the exec() input that prep() would have produced for it
+        return item
+
+    def _exec_item(self, item, on_done=None):
+        # Runs exec for a single item with its own retries, falling back per item on failure.
+        # on_done(item, result) is called for items that succeeded, i.e. did not need the fallback.
+        with _span(self, "item"):
+            try:
+                result = self._exec_attempts(item)
+            except Exception as e:
+                self._record("fallbacks")
+                return self.exec_fallback(item, e)
+            if on_done is not None:
+                on_done(item, result)
+            return result
+
+    def _exec_items(self, items, on_done=None):
+        # Sequential execution; results are returned in input order
+        if self.executor != "inline":
+            return self._exec_items_pooled(list(items), on_done)
+        return [self._exec_item(item, on_done) for item in items]
+
+    def _exec_items_pooled(self, items, on_done=None):
+        # Items run on the shared pool, at most max_workers at a time (one for a plain BatchNode),
+        # since the pool is shared by every node; results are collected in input order
+        slots = threading.BoundedSemaphore(max(1, min(getattr(self, "max_workers", 1) or 1, len(items) or 1)))
+
+        def submit(pool, fn, *args):
+            slots.acquire()
+            future = pool.submit(fn, *args)
+            future.add_done_callback(lambda _: slots.release())
+            return future
+
+        if self.executor == "thread":
+            pool = get_executor("thread")
+            futures = [submit(pool, contextvars.copy_context().run, self._exec_item, item, on_done) for item in items]
+            return [future.result() for future in futures]
+        detached = _detached(self)
+        pool = get_executor("process")
+        futures = [submit(pool, _exec_in_process, detached, item) for item in items]
+        results = []
+        for item, future in zip(items, futures):
+            with _span(self, "item"):
+                try:
+                    result = self._exec_remote(future)
+                except Exception as e:
+                    self._record("fallbacks")
+                    results.append(self.exec_fallback(item, e))
+                    continue
+            if on_done is not None:
+                on_done(item, result)
+            results.append(result)
+        return results
+
     # Actual batch execution would be handled by the Flow or a specialized run method
     # For this placeholder, the Flow will need to iterate if it encounters a BatchNode
     # Or, we can adjust the 'run' method slightly if a batch node is run directly (less ideal)
     def run(self, shared_store):
         # Simplified run for BatchNode
-        iterable_prep_res = self.prep(shared_store)
-        exec_results_list = []
+        with _span(self, "prep"):
+            iterable_prep_res = self.prep(shared_store)
         if iterable_prep_res is None:
             iterable_prep_res = []
-            
-        for item in iterable_prep_res:
-            try:
-                # In a real BatchNode, exec would be called per item by the framework
-                exec_result_item = super().exec(item) # Call the single-item exec
-            except Exception as e:
-                # print(f"BatchNode {self.__class__.__name__} exec error for item {item}: {e}")
-                exec_result_item = self.exec_fallback(item, e)
-            exec_results_list.append(exec_result_item)
-        
+
+        exec_results_list = self._exec_items(iterable_prep_res)
+
         # prep_res for post in BatchNode is the original iterable output of prep()
-        action = self.post(shared_store, iterable_prep_res, exec_results_list)
+        with _span(self, "post"):
+            action = self.post(shared_store, iterable_prep_res, exec_results_list)
         return action if action is not None else "default"
 
+class ParallelBatchNode(BatchNode):
+    """BatchNode that fans exec() calls out over a thread pool.
+
+    At most `max_workers` items are in flight at once, also with executor="thread"
+    or "process", where they run on the shared pool. Results are collected
+    in input order, so post() sees exactly what a sequential BatchNode would.
+    Meant for I/O-bound exec() calls such as LLM requests. Each item runs in a
+    copy of the caller's contextvars context, so context-scoped state (e.g. usage
+    accounting) follows it onto the worker thread.
+    """
+    def __init__(self, max_retries=1, wait=0, max_workers=4):
+        super().__init__(max_retries, wait)
+        self.max_workers = max_workers
+
+    def _exec_items(self, items, on_done=None):
+        items = list(items)
+        if self.executor != "inline" or len(items) <= 1 or self.max_workers <= 1:
+            return super()._exec_items(items, on_done)
+        workers = min(self.max_workers, len(items))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=self.__class__.__name__) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, self._exec_item, item, on_done) for item in items]
+            # Results are collected in submission order regardless of completion order
+            return [future.result() for future in futures]
+
+class StreamNode(Node):
+    """Producer node whose exec_stream() yields its result items one at a time.
+
+    exec() simply collects the stream. When a StreamNode's default successor is a
+    BatchNode with consumes_stream = True (and executor="inline"), Flow pipelines the
+    two: each item is handed to the consumer (via its prep_item) as soon as it is yielded,
+    with at most `queue_size` items waiting or in flight, and the consumer's results are
+    collected in item order for its post(). A stream that ends without items is an empty
+    result. If the stream raises, a retryable error (should_retry) reruns the producer
+    through exec() with its retries; any other error goes to exec_fallback.
+    """
+    queue_size = 8
+
+    def exec_stream(self, prep_res):
+        raise NotImplementedError
+
+    def exec(self, prep_res):
+        return list(self.exec_stream(prep_res))
+
+def _item_key(item):
+    # Identifies a batch item by its content, so a saved result still matches after upstream nodes re-run
+    return hashlib.sha1(json.dumps(item, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
 class Flow(Node): # A Flow can also be a Node for nesting
+    _lock_attrs = Node._lock_attrs + ("_checkpoint_lock",)
+
     def __init__(self, start_node, max_retries=1, wait=0):
         super().__init__(max_retries, wait)
         self.start_node = start_node
         self.current_node = None
+        self.checkpointer = None
+        self.resume = False
+        self._checkpoint = None
+        self._checkpoint_lock = threading.Lock()
+
+    def enable_checkpoints(self, checkpointer, resume=False):
+        """Save `shared` after every node and every successful batch item.
+
+        `checkpointer` has load() -> state or None, save(state) and clear() (see utils/checkpoint.py);
+        the state is JSON-compatible. With resume=True, run() restores `shared` from the last
+        checkpoint, continues at the first node that had not completed and skips batch items
+        whose results were saved. The checkpoint is cleared once the flow finishes.
+        """
+        self.checkpointer = checkpointer
+        self.resume = resume
+
+    def node_ids(self):
+        """Deterministic ids ("<index>.<class name>", breadth-first from start_node) for every reachable node."""
+        ids = {}
+        pending = [self.start_node]
+        while pending:
+            node = pending.pop(0)
+            if node is None or id(node) in ids:
+                continue
+            ids[id(node)] = f"{len(ids)}.{node.__class__.__name__}"
+            pending.extend(node._transitions[action] for action in sorted(node._transitions))
+        return ids
 
     def run(self, shared_store):
+        with _span(self, "flow"):
+            return self._run_flow(shared_store)
+
+    def _start_checkpoint(self, shared_store):
+        # Sets up checkpoint state for this run and, when resuming, restores shared and the node to continue at
+        if self.checkpointer is None:
+            self._checkpoint = None
+            return
+        ids = self.node_ids()
+        nodes_by_id = {}
+        pending = [self.start_node]
+        while pending:
+            node = pending.pop()
+            if node is not None and ids[id(node)] not in nodes_by_id:
+                nodes_by_id[ids[id(node)]] = node
+                pending.extend(node._transitions.values())
+
+        state = self.checkpointer.load() if self.resume else None
+        items = {}
+        if state and (state.get("next") is None or state.get("next") in nodes_by_id):
+            shared_store.clear()
+            shared_store.update(state.get("shared", {}))
+            self.current_node = nodes_by_id.get(state.get("next"))
+            items = state.get("items", {})
+            logger.info("Resuming flow %s at %s (%d saved items)", self.__class__.__name__, state.get("next"),
+                        sum(len(saved) for saved in items.values()))
+        elif state:
+            logger.warning("Ignoring checkpoint that does not match flow %s", self.__class__.__name__)
+        # Item saves before the first node boundary must not drop shared (e.g. when a resumed run crashes again)
+        snapshot = json.loads(json.dumps(shared_store, default=str))
+        self._checkpoint = {"ids": ids, "state": {"version": 1, "next": ids.get(id(self.current_node)),
+                                                  "shared": snapshot, "items": items}}
+
+    def _save_checkpoint(self, shared_store, next_node):
+        # Called between nodes, when no node is touching shared; batch results of finished nodes are dropped.
+        # A finished flow clears its checkpoint instead, so there is nothing to save for the end.
+        if self._checkpoint is None or next_node is None:
+            return
+        snapshot = json.loads(json.dumps(shared_store, default=str))
+        next_id = self._checkpoint["ids"].get(id(next_node))
+        with self._checkpoint_lock:
+            state = self._checkpoint["state"]
+            state["next"] = next_id
+            state["shared"] = snapshot
+            state["items"] = {node_id: saved for node_id, saved in state["items"].items() if node_id == next_id}
+            self.checkpointer.save(state)
+
+    def _saved_items(self, node):
+        if self._checkpoint is None:
+            return {}
+        return self._checkpoint["state"]["items"].get(self._checkpoint["ids"][id(node)], {})
+
+    def _item_saver(self, node):
+        # on_done callback for BatchNode items; runs on worker threads
+        if self._checkpoint is None:
+            return None
+        node_id = self._checkpoint["ids"][id(node)]
+
+        def save_item(item, result):
+            with self._checkpoint_lock:
+                state = self._checkpoint["state"]
+                state["items"].setdefault(node_id, {})[_item_key(item)] = result
+                self.checkpointer.save(state)
+        return save_item
+
+    def _pending_items(self, node, items):
+        # Splits a BatchNode's items into those still to run and the results saved by a previous run of this flow
+        saved = self._saved_items(node)
+        keys = [_item_key(item) for item in items] if saved else [None] * len(items)
+        pending = [item for item, key in zip(items, keys) if key not in saved]
+        if len(pending) < len(items):
+            logger.info("%s: reusing %d checkpointed item results", node.__class__.__name__, len(items) - len(pending))
+        return keys, saved, pending
+
+    def _exec_batch(self, node, items):
+        # Runs a BatchNode's items, reusing results saved by a previous run of this flow
+        keys, saved, pending = self._pending_items(node, list(items))
+        fresh = iter(node._exec_items(pending, self._item_saver(node)))
+        return [saved[key] if key in saved else next(fresh) for key in keys]
+
+    def _merge_params(self, node):
+        # Merge flow params into the node's params (simplified)
+        # In real PocketFlow, param inheritance is more structured
+        merged_params = self.params.copy()
+        merged_params.update(node.params)
+        node.set_params(merged_params)
+
+    def _run_node(self, node, shared_store):
+        # Runs one node that is not part of a pipelined stage and returns its action
+        if isinstance(node, AsyncNode):
+            return node.run(shared_store) # Runs it on its own event loop
+        if isinstance(node, BatchFlow):
+            # BatchFlow.run() itself will handle iterating its sub-flow
+            return node.run(shared_store) # BatchFlow has its own run
+        if isinstance(node, BatchNode):
+            # This is a simplified way a Flow might run a BatchNode
+            # A real framework would abstract this better
+            with _span(node, "prep"):
+                iterable_prep_res = node.prep(shared_store)
+            if iterable_prep_res is None: iterable_prep_res = []
+
+            # For BatchNode, item_data might be the data itself or a dict containing params
+            # Based on design.md's ProcessTopic, it seems `prep` returns a list of topics (data items).
+            # Here, we assume `exec` on BatchNode takes the item directly.
+            # If item-specific params were needed for exec, prep would return list of dicts.
+            # _exec_items lets ParallelBatchNode run the items concurrently.
+            exec_results_list = self._exec_batch(node, iterable_prep_res)
+
+            with _span(node, "post"):
+                return node.post(shared_store, iterable_prep_res, exec_results_list)
+        # Regular Node or nested Flow (which is also a Node)
+        return node.run(shared_store)
+
+    def _finish_flow(self, loop_count, max_loops):
+        if loop_count >= max_loops:
+            logger.warning("Flow: reached max loop count (%d), terminating flow to prevent an infinite loop", max_loops)
+        elif self._checkpoint is not None:
+            self.checkpointer.clear() # Finished: nothing left to resume
+
+    def _run_flow(self, shared_store):
         # This is a very simplified run method for a Flow
-        print(f"--- Running Flow: {self.__class__.__name__} ---")
+        logger.info("Running flow %s", self.__class__.__name__)
         self.current_node = self.start_node
         final_action = "default" # Default action if the flow completes
+        self._start_checkpoint(shared_store)
 
         # Flow-level prep (if any)
         flow_prep_res = super().prep(shared_store)
@@ -97,65 +554,144 @@ class Flow(Node): # A Flow can also be a Node for nesting
         max_loops = 20 
 
         while self.current_node and loop_count < max_loops:
-            print(f"  Flow: Executing node {self.current_node.__class__.__name__} with params {self.current_node.params}")
-            
-            # Merge flow params into current node params (simplified)
-            # In real PocketFlow, param inheritance is more structured
-            merged_params = self.params.copy()
-            merged_params.update(self.current_node.params)
-            self.current_node.set_params(merged_params)
-
-            # Special handling for BatchNode within a Flow
-            if isinstance(self.current_node, BatchFlow):
-                # BatchFlow.run() itself will handle iterating its sub-flow
-                action = self.current_node.run(shared_store) # BatchFlow has its own run
-            elif isinstance(self.current_node, BatchNode):
-                # This is a simplified way a Flow might run a BatchNode
-                # A real framework would abstract this better
-                iterable_prep_res = self.current_node.prep(shared_store)
-                exec_results_list = []
-                if iterable_prep_res is None: iterable_prep_res = []
-                
-                item_params_base = self.current_node.params.copy()
-
-                for idx, item_data in enumerate(iterable_prep_res):
-                    # For BatchNode, item_data might be the data itself or a dict containing params
-                    # Based on design.md's ProcessTopic, it seems `prep` returns a list of topics (data items).
-                    # The params for each `exec` call on a BatchNode item are typically derived or passed.
-                    # Here, we assume `exec` on BatchNode takes the item directly.
-                    # If item-specific params were needed for exec, prep would return list of dicts.
-                    
-                    # print(f"    BatchNode item {idx}: {item_data}")
-                    try:
-                        # exec method of BatchNode is defined to take a single item
-                        exec_result_item = self.current_node.exec(item_data) 
-                    except Exception as e:
-                        exec_result_item = self.current_node.exec_fallback(item_data, e)
-                    exec_results_list.append(exec_result_item)
-                
-                action = self.current_node.post(shared_store, iterable_prep_res, exec_results_list)
-
-            else: # Regular Node or nested Flow (which is also a Node)
-                action = self.current_node.run(shared_store)
-            
+            logger.info("Flow: executing node %s", self.current_node.__class__.__name__)
+            self._merge_params(self.current_node)
+
+            consumer = self._stream_consumer(self.current_node)
+            if consumer is not None:
+                # Producer and consumer run as one pipelined stage; run_pipelined picks the node after them
+                self._merge_params(consumer)
+                action, next_node = self._run_pipelined(self.current_node, consumer, shared_store)
+            else:
+                action = self._run_node(self.current_node, shared_store)
+                next_node = self.current_node._transitions.get(action)
+
             final_action = action # Store last action
-            self.current_node = self.current_node._transitions.get(action)
+            self.current_node = next_node
+            self._save_checkpoint(shared_store, self.current_node)
             if not self.current_node:
-                print(f"  Flow: Action \'{action}\' leads to no next node. Flow ends.")
+                logger.debug("Flow: action '%s' leads to no next node, flow ends", action)
             loop_count +=1
-        if loop_count >= max_loops:
-            print(f"  Flow: Reached max loop count ({max_loops}). Terminating flow to prevent infinite loop.")
+        self._finish_flow(loop_count, max_loops)
         
         # Flow-level post (if any)
         # exec_res for a Flow's post method is typically None or a collected result, passing None for simplicity
         flow_final_action = super().post(shared_store, flow_prep_res, None) 
-        print(f"--- Flow {self.__class__.__name__} finished ---")
+        logger.info("Flow %s finished", self.__class__.__name__)
         return flow_final_action if flow_final_action != "default" else final_action
 
+    def _stream_consumer(self, node):
+        # The BatchNode that can consume `node`'s items while it is still producing them, if any
+        if not isinstance(node, StreamNode) or isinstance(node, AsyncNode):
+            return None
+        successor = node._transitions.get("default")
+        if not (isinstance(successor, BatchNode) and successor.consumes_stream):
+            return None
+        if successor.executor != "inline":
+            # The pipelined stage runs items on its own threads; the consumer's executor is honored by running it on its own
+            logger.info("Flow: not pipelining %s -> %s (executor=%r)", node.__class__.__name__,
+                        successor.__class__.__name__, successor.executor)
+            return None
+        return successor
+
+    def _run_pipelined(self, producer, consumer, shared_store):
+        # Runs producer and consumer concurrently; end-to-end time approaches max(stage) instead of their sum.
+        # Returns (action, next_node) for the flow loop.
+        logger.info("Flow: pipelining %s -> %s", producer.__class__.__name__, consumer.__class__.__name__)
+        with _span(producer, "prep"):
+            prep_res = producer.prep(shared_store)
+        workers = max(1, getattr(consumer, "max_workers", 1))
+        # Backpressure: the producer blocks once queue_size items are waiting or running
+        slots = threading.BoundedSemaphore(max(producer.queue_size, workers))
+        items, inputs, futures = [], [], []
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=consumer.__class__.__name__)
+        saved, save_item = self._saved_items(consumer), self._item_saver(consumer)
+
+        def submit(item):
+            with _span(consumer, "prep_item"):
+                consumer_input = consumer.prep_item(shared_store, item)
+            key = _item_key(consumer_input) if saved else None
+            if key in saved:
+                # Completed by a previous run of this flow
+                future = Future()
+                future.set_result(saved[key])
+            else:
+                slots.acquire()
+                future = pool.submit(contextvars.copy_context().run, consumer._exec_item, consumer_input, save_item)
+                future.add_done_callback(lambda _: slots.release())
+            items.append(item)
+            inputs.append(consumer_input)
+            futures.append(future)
+
+        def discard_speculative_work():
+            for future in futures:
+                future.cancel()
+            items.clear()
+            inputs.clear()
+            futures.clear()
+
+        try:
+            try:
+                with _span(producer, "exec_stream"):
+                    for item in producer.exec_stream(prep_res):
+                        submit(item)
+            except Exception as e:
+                # Broken stream: a transient error redoes the producer the regular way (with its retries);
+                # any other error goes straight to its exec_fallback, as a failed exec would
+                discard_speculative_work()
+                if producer.max_retries > 1 and producer.should_retry(e):
+                    logger.warning("Flow: streaming from %s failed (%s); retrying with regular execution", producer.__class__.__name__, e)
+                    recovered = producer._exec(prep_res)
+                else:
+                    producer._record("fallbacks")
+                    recovered = producer.exec_fallback(prep_res, e)
+                for item in recovered:
+                    submit(item)
+
+            with _span(producer, "post"):
+                action = producer.post(shared_store, prep_res, list(items))
+            action = action if action is not None else "default"
+            next_node = producer._transitions.get(action)
+            if next_node is not consumer:
+                # The producer branched elsewhere, so the consumer's speculative results are not needed
+                discard_speculative_work()
+                return action, next_node
+            self._save_checkpoint(shared_store, consumer) # The producer is done; a resumed run starts at the consumer
+
+            exec_results_list = [future.result() for future in futures]
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+        with _span(consumer, "post"):
+            action = consumer.post(shared_store, inputs, exec_results_list)
+        action = action if action is not None else "default"
+        return action, consumer._transitions.get(action)
+
+    def collect_stats(self):
+        """Retry/fallback counters of every node reachable from start_node, keyed by node class name."""
+        collected = {}
+        seen = set()
+        pending = [self.start_node]
+        while pending:
+            node = pending.pop()
+            if node is None or id(node) in seen:
+                continue
+            seen.add(id(node))
+            node_stats = collected.setdefault(node.__class__.__name__, {})
+            for key, value in node.stats.items():
+                node_stats[key] = node_stats.get(key, 0) + value
+            if isinstance(node, Flow):
+                for key, value in node.collect_stats().items():
+                    nested = collected.setdefault(key, {})
+                    for stat, count in value.items():
+                        nested[stat] = nested.get(stat, 0) + count
+            pending.extend(node._transitions.values())
+        return collected
+
 # BatchFlow is a Flow that runs its sub-flow multiple times based on items from its own prep
 class BatchFlow(Flow):
-    def run(self, shared_store):
-        print(f"--- Running BatchFlow: {self.__class__.__name__} ---")
+    def _run_flow(self, shared_store):
+        logger.info("Running batch flow %s", self.__class__.__name__)
         # BatchFlow's prep returns a list of parameter sets for its sub-flow
         param_sets = self.prep(shared_store)
         if param_sets is None: param_sets = []
@@ -163,7 +699,7 @@ class BatchFlow(Flow):
         batch_flow_results = [] # To store results from each sub-flow run
 
         for i, params_for_subflow_run in enumerate(param_sets):
-            print(f"  BatchFlow: Iteration {i+1}/{len(param_sets)} with params {params_for_subflow_run}")
+            logger.debug("BatchFlow: iteration %d/%d", i + 1, len(param_sets))
             
             # Create a temporary shared store or manage state carefully if sub-flow runs modify it heavily
             # For simplicity, we use the same shared_store, but this can have side effects
@@ -196,5 +732,415 @@ class BatchFlow(Flow):
         # BatchFlow's post processes all results from the sub-flow runs
         # prep_res for BatchFlow's post is the list of param_sets
         final_action = self.post(shared_store, param_sets, batch_flow_results) 
-        print(f"--- BatchFlow {self.__class__.__name__} finished ---")
-        return final_action if final_action is not None else "default" 
\ No newline at end of file
+        logger.info("Batch flow %s finished", self.__class__.__name__)
+        return final_action if final_action is not None else "default"
+
+class SharedMergeError(Exception):
+    """Iterations of a ParallelBatchFlow wrote conflicting values to a shared key that has no merge rule."""
+
+_DELETED = object() # Marks a key deleted by an iteration
+
+class SharedOverlay(MutableMapping):
+    """Copy-on-write view of a shared store, given to each ParallelBatchFlow iteration.
+
+    Reads fall through to `base`; writes and deletes stay in the overlay. A dict, list or set
+    read from `base` is deep-copied on first access, so in-place edits stay local too (other
+    mutable objects are not copied and must not be mutated in place).
+    """
+    def __init__(self, base):
+        self._base = base
+        self._local = {}
+        self._deleted = set()
+
+    def __getitem__(self, key):
+        if key in self._local:
+            return self._local[key]
+        if key in self._deleted:
+            raise KeyError(key)
+        value = self._base[key]
+        if isinstance(value, (dict, list, set)):
+            value = self._local[key] = copy.deepcopy(value)
+        return value
+
+    def __setitem__(self, key, value):
+        self._local[key] = value
+        self._deleted.discard(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._local.pop(key, None)
+        self._deleted.add(key)
+
+    def __contains__(self, key):
+        return key in self._local or (key not in self._deleted and key in self._base)
+
+    def __iter__(self):
+        for key in self._base:
+            if key not in self._local and key not in self._deleted:
+                yield key
+        yield from self._local
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def changes(self):
+        """{key: new value} of every key written or deleted (value _DELETED) that differs from `base`."""
+        changed = {key: value for key, value in self._local.items()
+                   if key not in self._base or self._base[key] != value}
+        changed.update((key, _DELETED) for key in self._deleted if key in self._base)
+        return changed
+
+def _extend_rule(merged, value, base):
+    # Items each iteration appended after the original list
+    base = base if isinstance(base, list) else []
+    added = value[len(base):] if value[:len(base)] == base else value
+    return list(merged if isinstance(merged, list) else []) + list(added)
+
+def _update_rule(merged, value, base):
+    # Keys each iteration added or changed; keys it removed are not propagated
+    base = base if isinstance(base, dict) else {}
+    merged = dict(merged if isinstance(merged, dict) else {})
+    merged.update((key, item) for key, item in value.items() if key not in base or base[key] != item)
+    return merged
+
+def _sum_rule(merged, value, base):
+    # Each iteration's increment over the original value
+    base = base if isinstance(base, (int, float)) else 0
+    return (merged if isinstance(merged, (int, float)) else 0) + value - base
+
+MERGE_RULES = {
+    "last": lambda merged, value, base: value,
+    "first": lambda merged, value, base: merged,
+    "extend": _extend_rule,
+    "update": _update_rule,
+    "sum": _sum_rule,
+}
+
+def _graph_nodes(start_node):
+    """Every node reachable from start_node, nested flows included, in a deterministic order."""
+    nodes, seen, pending = [], set(), [start_node]
+    while pending:
+        node = pending.pop(0)
+        if node is None or id(node) in seen:
+            continue
+        seen.add(id(node))
+        nodes.append(node)
+        if isinstance(node, Flow):
+            pending.append(node.start_node)
+        pending.extend(node._transitions[action] for action in sorted(node._transitions))
+    return nodes
+
+def _clone_graph(node, clones=None):
+    """Copy of the graph reachable from `node` with its own params and run state, for running it concurrently.
+
+    Clones share their stats (and its lock) with the originals, so Flow.collect_stats still sees every run.
+    Checkpointing is off in the clones.
+    """
+    if clones is None:
+        clones = {}
+    if node is None:
+        return None
+    if id(node) in clones:
+        return clones[id(node)]
+    clone = clones[id(node)] = copy.copy(node)
+    clone._stats_lock = node._stats_lock
+    clone.params = dict(node.params)
+    clone._transitions = {action: _clone_graph(target, clones) for action, target in node._transitions.items()}
+    if isinstance(node, Flow):
+        clone.start_node = _clone_graph(node.start_node, clones)
+        clone.current_node = None
+        clone.checkpointer = None
+        clone._checkpoint = None
+    return clone
+
+def _run_isolated(sub_flow, shared_store, params, count_stats=False):
+    # One ParallelBatchFlow iteration on a cloned sub-flow against an overlay of shared.
+    # In a worker process the stats start from zero and are returned to be added to the originals.
+    clone = _clone_graph(sub_flow)
+    nodes = _graph_nodes(clone)
+    if count_stats:
+        for node in nodes:
+            node.stats = dict.fromkeys(node.stats, 0)
+    clone.set_params(params)
+    overlay = SharedOverlay(shared_store)
+    action = clone.run(overlay)
+    return overlay.changes(), action, [node.stats for node in nodes] if count_stats else None
+
+class ParallelBatchFlow(BatchFlow):
+    """BatchFlow whose iterations run concurrently, each on its own copy of the sub-flow and its own view of shared.
+
+    Every iteration reads and writes a SharedOverlay of `shared`, so iterations never see each
+    other's writes. Once all of them have finished, their changes are merged into `shared` in
+    param-set order, so the result doesn't depend on timing. A key changed by several iterations
+    needs a rule in `merge_rules` ({key: rule}): "last" or "first" (in param-set order), "extend"
+    (lists: append the items each iteration added), "update" (dicts: apply the keys each iteration
+    added or changed), "sum" (numbers: add each iteration's increment), or a callable
+    (merged, value, base) -> merged. Without a rule, differing values raise SharedMergeError.
+    If any iteration fails, its exception is raised and `shared` is left unchanged.
+
+    executor="thread" (default) runs iterations on a thread pool of max_workers; executor="process"
+    runs them on the shared process pool (get_executor), for CPU-bound sub-flows, which requires
+    the sub-flow, shared and params to be picklable.
+    """
+    def __init__(self, start_node, max_workers=4, executor="thread", merge_rules=None, max_retries=1, wait=0):
+        super().__init__(start_node, max_retries, wait)
+        if executor not in ("thread", "process"):
+            raise ValueError(f"executor must be 'thread' or 'process', not {executor!r}")
+        self.max_workers = max_workers
+        self.executor = executor
+        self.merge_rules = dict(merge_rules or {})
+
+    def _run_iterations(self, run_params, shared_store):
+        workers = max(1, min(self.max_workers or 1, len(run_params)))
+        if self.executor == "process":
+            pool = get_executor("process")
+            futures = [pool.submit(_run_isolated, self.start_node, shared_store, params, True) for params in run_params]
+            results = [future.result() for future in futures]
+            for changes, action, stats in results:
+                for node, node_stats in zip(_graph_nodes(self.start_node), stats):
+                    for stat, amount in node_stats.items():
+                        if amount:
+                            node._record(stat, amount)
+            return results
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=self.__class__.__name__) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, _run_isolated, self.start_node, shared_store, params)
+                       for params in run_params]
+            return [future.result() for future in futures]
+
+    def merge(self, shared_store, changes_list):
+        """Merge the changes of every iteration, in param-set order, into shared_store (all keys or, on SharedMergeError, none)."""
+        values_by_key, merged_by_key = {}, {}
+        for changes in changes_list:
+            for key, value in changes.items():
+                values_by_key.setdefault(key, []).append(value)
+
+        for key, values in values_by_key.items():
+            rule = self.merge_rules.get(key)
+            if rule is None:
+                if any(value is not values[0] and value != values[0] for value in values[1:]):
+                    raise SharedMergeError(f"{len(values)} iterations wrote different values to shared[{key!r}] and it has no merge rule")
+                merged = values[0]
+            else:
+                merge_value = MERGE_RULES[rule] if isinstance(rule, str) else rule
+                base = shared_store.get(key)
+                if rule in ("last", "first"):
+                    merged, values = values[0], values[1:]
+                elif any(value is _DELETED for value in values):
+                    raise SharedMergeError(f"An iteration deleted shared[{key!r}], which its merge rule can't combine")
+                else:
+                    merged = base
+                for value in values:
+                    merged = merge_value(merged, value, base)
+            merged_by_key[key] = merged
+
+        for key, merged in merged_by_key.items():
+            if merged is _DELETED:
+                shared_store.pop(key, None)
+            else:
+                shared_store[key] = merged
+
+    def _run_flow(self, shared_store):
+        logger.info("Running parallel batch flow %s", self.__class__.__name__)
+        param_sets = self.prep(shared_store)
+        if param_sets is None: param_sets = []
+        run_params = [{**self.params, **params_for_subflow_run} for params_for_subflow_run in param_sets]
+
+        results = self._run_iterations(run_params, shared_store) if run_params else []
+        self.merge(shared_store, [changes for changes, _, _ in results])
+        batch_flow_results = [{"params": params, "result_action": action}
+                              for params, (_, action, _) in zip(run_params, results)]
+
+        final_action = self.post(shared_store, param_sets, batch_flow_results)
+        logger.info("Parallel batch flow %s finished", self.__class__.__name__)
+        return final_action if final_action is not None else "default"
+
+class AsyncNode(Node):
+    """Node whose prep, exec and post are coroutines: prep_async, exec_async and post_async.
+
+    Await run_async() from a running event loop, or put the node in an AsyncFlow; run() starts
+    a new event loop for it. prep_async, post_async and exec_fallback_async default to the
+    synchronous prep, post and exec_fallback, so an async variant of a sync node only needs
+    exec_async. Retries back off with asyncio.sleep, without blocking the loop.
+    """
+    async def prep_async(self, shared):
+        return self.prep(shared)
+
+    async def exec_async(self, prep_res):
+        raise NotImplementedError
+
+    async def post_async(self, shared, prep_res, exec_res):
+        return self.post(shared, prep_res, exec_res)
+
+    async def exec_fallback_async(self, prep_res, exc):
+        return self.exec_fallback(prep_res, exc)
+
+    async def _exec_attempts_async(self, prep_res):
+        for attempt in range(max(1, self.max_retries)):
+            try:
+                with _span(self, "exec", attempt=attempt + 1):
+                    return await self.exec_async(prep_res)
+            except Exception as e:
+                if attempt >= self.max_retries - 1 or not self.should_retry(e):
+                    raise
+                delay = self.retry_delay(attempt)
+                self._record("retries")
+                _event(self, "retry", attempt=attempt + 1, delay=delay, error=f"{e.__class__.__name__}: {e}")
+                self.on_retry(prep_res, e, attempt + 1, delay)
+                await asyncio.sleep(delay)
+
+    async def _exec_async(self, prep_res):
+        try:
+            return await self._exec_attempts_async(prep_res)
+        except Exception as e:
+            self._record("fallbacks")
+            return await self.exec_fallback_async(prep_res, e)
+
+    async def run_async(self, shared_store):
+        # Spans of coroutines also count CPU time of other tasks that ran on the loop thread meanwhile
+        with _span(self, "prep"):
+            prep_result = await self.prep_async(shared_store)
+        exec_result = await self._exec_async(prep_result)
+        with _span(self, "post"):
+            action = await self.post_async(shared_store, prep_result, exec_result)
+        return action if action is not None else "default"
+
+    def run(self, shared_store):
+        return asyncio.run(self.run_async(shared_store))
+
+class AsyncBatchNode(AsyncNode, BatchNode):
+    """BatchNode whose exec_async runs once per item, one item at a time."""
+    async def _exec_item_async(self, item, on_done=None):
+        with _span(self, "item"):
+            try:
+                result = await self._exec_attempts_async(item)
+            except Exception as e:
+                self._record("fallbacks")
+                return await self.exec_fallback_async(item, e)
+            if on_done is not None:
+                on_done(item, result)
+            return result
+
+    async def _exec_items_async(self, items, on_done=None):
+        return [await self._exec_item_async(item, on_done) for item in items]
+
+    async def run_async(self, shared_store):
+        with _span(self, "prep"):
+            iterable_prep_res = await self.prep_async(shared_store)
+        if iterable_prep_res is None:
+            iterable_prep_res = []
+        exec_results_list = await self._exec_items_async(iterable_prep_res)
+        with _span(self, "post"):
+            action = await self.post_async(shared_store, iterable_prep_res, exec_results_list)
+        return action if action is not None else "default"
+
+class AsyncParallelBatchNode(AsyncBatchNode):
+    """AsyncBatchNode that runs its items concurrently on the event loop.
+
+    At most `max_workers` items are in flight at once (None for no limit); results are in input order.
+    """
+    def __init__(self, max_retries=1, wait=0, max_workers=4):
+        super().__init__(max_retries, wait)
+        self.max_workers = max_workers
+
+    async def _exec_items_async(self, items, on_done=None):
+        items = list(items)
+        if not self.max_workers:
+            return list(await asyncio.gather(*(self._exec_item_async(item, on_done) for item in items)))
+        limit = asyncio.Semaphore(self.max_workers)
+
+        async def bounded(item):
+            async with limit:
+                return await self._exec_item_async(item, on_done)
+        return list(await asyncio.gather(*(bounded(item) for item in items)))
+
+class AsyncFlow(Flow, AsyncNode):
+    """Flow driven by an event loop.
+
+    AsyncNodes are awaited. Sync nodes, pipelined StreamNode stages and nested sync flows run
+    in a worker thread (asyncio.to_thread), so they never block the loop. Checkpoints and
+    resume work as in Flow. Many AsyncFlows, e.g. one per video, can share a single loop.
+    """
+    def run(self, shared_store):
+        return asyncio.run(self.run_async(shared_store))
+
+    async def run_async(self, shared_store):
+        with _span(self, "flow"):
+            return await self._run_flow_async(shared_store)
+
+    async def _exec_batch_async(self, node, items):
+        keys, saved, pending = self._pending_items(node, list(items))
+        fresh = iter(await node._exec_items_async(pending, self._item_saver(node)))
+        return [saved[key] if key in saved else next(fresh) for key in keys]
+
+    async def _run_node_async(self, node, shared_store):
+        if isinstance(node, AsyncBatchNode):
+            with _span(node, "prep"):
+                iterable_prep_res = await node.prep_async(shared_store)
+            if iterable_prep_res is None: iterable_prep_res = []
+            exec_results_list = await self._exec_batch_async(node, iterable_prep_res)
+            with _span(node, "post"):
+                return await node.post_async(shared_store, iterable_prep_res, exec_results_list)
+        if isinstance(node, AsyncNode):
+            return await node.run_async(shared_store)
+        return await asyncio.to_thread(self._run_node, node, shared_store)
+
+    async def _run_flow_async(self, shared_store):
+        logger.info("Running flow %s", self.__class__.__name__)
+        self.current_node = self.start_node
+        final_action = "default"
+        self._start_checkpoint(shared_store)
+        flow_prep_res = await self.prep_async(shared_store)
+
+        loop_count = 0 # Safety break for loops
+        max_loops = 20
+
+        while self.current_node and loop_count < max_loops:
+            logger.info("Flow: executing node %s", self.current_node.__class__.__name__)
+            self._merge_params(self.current_node)
+
+            consumer = self._stream_consumer(self.current_node)
+            if consumer is not None:
+                self._merge_params(consumer)
+                action, next_node = await asyncio.to_thread(self._run_pipelined, self.current_node, consumer, shared_store)
+            else:
+                action = await self._run_node_async(self.current_node, shared_store)
+                next_node = self.current_node._transitions.get(action)
+
+            final_action = action
+            self.current_node = next_node
+            self._save_checkpoint(shared_store, self.current_node)
+            if not self.current_node:
+                logger.debug("Flow: action '%s' leads to no next node, flow ends", action)
+            loop_count += 1
+        self._finish_flow(loop_count, max_loops)
+
+        flow_final_action = await self.post_async(shared_store, flow_prep_res, None)
+        logger.info("Flow %s finished", self.__class__.__name__)
+        return flow_final_action if flow_final_action not in (None, "default") else final_action
+
+class AsyncBatchFlow(AsyncFlow, BatchFlow):
+    """BatchFlow on an event loop: prep (or prep_async) returns parameter sets, and the sub-flow runs once per set, in order."""
+    async def _run_flow_async(self, shared_store):
+        logger.info("Running batch flow %s", self.__class__.__name__)
+        param_sets = await self.prep_async(shared_store)
+        if param_sets is None: param_sets = []
+
+        batch_flow_results = []
+        for i, params_for_subflow_run in enumerate(param_sets):
+            logger.debug("AsyncBatchFlow: iteration %d/%d", i + 1, len(param_sets))
+            original_sub_flow_params = self.start_node.params.copy()
+            current_run_params = self.params.copy()
+            current_run_params.update(params_for_subflow_run)
+            self.start_node.set_params(current_run_params)
+
+            if isinstance(self.start_node, AsyncNode):
+                sub_flow_result_action = await self.start_node.run_async(shared_store)
+            else:
+                sub_flow_result_action = await asyncio.to_thread(self.start_node.run, shared_store)
+            batch_flow_results.append({"params": current_run_params, "result_action": sub_flow_result_action})
+            self.start_node.set_params(original_sub_flow_params)
+
+        final_action = await self.post_async(shared_store, param_sets, batch_flow_results)
+        logger.info("Batch flow %s finished", self.__class__.__name__)
+        return final_action if final_action is not None else "default"
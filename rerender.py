@@ -0,0 +1,103 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.html_generator import TEMPLATE_HASH, load_report_artifact, write_html_report
+from utils.log_config import configure_logging
+
+MANIFEST_NAME = ".render_manifest.json"
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def load_manifest(path):
+    """{report file name: {"input_hash", "template_hash"}} of the last render, empty if there is none."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("reports", {})
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(path, reports):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"reports": reports}, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def render_artifact(artifact_path):
+    """Render the report next to one artifact. Runs in a worker process; returns an error message or None."""
+    try:
+        video_info, topics_data = load_report_artifact(artifact_path)
+        write_html_report(video_info, topics_data, os.path.splitext(artifact_path)[0] + ".html")
+        return None
+    except Exception as e:
+        return f"{e.__class__.__name__}: {e}"
+
+def rerender(directory="examples", workers=None, force=False):
+    """
+    Re-render every report in `directory` from its JSON artifact, skipping reports whose
+    artifact and template hash match the manifest of the last render. Returns the summary dict.
+    """
+    started = time.perf_counter()
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+
+    pending, counts = [], {"rendered": 0, "skipped": 0, "failed": 0}
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".json") or name.startswith("."):
+            continue
+        artifact_path = os.path.join(directory, name)
+        report_name = os.path.splitext(name)[0] + ".html"
+        entry = {"input_hash": file_hash(artifact_path), "template_hash": TEMPLATE_HASH}
+        if not force and manifest.get(report_name) == entry and os.path.exists(os.path.join(directory, report_name)):
+            counts["skipped"] += 1
+            continue
+        pending.append((artifact_path, report_name, entry))
+
+    workers = max(1, workers or os.cpu_count() or 1)
+    paths = [artifact_path for artifact_path, _, _ in pending]
+    if workers == 1 or len(paths) <= 1:
+        errors = [render_artifact(path) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+            # Rendering one report takes milliseconds, so hand them out in chunks
+            errors = list(pool.map(render_artifact, paths, chunksize=max(1, len(paths) // (workers * 4))))
+
+    failures = {}
+    for (artifact_path, report_name, entry), error in zip(pending, errors):
+        if error is None:
+            counts["rendered"] += 1
+            manifest[report_name] = entry
+        else:
+            counts["failed"] += 1
+            failures[artifact_path] = error
+            manifest.pop(report_name, None)
+    if pending:
+        save_manifest(manifest_path, manifest)
+    return {"counts": counts, "failures": failures, "total_seconds": round(time.perf_counter() - started, 3)}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-render HTML reports from their saved JSON artifacts, without running the LLM stages.")
+    parser.add_argument("directory", nargs="?", default="examples", help="Directory with the reports and their .json artifacts (default: examples).")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: number of CPUs).")
+    parser.add_argument("--force", action="store_true", help="Re-render every report, even if its artifact and template are unchanged.")
+    parser.add_argument("--log-level", default=None, help="Log level (default: LOG_LEVEL, else INFO).")
+    args = parser.parse_args(argv)
+    configure_logging(args.log_level)
+
+    if not os.path.isdir(args.directory):
+        print(f"Directory not found: {args.directory}")
+        return 1
+    summary = rerender(args.directory, workers=args.workers, force=args.force)
+    for artifact_path, error in summary["failures"].items():
+        print(f"failed: {artifact_path}: {error}")
+    print(f"Done in {summary['total_seconds']}s: {summary['counts']}")
+    return 1 if summary["counts"]["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import os
+import unittest
+from unittest import mock
+import nodes
+from nodes import ExtractTopicsAndQuestionsNode, merge_candidate_topics
+from utils.llm_errors import RateLimitError
+from utils.transcript_index import estimate_tokens
+
+# Three themes, four segments of equal length each, so the stub's topics (its most frequent words) show which parts were used
+THEMES = ["volcano magma eruption.", "glacier frozen melting.", "desert sandy dunes..."]
+SEGMENTS = [{"text": THEMES[i // 4], "start": float(i), "duration": 1.0} for i in range(12)]
+TRANSCRIPT = " ".join(segment["text"] for segment in SEGMENTS)
+
+def topic(title, *questions):
+    return {"title": title, "rephrased_title": "", "questions": [{"original": q, "rephrased": "", "answer": ""} for q in questions]}
+
+class TestMapReduceTopics(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.dict(os.environ, {"LLM_PROVIDER": "stub", "LLM_MODEL": ""})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # chunk_threshold_tokens is EXTRACT_CHUNK_THRESHOLD_TOKENS, read when nodes.py is imported
+        self.node = ExtractTopicsAndQuestionsNode()
+        # Parts of 3.5 segments' worth of characters, i.e. four segments each
+        chars_per_token = len(TRANSCRIPT) / estimate_tokens(TRANSCRIPT)
+        self.node.map_chunk_tokens = 3.5 * (len(THEMES[0]) + 1) / chars_per_token
+        self.prep_res = (TRANSCRIPT, "Nature", SEGMENTS)
+
+    def extract(self):
+        with mock.patch.object(nodes, "call_llm", wraps=nodes.call_llm) as call_llm, \
+             mock.patch.object(nodes, "call_llm_stream", wraps=nodes.call_llm_stream) as call_llm_stream:
+            topics = list(self.node.exec_stream(self.prep_res))
+        return topics, [c.args[0] for c in call_llm.call_args_list], call_llm_stream.call_count
+
+    def test_switches_to_map_reduce_above_the_threshold(self):
+        self.node.chunk_threshold_tokens = estimate_tokens(TRANSCRIPT)
+        topics, map_prompts, streamed = self.extract()
+        self.assertEqual((len(map_prompts), streamed), (0, 1)) # One streamed prompt with the full transcript
+        self.assertTrue(topics)
+
+        self.node.chunk_threshold_tokens = estimate_tokens(TRANSCRIPT) - 1
+        topics, map_prompts, _ = self.extract()
+        self.assertEqual(len(map_prompts), 3)
+        self.assertTrue(all(f"of 3)" in prompt for prompt in map_prompts))
+        self.assertLessEqual(len(topics), 5)
+
+    def test_parts_split_on_segment_boundaries(self):
+        parts = self.node.split_transcript(TRANSCRIPT, SEGMENTS, estimate_tokens(TRANSCRIPT))
+        self.assertEqual(len(parts), 3)
+        self.assertEqual([part["text"] for part in parts], [" ".join([theme] * 4) for theme in THEMES])
+        self.assertEqual([part["start"] for part in parts], [0.0, 4.0, 8.0])
+
+    def test_candidates_are_deduplicated_and_ranked(self):
+        """Similar titles merge (questions unioned, at most 3); topics found by more parts come first."""
+        merged = merge_candidate_topics([
+            topic("Volcano eruptions", "Why do volcanoes erupt?"),
+            topic("Desert dunes", "How do dunes move?"),
+            topic("Eruptions of a volcano", "Why do volcanoes erupt?", "What is magma?"),
+            topic("Volcano eruptions", "Can we predict eruptions?", "Where are volcanoes?"),
+        ])
+        self.assertEqual([t["title"] for t in merged], ["Volcano eruptions", "Desert dunes"])
+        self.assertEqual([q["original"] for q in merged[0]["questions"]],
+                         ["Why do volcanoes erupt?", "What is magma?", "Can we predict eruptions?"])
+
+    def test_failed_parts(self):
+        """A failed part only loses its own candidates; if every part fails, the last error is raised."""
+        merged = self.node.merge_part_results([[topic("Glaciers", "Why is ice blue?")], RateLimitError("part 2")], 2)
+        self.assertEqual([t["title"] for t in merged], ["Glaciers"])
+
+        self.node.chunk_threshold_tokens = 1
+        real_call_llm = nodes.call_llm
+
+        def failing_part_two(prompt, **kwargs):
+            if "(part 2 of 3)" in prompt:
+                raise RateLimitError("part 2 is rate limited")
+            return real_call_llm(prompt, **kwargs)
+
+        with mock.patch.object(nodes, "call_llm", side_effect=failing_part_two):
+            topics = list(self.node.exec_stream(self.prep_res))
+        titles = " ".join(t["title"] for t in topics)
+        self.assertIn("volcano", titles)
+        self.assertIn("desert", titles)
+        self.assertNotIn("glacier", titles) # Only part 2 talks about glaciers
+
+        errors = iter([RateLimitError("first"), RateLimitError("second"), RateLimitError("third")])
+        self.node.map_workers = 1 # Parts fail in order
+        with mock.patch.object(nodes, "call_llm", side_effect=lambda prompt, **kwargs: (_ for _ in ()).throw(next(errors))):
+            with self.assertRaisesRegex(RateLimitError, "third"):
+                list(self.node.exec_stream(self.prep_res))
+
+if __name__ == "__main__":
+    unittest.main()
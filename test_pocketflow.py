@@ -0,0 +1,558 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from pocketflow import (Node, BatchNode, ParallelBatchNode, StreamNode, Flow, _item_key,
+                        AsyncNode, AsyncParallelBatchNode, AsyncFlow, AsyncBatchFlow,
+                        ParallelBatchFlow, SharedMergeError, shutdown_executors)
+from utils.checkpoint import FileCheckpointer
+
+class FlakyNode(Node):
+    """Fails `failures` times with `error`, then returns "ok"."""
+    def __init__(self, failures, error=RuntimeError, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def exec(self, prep_res):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error(f"failure {self.calls}")
+        return "ok"
+
+    def exec_fallback(self, prep_res, exc):
+        return f"fallback: {exc}"
+
+class TestRetries(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch("pocketflow.time.sleep")
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_retries_until_success(self):
+        node = FlakyNode(2, max_retries=3)
+        self.assertEqual(node._exec(None), "ok")
+        self.assertEqual(node.calls, 3)
+        self.assertEqual(node.stats, {"retries": 2, "fallbacks": 0})
+
+    def test_exhausted_retries_use_the_fallback(self):
+        node = FlakyNode(5, max_retries=3)
+        self.assertEqual(node._exec(None), "fallback: failure 3")
+        self.assertEqual(node.calls, 3)
+        self.assertEqual(node.stats, {"retries": 2, "fallbacks": 1})
+
+    def test_non_retryable_errors_go_straight_to_the_fallback(self):
+        node = FlakyNode(1, error=ValueError, max_retries=5)
+        node.should_retry = lambda exc: not isinstance(exc, ValueError)
+        on_retry = node.on_retry = mock.Mock()
+        self.assertEqual(node._exec(None), "fallback: failure 1")
+        self.assertEqual(node.calls, 1)
+        self.assertEqual(node.stats, {"retries": 0, "fallbacks": 1})
+        on_retry.assert_not_called()
+        self.sleep.assert_not_called()
+
+    def test_backoff_doubles_up_to_max_wait(self):
+        """Each delay is drawn from [cap/2, cap], with cap = wait * 2**attempt bounded by max_wait."""
+        node = FlakyNode(5, max_retries=6, wait=1)
+        node.max_wait = 5
+        on_retry = node.on_retry = mock.Mock()
+        with mock.patch("pocketflow.random.uniform", side_effect=lambda low, high: high) as uniform:
+            node._exec(None)
+        caps = [1, 2, 4, 5, 5]
+        self.assertEqual([c.args for c in uniform.call_args_list], [(cap / 2, cap) for cap in caps])
+        self.assertEqual([c.args[0] for c in self.sleep.call_args_list], caps)
+        self.assertEqual([c.args[2:] for c in on_retry.call_args_list], [(attempt, cap) for attempt, cap in enumerate(caps, 1)])
+        self.assertEqual(node.stats, {"retries": 5, "fallbacks": 0})
+
+    def test_no_wait_means_no_delay(self):
+        node = FlakyNode(1, max_retries=2)
+        node._exec(None)
+        self.sleep.assert_called_once_with(0)
+
+class NumberStream(StreamNode):
+    """Yields 0..count-1, then raises `error` if set. exec() is the regular (non-streamed) path."""
+    def __init__(self, count, error=None, exec_error=None, max_retries=1):
+        super().__init__(max_retries=max_retries)
+        self.count = count
+        self.error = error
+        self.exec_error = exec_error
+        self.exec_calls = 0
+        self.yielded_ahead = [] # Items yielded but not yet completed by the consumer, at each yield
+        self.consumer = None
+
+    def exec_stream(self, prep_res):
+        for i in range(self.count):
+            if self.consumer is not None:
+                self.yielded_ahead.append(i - self.consumer.completed)
+            yield i
+        if self.error is not None:
+            raise self.error
+
+    def exec(self, prep_res):
+        self.exec_calls += 1
+        if self.exec_error is not None:
+            raise self.exec_error
+        return list(range(self.count))
+
+class SquareConsumer(ParallelBatchNode):
+    consumes_stream = True
+
+    def __init__(self, delay=lambda item: 0, **kwargs):
+        super().__init__(**kwargs)
+        self.delay = delay
+        self.completed = 0
+        self._completed_lock = threading.Lock()
+
+    def prep_item(self, shared, item):
+        return {"n": item}
+
+    def exec(self, item):
+        time.sleep(self.delay(item["n"]))
+        with self._completed_lock:
+            self.completed += 1
+        return item["n"] ** 2
+
+    def post(self, shared, prep_res, exec_res):
+        shared["inputs"] = prep_res
+        shared["squares"] = exec_res
+
+def pipelined_flow(producer, consumer):
+    producer >> consumer
+    return Flow(producer)
+
+class TestPipelinedStage(unittest.TestCase):
+
+    def test_results_are_in_input_order(self):
+        """Later items finish first, but post() sees inputs and results in the order they were produced."""
+        consumer = SquareConsumer(delay=lambda n: (8 - n) * 0.005, max_workers=4)
+        shared = {}
+        pipelined_flow(NumberStream(8), consumer).run(shared)
+        self.assertEqual(shared["inputs"], [{"n": n} for n in range(8)])
+        self.assertEqual(shared["squares"], [n ** 2 for n in range(8)])
+
+    def test_producer_errors_reach_the_caller_without_leaking_threads(self):
+        """A retryable stream error reruns the producer's regular exec; other errors go to exec_fallback."""
+        shared = {}
+        producer = NumberStream(3, error=RuntimeError("stream broke"), max_retries=2)
+        pipelined_flow(producer, SquareConsumer()).run(shared)
+        self.assertEqual((shared["squares"], producer.exec_calls), ([0, 1, 4], 1)) # Recovered through exec()
+
+        producer = NumberStream(3, error=RuntimeError("stream broke"), exec_error=ValueError("exec broke"), max_retries=2)
+        with self.assertRaisesRegex(ValueError, "exec broke"):
+            pipelined_flow(producer, SquareConsumer(delay=lambda n: 0.05)).run({})
+
+        producer = NumberStream(3, error=RuntimeError("stream broke"), max_retries=2)
+        producer.should_retry = lambda exc: False
+        with self.assertRaisesRegex(RuntimeError, "stream broke"): # The default exec_fallback re-raises
+            pipelined_flow(producer, SquareConsumer(delay=lambda n: 0.05)).run({})
+        self.assertEqual((producer.exec_calls, producer.stats["fallbacks"]), (0, 1))
+        self.assertFalse([t for t in threading.enumerate() if t.name.startswith("SquareConsumer")])
+
+    def test_empty_stream_is_an_empty_result(self):
+        producer = NumberStream(0, max_retries=3)
+        shared = {}
+        pipelined_flow(producer, SquareConsumer()).run(shared)
+        self.assertEqual((shared["squares"], producer.exec_calls), ([], 0))
+
+    def test_pooled_consumer_is_not_pipelined(self):
+        """A consumer with executor="thread" runs after the producer, on the shared pool."""
+        consumer = SquareConsumer(max_workers=2)
+        consumer.executor = "thread"
+        threads = []
+        consumer.prep = lambda shared: [{"n": n} for n in shared["numbers"]]
+        consumer.exec = lambda item: threads.append(threading.current_thread().name) or item["n"] ** 2
+
+        class Numbers(NumberStream):
+            def post(self, shared, prep_res, exec_res):
+                shared["numbers"] = exec_res
+
+        producer = Numbers(4)
+        shared = {}
+        pipelined_flow(producer, consumer).run(shared)
+        self.assertEqual((shared["squares"], producer.exec_calls), ([0, 1, 4, 9], 1))
+        self.assertTrue(all(name.startswith("flow-exec") for name in threads))
+
+    def test_in_flight_items_are_bounded(self):
+        """The producer blocks once queue_size items are queued or running in the consumer."""
+        producer = NumberStream(12)
+        producer.queue_size = 3
+        consumer = SquareConsumer(delay=lambda n: 0.01, max_workers=1)
+        producer.consumer = consumer
+        shared = {}
+        pipelined_flow(producer, consumer).run(shared)
+        self.assertEqual(shared["squares"], [n ** 2 for n in range(12)])
+        self.assertEqual(max(producer.yielded_ahead), 3)
+
+class LoadItemsNode(Node):
+    def __init__(self):
+        super().__init__()
+        self.runs = 0
+
+    def exec(self, prep_res):
+        self.runs += 1
+        return [1, 2, 3, 4, 5]
+
+    def post(self, shared, prep_res, exec_res):
+        shared["items"] = exec_res
+
+class DoubleNode(BatchNode):
+    """Doubles every item; raises on `crash_on` to simulate a crash partway through the batch."""
+    def __init__(self, crash_on=None):
+        super().__init__()
+        self.crash_on = crash_on
+        self.seen = []
+
+    def prep(self, shared):
+        return shared["items"]
+
+    def exec(self, item):
+        if item == self.crash_on:
+            raise RuntimeError(f"crashed on {item}")
+        self.seen.append(item)
+        return item * 2
+
+    def post(self, shared, prep_res, exec_res):
+        shared["doubled"] = exec_res
+
+def checkpointed_flow(checkpointer, resume=False, crash_on=None):
+    load, double = LoadItemsNode(), DoubleNode(crash_on)
+    load >> double
+    flow = Flow(load)
+    flow.enable_checkpoints(checkpointer, resume=resume)
+    return flow, load, double
+
+class TestCheckpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.checkpointer = FileCheckpointer(os.path.join(self.tmp_dir.name, "run.json"))
+
+    def test_resume_reruns_only_unfinished_items(self):
+        flow, _, double = checkpointed_flow(self.checkpointer, crash_on=3)
+        with self.assertRaisesRegex(RuntimeError, "crashed on 3"):
+            flow.run({})
+        self.assertEqual(double.seen, [1, 2])
+        self.assertTrue(self.checkpointer.exists())
+
+        flow, load, double = checkpointed_flow(self.checkpointer, resume=True)
+        shared = {}
+        flow.run(shared)
+        self.assertEqual(load.runs, 0) # Completed before the crash
+        self.assertEqual(double.seen, [3, 4, 5])
+        self.assertEqual(shared, {"items": [1, 2, 3, 4, 5], "doubled": [2, 4, 6, 8, 10]})
+
+    def test_resumed_run_can_crash_again(self):
+        """Items saved by a resumed run keep the restored shared store in the checkpoint."""
+        flow, _, _ = checkpointed_flow(self.checkpointer, crash_on=3)
+        with self.assertRaisesRegex(RuntimeError, "crashed on 3"):
+            flow.run({})
+        flow, _, double = checkpointed_flow(self.checkpointer, resume=True, crash_on=4)
+        with self.assertRaisesRegex(RuntimeError, "crashed on 4"):
+            flow.run({})
+        self.assertEqual(double.seen, [3])
+        self.assertEqual(self.checkpointer.load()["shared"], {"items": [1, 2, 3, 4, 5]})
+
+        flow, load, double = checkpointed_flow(self.checkpointer, resume=True)
+        shared = {}
+        flow.run(shared)
+        self.assertEqual((load.runs, double.seen), (0, [4, 5]))
+        self.assertEqual(shared, {"items": [1, 2, 3, 4, 5], "doubled": [2, 4, 6, 8, 10]})
+
+    def test_successful_run_clears_the_checkpoint(self):
+        flow, _, _ = checkpointed_flow(self.checkpointer)
+        saves = []
+        with mock.patch.object(self.checkpointer, "save", side_effect=lambda state: saves.append(state["next"])):
+            flow.run({})
+        self.assertEqual(saves, ["1.DoubleNode"] + ["1.DoubleNode"] * 5) # After the first node, then after every item
+        self.assertFalse(self.checkpointer.exists())
+
+    def test_stale_checkpoint_is_ignored_without_resume(self):
+        stale = {"version": 1, "next": "1.DoubleNode", "shared": {"items": [1, 2, 3, 4, 5], "stale": True},
+                 "items": {"1.DoubleNode": {_item_key(1): 999}}}
+        self.checkpointer.save(stale)
+        flow, load, double = checkpointed_flow(self.checkpointer)
+        shared = {}
+        flow.run(shared)
+        self.assertEqual(load.runs, 1)
+        self.assertEqual(double.seen, [1, 2, 3, 4, 5])
+        self.assertEqual(shared, {"items": [1, 2, 3, 4, 5], "doubled": [2, 4, 6, 8, 10]})
+
+        # The same file would have been used with resume=True
+        self.checkpointer.save(stale)
+        flow, load, _ = checkpointed_flow(self.checkpointer, resume=True)
+        shared = {}
+        flow.run(shared)
+        self.assertEqual((load.runs, shared["doubled"][0], shared["stale"]), (0, 999, True))
+
+class AsyncFlakyNode(AsyncNode):
+    def __init__(self, failures, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+        self.calls = 0
+
+    async def exec_async(self, prep_res):
+        self.calls += 1
+        await asyncio.sleep(0)
+        if self.calls <= self.failures:
+            raise RuntimeError(f"failure {self.calls}")
+        return "ok"
+
+    async def exec_fallback_async(self, prep_res, exc):
+        return f"fallback: {exc}"
+
+    def post(self, shared, prep_res, exec_res):
+        shared["result"] = exec_res
+
+class AsyncSquareNode(AsyncParallelBatchNode):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.active = self.peak = 0
+
+    def prep(self, shared):
+        return shared["items"]
+
+    async def exec_async(self, item):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep((10 - item) * 0.002) # Later items finish first
+        self.active -= 1
+        return item ** 2
+
+    def post(self, shared, prep_res, exec_res):
+        shared["squares"] = exec_res
+        return "default"
+
+class RouteNode(AsyncNode):
+    """Returns the route in shared, or in its params, as its action."""
+    def prep(self, shared):
+        return shared.get("route", self.params.get("route"))
+
+    async def exec_async(self, route):
+        return route
+
+    def post(self, shared, prep_res, exec_res):
+        shared.setdefault("routes", []).append(exec_res)
+        return exec_res
+
+class RecordNode(Node):
+    """Sync node: records its name and the thread it ran on."""
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+
+    def exec(self, prep_res):
+        return threading.current_thread()
+
+    def post(self, shared, prep_res, exec_res):
+        shared.setdefault("ran", []).append(self.name)
+        shared.setdefault("threads", []).append(exec_res)
+
+class TestAsyncEngine(unittest.TestCase):
+
+    def test_async_retries_and_fallback(self):
+        node = AsyncFlakyNode(2, max_retries=3)
+        shared = {}
+        asyncio.run(node.run_async(shared))
+        self.assertEqual((shared["result"], node.calls), ("ok", 3))
+        self.assertEqual(node.stats, {"retries": 2, "fallbacks": 0})
+
+        node = AsyncFlakyNode(5, max_retries=2)
+        node.run(shared) # Sync entry point
+        self.assertEqual((shared["result"], node.calls), ("fallback: failure 2", 2))
+        self.assertEqual(node.stats, {"retries": 1, "fallbacks": 1})
+
+    def test_parallel_batch_results_are_ordered_and_bounded(self):
+        node = AsyncSquareNode(max_workers=3)
+        shared = {"items": list(range(10))}
+        asyncio.run(node.run_async(shared))
+        self.assertEqual(shared["squares"], [n ** 2 for n in range(10)])
+        self.assertEqual(node.peak, 3)
+
+    def test_flow_follows_actions(self):
+        route, left, right = RouteNode(), RecordNode("left"), RecordNode("right")
+        route - "left" >> left
+        route - "right" >> right
+        flow = AsyncFlow(route)
+        for target in ("left", "right"):
+            shared = {"route": target}
+            self.assertEqual(flow.run(shared), "default")
+            self.assertEqual(shared["ran"], [target])
+
+    def test_sync_nodes_run_in_worker_threads(self):
+        """Sync nodes in an AsyncFlow run off the loop thread and share the store with async nodes."""
+        first, last = RecordNode("first"), RecordNode("last")
+        squares = AsyncSquareNode(max_workers=2)
+        first >> squares >> last
+        loop_threads = []
+
+        async def main():
+            loop_threads.append(threading.current_thread())
+            shared = {"items": [1, 2, 3]}
+            await AsyncFlow(first).run_async(shared)
+            return shared
+
+        shared = asyncio.run(main())
+        self.assertEqual((shared["ran"], shared["squares"]), (["first", "last"], [1, 4, 9]))
+        self.assertNotIn(loop_threads[0], shared["threads"])
+
+    def test_batch_flow_runs_the_sub_flow_once_per_param_set(self):
+        class Routes(AsyncBatchFlow):
+            def prep(self, shared):
+                return [{"route": "left"}, {"route": "right"}, {"route": "left"}]
+
+        shared = {}
+        Routes(RouteNode()).run(shared)
+        self.assertEqual(shared["routes"], ["left", "right", "left"])
+
+class IterationNode(Node):
+    """One ParallelBatchFlow iteration: writes its index `i` to shared in several ways."""
+    def __init__(self):
+        super().__init__(max_retries=2)
+        self.attempts = 0
+
+    def exec(self, params):
+        self.attempts += 1
+        if params.get("flaky") and self.attempts == 1:
+            raise RuntimeError("first attempt fails")
+        time.sleep((4 - params["i"]) * 0.01) # Later iterations finish first
+        return params["i"]
+
+    def prep(self, shared):
+        return self.params
+
+    def post(self, shared, prep_res, i):
+        shared["seen"] = list(shared["log"]) # Identical in every iteration unless they see each other's writes
+        shared["log"].append(i)
+        shared["count"] += 1
+        shared["squares"][i] = i * i
+        shared["latest"] = i
+        shared["earliest"] = i
+        shared["peak"] = i
+        for key in self.params.get("delete", []):
+            del shared[key]
+
+class Iterations(ParallelBatchFlow):
+    def prep(self, shared):
+        return [{"i": i, **shared.get("extra", {}).get(i, {})} for i in range(4)]
+
+MERGE_RULES = {"log": "extend", "count": "sum", "squares": "update", "latest": "last", "earliest": "first",
+               "peak": lambda merged, value, base: max(merged, value)}
+
+def iteration_shared(**extra):
+    return {"log": ["base"], "count": 10, "squares": {"base": 0}, "peak": -1, **extra}
+
+class TestParallelBatchFlow(unittest.TestCase):
+
+    def assertMerged(self, shared):
+        self.assertEqual(shared["seen"], ["base"])
+        self.assertEqual(shared["log"], ["base", 0, 1, 2, 3]) # Param-set order, not completion order
+        self.assertEqual(shared["count"], 14)
+        self.assertEqual(shared["squares"], {"base": 0, 0: 0, 1: 1, 2: 4, 3: 9})
+        self.assertEqual((shared["latest"], shared["earliest"], shared["peak"]), (3, 0, 3))
+
+    def test_merge_rules(self):
+        shared = iteration_shared()
+        Iterations(IterationNode(), max_workers=4, merge_rules=MERGE_RULES).run(shared)
+        self.assertMerged(shared)
+
+    def test_conflicting_writes_without_a_rule_raise(self):
+        shared = iteration_shared()
+        rules = {key: rule for key, rule in MERGE_RULES.items() if key != "latest"}
+        with self.assertRaisesRegex(SharedMergeError, "'latest'"):
+            Iterations(IterationNode(), merge_rules=rules).run(shared)
+        self.assertEqual(shared, iteration_shared()) # Nothing merged
+
+    def test_deleted_keys(self):
+        """A deletion wins under "last"/"first" or when every iteration agrees; combining rules can't take one."""
+        shared = iteration_shared(latest=-1, extra={3: {"delete": ["latest"]}})
+        Iterations(IterationNode(), merge_rules=MERGE_RULES).run(shared)
+        self.assertNotIn("latest", shared)
+
+        shared = iteration_shared(extra={i: {"delete": ["seen"]} for i in range(4)})
+        Iterations(IterationNode(), merge_rules=MERGE_RULES).run(shared)
+        self.assertNotIn("seen", shared)
+
+        shared = iteration_shared(extra={1: {"delete": ["count"]}})
+        with self.assertRaisesRegex(SharedMergeError, "'count'"):
+            Iterations(IterationNode(), merge_rules=MERGE_RULES).run(shared)
+        self.assertEqual(shared["count"], 10)
+
+    def test_process_executor(self):
+        """Iterations in worker processes merge the same way, and their retries count in the original node's stats."""
+        self.addCleanup(shutdown_executors)
+        node = IterationNode()
+        shared = iteration_shared(extra={2: {"flaky": True}})
+        Iterations(node, max_workers=2, executor="process", merge_rules=MERGE_RULES).run(shared)
+        self.assertMerged(shared)
+        self.assertEqual(node.stats, {"retries": 1, "fallbacks": 0})
+        self.assertEqual(node.attempts, 0) # The original node never ran
+
+class ReverseSleepNode(ParallelBatchNode):
+    """Item n sleeps longer the smaller n is, so items finish in reverse order; tracks the peak number running."""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.running = self.peak = 0
+        self.finished = []
+        self._running_lock = threading.Lock()
+
+    def exec(self, n):
+        with self._running_lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep((10 - n) * 0.01)
+        with self._running_lock:
+            self.running -= 1
+            self.finished.append(n)
+        return n * 10
+
+    def post(self, shared, prep_res, exec_res):
+        shared["results"] = exec_res
+
+class TestParallelBatchNode(unittest.TestCase):
+
+    def test_results_keep_input_order_and_workers_are_bounded(self):
+        node = ReverseSleepNode(max_workers=3)
+        shared = {}
+        node.prep = lambda shared: list(range(10))
+        node.run(shared)
+        self.assertEqual(shared["results"], [n * 10 for n in range(10)])
+        self.assertNotEqual(node.finished, sorted(node.finished)) # Items really finished out of order
+        self.assertEqual(node.peak, 3)
+
+class MarkerNode(ParallelBatchNode):
+    """Each item leaves a file in its directory while it runs and returns how many it saw, its own included."""
+    def exec(self, item):
+        directory, name = item
+        marker = os.path.join(directory, str(name))
+        open(marker, "w").close()
+        running = len(os.listdir(directory))
+        time.sleep(0.05)
+        os.remove(marker)
+        return running
+
+class TestExecutors(unittest.TestCase):
+
+    def peak(self, executor, max_workers, items=8):
+        with tempfile.TemporaryDirectory() as directory:
+            node = MarkerNode(max_workers=max_workers)
+            node.executor = executor
+            return max(node._exec_items([(directory, i) for i in range(items)]))
+
+    def test_max_workers_bounds_every_executor(self):
+        self.assertEqual(self.peak("inline", 3), 3)
+        self.assertEqual(self.peak("thread", 3), 3) # The shared thread pool has 32 workers
+        self.assertEqual(self.peak("thread", 1), 1)
+
+        shutdown_executors()
+        self.addCleanup(shutdown_executors)
+        with mock.patch.dict(os.environ, {"FLOW_PROCESS_WORKERS": "4"}):
+            self.assertLessEqual(self.peak("process", 2), 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,68 +1,272 @@
+import asyncio
+import copy
+import json
 import os
-import google.generativeai as genai
+import time
+from contextlib import asynccontextmanager, contextmanager
+from utils.llm_cache import get_default_cache, cache_enabled, make_cache_key
+from utils.llm_errors import LLMError, RetryableLLMError, RateLimitError, EmptyResponseError, is_retryable_llm_error
+from utils.llm_providers import get_provider, DEFAULT_SYSTEM_MESSAGE
+from utils.token_usage import get_usage_tracker, estimate_tokens
+from utils.rate_limiter import AdaptiveConcurrency, get_rate_limiter, rate_limiter_stats
+from utils.singleflight import SingleFlight
+from utils.structured_output import parse_structured, StructuredOutputError, REASK_SYSTEM_MESSAGE
+
+# Process-wide cap on concurrent LLM requests, shared by every flow, thread and event loop.
+# Configured with LLM_MAX_CONCURRENCY or set_llm_concurrency(); cache hits don't count.
+# It halves on rate-limit errors and climbs back to the configured maximum as requests succeed.
+# Requests also wait for their model's RPM/TPM budget first (LLM_RPM, LLM_TPM, LLM_RATE_LIMITS;
+# see utils/rate_limiter.py), so a burst of topics or videos is spread out instead of rejected.
+_llm_governor = AdaptiveConcurrency(int(os.getenv("LLM_MAX_CONCURRENCY", "8")))
+
+def set_llm_concurrency(limit: int):
+    """Set the maximum number of LLM requests in flight across the whole process."""
+    global _llm_governor
+    _llm_governor = AdaptiveConcurrency(limit)
+
+@contextmanager
+def _llm_slot(model_name: str, prompt_tokens: int, usage: dict, response_chunks: list):
+    # Waits for the model's rate budget, then for a concurrency slot, and reports the outcome to both
+    limiter = get_rate_limiter(model_name)
+    limiter.acquire(prompt_tokens)
+    governor = _llm_governor
+    governor.acquire()
+    try:
+        yield
+    except RateLimitError:
+        governor.on_rate_limited()
+        raise
+    else:
+        governor.on_success()
+        limiter.settle(prompt_tokens, _used_tokens(usage, prompt_tokens, response_chunks))
+    finally:
+        governor.release()
+
+@asynccontextmanager
+async def _llm_slot_async(model_name: str, prompt_tokens: int, usage: dict, response_chunks: list):
+    limiter = get_rate_limiter(model_name)
+    await limiter.acquire_async(prompt_tokens)
+    governor = _llm_governor
+    await governor.acquire_async()
+    try:
+        yield
+    except RateLimitError:
+        governor.on_rate_limited()
+        raise
+    else:
+        governor.on_success()
+        limiter.settle(prompt_tokens, _used_tokens(usage, prompt_tokens, response_chunks))
+    finally:
+        governor.release()
+
+def _used_tokens(usage: dict, prompt_tokens: int, response_chunks: list) -> int:
+    # Reported usage where the provider gives it, estimates otherwise
+    return usage.get("input_tokens", prompt_tokens) + usage.get("output_tokens", estimate_tokens("".join(response_chunks)))
+
+# Identical requests in flight at the same time (same provider, model, system message, prompt
+# and schema) are sent once; the other callers, threads or tasks, share the response.
+# Followers get their own copy, since structured results are mutable.
+_llm_flight = SingleFlight(clone=copy.deepcopy)
+
+_MISS = object()
+
+def _cached_result(cache, cache_key, response_schema, tracker, caller, model_name, prompt):
+    # The cached result for cache_key, or _MISS
+    cached_response = cache.get(cache_key)
+    if cached_response is None:
+        return _MISS
+    tracker.record(caller, model_name, prompt, cached_response, cached=True)
+    if response_schema is None:
+        return cached_response
+    try:
+        return parse_structured(cached_response, response_schema)
+    except StructuredOutputError:
+        return _MISS # Cached before the schema changed; ask again
+
+def _record_coalesced(tracker, caller, model_name, prompt, result):
+    # A caller that shared another caller's request used no tokens of its own, like a cache hit
+    response_text = result if isinstance(result, str) else json.dumps(result, ensure_ascii=False)
+    tracker.record(caller, model_name, prompt, response_text, cached=True)
 
 # Learn more about calling the LLM: https://the-pocket.github.io/PocketFlow/utility_function/llm.html
-def call_llm(prompt: str, system_message: str = "You are a helpful assistant.", model_name: str = "gemini-2.5-flash-preview-04-17"):
+def call_llm(prompt: str, system_message: str = DEFAULT_SYSTEM_MESSAGE, model_name: str = None, use_cache: bool = True, provider: str = None, caller: str = None, response_schema: dict = None):
     """
-    Calls a Large Language Model, currently configured for Gemini.
-    Uses the GOOGLE_API_KEY environment variable.
-    The system_message for Gemini is typically handled by forming a specific prompt structure
-    or using the system_instruction parameter if available for the chosen model/method.
-    For basic text generation with gemini-flash, we can prepend the system message to the user prompt.
+    Calls a Large Language Model through the configured provider (see utils/llm_providers.py):
+    LLM_PROVIDER selects gemini, openai (or any OpenAI-compatible endpoint), anthropic or
+    the local stub; LLM_MODEL overrides the provider's default model.
+    Failures raise LLMError; transient ones (rate limits, timeouts, 5xx) raise
+    RetryableLLMError so the calling node can retry with backoff.
+    Successful responses are stored in a persistent cache keyed on
+    (model_name, system_message, prompt, response_schema); pass use_cache=False or set
+    LLM_CACHE_DISABLE=1 to bypass it.
+    Concurrent identical calls are coalesced into one request, unless use_cache=False.
+    Token usage is recorded in utils.token_usage under `caller` (usually the node name).
+
+    With a `response_schema` (JSON Schema subset, see utils.structured_output.validate) the
+    provider's native JSON mode is used where available and the parsed, validated value is
+    returned instead of text. A malformed or invalid response gets one targeted re-ask;
+    if that fails too StructuredOutputError is raised and nothing is cached.
     """
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        print("Error: GOOGLE_API_KEY environment variable not found.")
-        print("Please set it to your Google API key for Gemini.")
-        print("Returning placeholder response.")
-        # Fallback to placeholder if API key is missing
-        if "extract topics" in prompt.lower():
-            return "Placeholder Topics: Topic 1, Topic 2, Topic 3, Topic 4, Topic 5"
-        elif "generate questions" in prompt.lower():
-            return "Placeholder Questions: Question 1?, Question 2?, Question 3?"
-        # ... (keep other placeholder conditions if needed or remove them)
-        return "Placeholder LLM Response due to missing API key"
+    llm_provider = get_provider(provider)
+    model_name = model_name or os.getenv("LLM_MODEL") or llm_provider.default_model
+    tracker = get_usage_tracker()
 
-    try:
-        genai.configure(api_key=api_key)
-        
-        # For Gemini, system messages can be part of the prompt or a specific parameter.
-        # Here, we prepend the system message to the main prompt for simplicity with generate_content.
-        # More complex scenarios (e.g. chat) might use `start_chat` with history including roles.
-        
-        # Note: Gemini API's `generate_content` can take `system_instruction` for some models.
-        # Let's assume we are using a model and method where prepending is fine for now.
-        # Effective system message handling depends on the exact Gemini model and client usage.
-        
-        full_prompt = []
-        if system_message and system_message != "You are a helpful assistant.": # Avoid default if not meaningful
-            # Gemini prefers a structured format for messages if using a chat-like model
-            # For a simple generation, we might just prepend.
-            # If the model supports system_instruction, that would be better.
-            # For now, let's assume it's a general text model and prepend to user prompt.
-            # A more robust solution would involve checking model capabilities for system instructions.
-            full_prompt.append(system_message) # Or format as a specific role if using a chat model
-        
-        full_prompt.append(prompt)
-        
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content(full_prompt)
-        
-        if response.parts:
-            return response.text
-        else:
-            # Handle cases where the response might be empty or blocked
-            print(f"Warning: Gemini response was empty or potentially blocked. Block reason: {response.prompt_feedback.block_reason if response.prompt_feedback else 'N/A'}")
-            safety_ratings_str = ", ".join([f"{rating.category}: {rating.probability}" for rating in response.prompt_feedback.safety_ratings]) if response.prompt_feedback else "N/A"
-            print(f"Safety ratings: {safety_ratings_str}")
-            return "Error or empty response from LLM. Check logs."
-
-    except Exception as e:
-        print(f"Error calling Gemini: {e}")
-        return "Error during LLM call. Check logs."
+    cache = get_default_cache() if use_cache and llm_provider.cacheable and cache_enabled() else None
+    cache_key = make_cache_key(model_name, system_message, prompt, response_schema)
+    if cache is not None:
+        result = _cached_result(cache, cache_key, response_schema, tracker, caller, model_name, prompt)
+        if result is not _MISS:
+            return result
+
+    def request():
+        usage, response_chunks = {}, []
+        with _llm_slot(model_name, estimate_tokens((system_message or "") + prompt), usage, response_chunks):
+            start_time = time.perf_counter()
+            response_text = llm_provider.generate(prompt, system_message, model_name, usage, response_schema)
+            latency = time.perf_counter() - start_time
+            response_chunks.append(response_text)
+        tracker.record(caller, model_name, (system_message or "") + prompt, response_text, usage, latency)
+
+        result = response_text
+        if response_schema is not None:
+            def reask(fix_prompt):
+                return call_llm(fix_prompt, system_message=REASK_SYSTEM_MESSAGE, model_name=model_name,
+                                use_cache=use_cache, provider=provider, caller=caller)
+            result = parse_structured(response_text, response_schema, reask=reask)
+            # Cache the repaired value as plain JSON so a hit takes the fast path
+            response_text = json.dumps(result, ensure_ascii=False)
+
+        if cache is not None:
+            cache.set(cache_key, response_text, model_name=model_name)
+        return result
+
+    if not use_cache:
+        return request()
+
+    def lead():
+        # An identical call that completed just before this one has filled the cache
+        if cache is not None:
+            result = _cached_result(cache, cache_key, response_schema, tracker, caller, model_name, prompt)
+            if result is not _MISS:
+                return result
+        return request()
+
+    result, leader = _llm_flight.do((llm_provider.name, cache_key), lead)
+    if not leader:
+        _record_coalesced(tracker, caller, model_name, prompt, result)
+    return result
+
+async def call_llm_async(prompt: str, system_message: str = DEFAULT_SYSTEM_MESSAGE, model_name: str = None, use_cache: bool = True, provider: str = None, caller: str = None, response_schema: dict = None):
+    """
+    Coroutine version of call_llm for AsyncNodes: same cache, coalescing, usage tracking, errors
+    and structured output, but it waits for the provider without holding a thread. Requests in
+    flight count against the same process-wide concurrency and rate limits as call_llm, and
+    identical sync and async calls share one request.
+    A response that needs a re-ask is repaired in a worker thread with the synchronous call_llm.
+    """
+    llm_provider = get_provider(provider)
+    model_name = model_name or os.getenv("LLM_MODEL") or llm_provider.default_model
+    tracker = get_usage_tracker()
+
+    cache = get_default_cache() if use_cache and llm_provider.cacheable and cache_enabled() else None
+    cache_key = make_cache_key(model_name, system_message, prompt, response_schema)
+    if cache is not None:
+        result = _cached_result(cache, cache_key, response_schema, tracker, caller, model_name, prompt)
+        if result is not _MISS:
+            return result
+
+    async def request():
+        usage, response_chunks = {}, []
+        async with _llm_slot_async(model_name, estimate_tokens((system_message or "") + prompt), usage, response_chunks):
+            start_time = time.perf_counter()
+            response_text = await llm_provider.generate_async(prompt, system_message, model_name, usage, response_schema)
+            latency = time.perf_counter() - start_time
+            response_chunks.append(response_text)
+        tracker.record(caller, model_name, (system_message or "") + prompt, response_text, usage, latency)
+
+        result = response_text
+        if response_schema is not None:
+            try:
+                result = parse_structured(response_text, response_schema)
+            except StructuredOutputError:
+                def reask(fix_prompt):
+                    return call_llm(fix_prompt, system_message=REASK_SYSTEM_MESSAGE, model_name=model_name,
+                                    use_cache=use_cache, provider=provider, caller=caller)
+                result = await asyncio.to_thread(parse_structured, response_text, response_schema, reask)
+            response_text = json.dumps(result, ensure_ascii=False)
+
+        if cache is not None:
+            cache.set(cache_key, response_text, model_name=model_name)
+        return result
+
+    if not use_cache:
+        return await request()
+
+    async def lead():
+        if cache is not None:
+            result = _cached_result(cache, cache_key, response_schema, tracker, caller, model_name, prompt)
+            if result is not _MISS:
+                return result
+        return await request()
+
+    result, leader = await _llm_flight.do_async((llm_provider.name, cache_key), lead)
+    if not leader:
+        _record_coalesced(tracker, caller, model_name, prompt, result)
+    return result
+
+def call_llm_stream(prompt: str, system_message: str = DEFAULT_SYSTEM_MESSAGE, model_name: str = None, use_cache: bool = True, provider: str = None, caller: str = None, response_schema: dict = None):
+    """
+    Streaming variant of call_llm: yields the response text in chunks as they arrive.
+    A cache hit is yielded as a single chunk; a fully streamed response is cached
+    like a call_llm result. The request counts against the global LLM concurrency
+    limit until the stream is exhausted or closed; its usage is recorded once it completes.
+    A `response_schema` only selects the provider's JSON mode: the chunks are still text,
+    to be parsed incrementally (utils.stream_parser) and validated by the caller. Such a
+    response is only cached if it parses and matches the schema as a whole.
+    """
+    llm_provider = get_provider(provider)
+    model_name = model_name or os.getenv("LLM_MODEL") or llm_provider.default_model
+    tracker = get_usage_tracker()
+
+    cache = get_default_cache() if use_cache and llm_provider.cacheable and cache_enabled() else None
+    cache_key = None
+    if cache is not None:
+        cache_key = make_cache_key(model_name, system_message, prompt, response_schema)
+        cached_response = cache.get(cache_key)
+        if cached_response is not None:
+            tracker.record(caller, model_name, prompt, cached_response, cached=True)
+            yield cached_response
+            return
+
+    chunks = []
+    usage = {}
+    with _llm_slot(model_name, estimate_tokens((system_message or "") + prompt), usage, chunks):
+        start_time = time.perf_counter()
+        for chunk in llm_provider.stream(prompt, system_message, model_name, usage, response_schema):
+            chunks.append(chunk)
+            yield chunk
+        latency = time.perf_counter() - start_time
+    response_text = "".join(chunks)
+    tracker.record(caller, model_name, (system_message or "") + prompt, response_text, usage, latency)
+
+    if cache is not None:
+        if response_schema is not None:
+            try:
+                parse_structured(response_text, response_schema)
+            except StructuredOutputError:
+                return # Never cache a response the caller has to repair or re-ask for
+        cache.set(cache_key, response_text, model_name=model_name)
+
+def get_llm_client_stats() -> dict:
+    """Client reuse and call counters of the active provider, and how many calls were coalesced."""
+    return dict(get_provider().stats(), coalescing=_llm_flight.stats())
+
+def get_rate_limit_stats() -> dict:
+    """Adaptive concurrency (limit, queue depth, wait times, rate-limit errors) and per-model RPM/TPM limiter metrics."""
+    return {"concurrency": _llm_governor.stats(), "models": rate_limiter_stats()}
 
 if __name__ == "__main__":
-    print("Testing call_llm with Gemini (ensure GOOGLE_API_KEY is set):")
+    print("Testing call_llm with the configured provider (LLM_PROVIDER, default Gemini when GOOGLE_API_KEY is set):")
     
     # Test 1: Simple question
     # print("\nTest 1: Simple Question")
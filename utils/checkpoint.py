@@ -0,0 +1,69 @@
+import json
+import logging
+import os
+import re
+import tempfile
+
+DEFAULT_CHECKPOINT_DIR = os.path.join(".cache", "checkpoints")
+
+logger = logging.getLogger(__name__)
+
+
+class FileCheckpointer:
+    """
+    Durable storage for one flow run's checkpoint (see pocketflow.Flow.enable_checkpoints).
+    Every save is written as compact JSON to a temp file, fsynced and renamed over the
+    previous checkpoint, so a crash at any point leaves either the old or the new state.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self):
+        """The last saved state, or None if there is none (or it cannot be read)."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable checkpoint %s: %s", self.path, e)
+            return None
+
+    def save(self, state: dict):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False, separators=(",", ":"), default=str)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        # Make the rename itself durable
+        if hasattr(os, "O_DIRECTORY"):
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+
+def checkpointer_for(video_id: str, directory: str = None) -> FileCheckpointer:
+    """Checkpoint file for one video under CHECKPOINT_DIR (default .cache/checkpoints)."""
+    directory = directory or os.getenv("CHECKPOINT_DIR", DEFAULT_CHECKPOINT_DIR)
+    safe_id = re.sub(r'[^0-9A-Za-z_-]', '_', video_id)
+    return FileCheckpointer(os.path.join(directory, f"{safe_id}.json"))
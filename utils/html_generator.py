@@ -1,175 +1,150 @@
-def generate_html_report(video_info: dict, topics_data: list) -> str:
-    """Generates an HTML report from video info and processed topics data with improved styling."""
-    print("Generating HTML report with improved styling...")
-    
-    # Extract values and provide defaults
-    video_title_val = video_info.get("title", "YouTube Video Summary")
-    thumbnail_url_val = video_info.get("thumbnail_url", "")
-    video_url_val = video_info.get("url", "#")
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+def _read_template(name: str) -> str:
+    with open(os.path.join(TEMPLATES_DIR, name), "r", encoding="utf-8") as f:
+        return f.read()
 
-    # Pre-generate thumbnail HTML string using an f-string separately
-    # This keeps f-string logic isolated from the main template's .format() method
-    thumbnail_html_content = ""
-    if thumbnail_url_val:
-        thumbnail_html_content = f'<img src="{thumbnail_url_val}" alt="Video Thumbnail" class="thumbnail">'
+# The stylesheet is kept in its own file and inlined once here, so every report stays self-contained
+REPORT_CSS = _read_template("report.css")
 
-    # --- Generate HTML for topics ---
-    topics_html_parts = []
+def _compile_page(template: str, static: dict) -> list:
+    """
+    Split a template with {name} placeholders into [(literal, field)] pairs, the last field
+    being None. Placeholders found in `static` are filled in now and merged into the literals.
+    """
+    parts = re.split(r"\{(\w+)\}", template)
+    compiled, literal = [], parts[0]
+    for field, text in zip(parts[1::2], parts[2::2]):
+        if field in static:
+            literal += static[field] + text
+        else:
+            compiled.append((literal, field))
+            literal = text
+    compiled.append((literal, None))
+    return compiled
+
+# Loaded and compiled once at import; the trailing newline of the file is not part of the page
+_PAGE = _compile_page(_read_template("report.html").rstrip("\n"), {"css": REPORT_CSS})
+
+_NO_TOPICS_HTML = "<p class=\"no-content\">No topics were extracted or processed for this video.</p>"
+_NO_QUESTIONS_HTML = "<p class=\"no-content\">No questions available for this topic.</p>"
+
+def _iter_topics_html(topics_data: list):
     if not topics_data:
-        topics_html_parts.append("<p class=\"no-content\">No topics were extracted or processed for this video.</p>")
-    else:
-        for topic_idx, topic in enumerate(topics_data):
-            rephrased_topic_title = topic.get("rephrased_title") or topic.get("title", f"Unnamed Topic {topic_idx + 1}")
-            
-            topic_content = f"""<section class="topic-block">
+        yield _NO_TOPICS_HTML
+        return
+    for topic_idx, topic in enumerate(topics_data):
+        rephrased_topic_title = topic.get("rephrased_title") or topic.get("title", f"Unnamed Topic {topic_idx + 1}")
+        if topic_idx:
+            yield "\n"
+        yield f"""<section class="topic-block">
             <h3>{rephrased_topic_title}</h3>"""
 
-            if not topic.get("questions"):
-                topic_content += "<p class=\"no-content\">No questions available for this topic.</p>"
-            else:
-                for q_idx, q_and_a in enumerate(topic.get("questions", [])):
-                    rephrased_question = q_and_a.get("rephrased") or q_and_a.get("original", f"Question {q_idx + 1} not available")
-                    # The answer from LLM is expected to be HTML already
-                    eli5_answer_html = q_and_a.get("answer", "<p><i>Answer not available.</i></p>")
-                    
-                    topic_content += f"""<article class="question-block">
+        if not topic.get("questions"):
+            yield _NO_QUESTIONS_HTML
+        else:
+            for q_idx, q_and_a in enumerate(topic.get("questions", [])):
+                rephrased_question = q_and_a.get("rephrased") or q_and_a.get("original", f"Question {q_idx + 1} not available")
+                # The answer from LLM is expected to be HTML already
+                eli5_answer_html = q_and_a.get("answer", "<p><i>Answer not available.</i></p>")
+                yield f"""<article class="question-block">
                         <strong class="question-text">{rephrased_question}</strong>
                         <div class="answer-text">
                             {eli5_answer_html}
                         </div>
                     </article>"""
-            topic_content += "</section>"
-            topics_html_parts.append(topic_content)
-    
-    topics_final_html = "\n".join(topics_html_parts)
-
-    # --- HTML Template (This is NOT an f-string) ---
-    # All CSS curly braces are escaped with {{ and }} for the .format() method.
-    # Dynamic parts use named placeholders like {v_title_placeholder}.
-    html_template = """<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{v_title_placeholder} - ELI5 Summary</title>
-    <style>
-        body {{
-            font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, Helvetica, Arial, sans-serif;
-            margin: 0;
-            padding: 0;
-            background-color: #f8f9fa;
-            color: #212529;
-            line-height: 1.6;
-        }}
-        .generated-by {{
-            font-size: 0.8em;
-            color: #6c757d;
-            text-align: right;
-            padding: 10px 20px;
-            background-color: #e9ecef;
-        }}
-        .container {{
-            max-width: 800px;
-            margin: 20px auto;
-            padding: 20px;
-            background-color: #fff;
-            border-radius: 8px;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.075);
-        }}
-        .video-header h1 {{
-            font-size: 2.2em;
-            color: #343a40;
-            margin-bottom: 10px;
-            font-weight: 600;
-        }}
-        .video-header .thumbnail {{
-            width: 100%;
-            max-width: 480px; /* Control thumbnail size */
-            height: auto;
-            border-radius: 6px;
-            margin-bottom: 25px;
-            display: block;
-            margin-left: auto;
-            margin-right: auto;
-        }}
-        .section-title {{
-            font-size: 1.8em;
-            color: #007bff; /* Primary color for main section titles */
-            margin-top: 30px;
-            margin-bottom: 15px;
-            padding-bottom: 10px;
-            border-bottom: 2px solid #dee2e6;
-            font-weight: 500;
-        }}
-        .topic-block {{
-            margin-bottom: 30px;
-            padding: 20px;
-            background-color: #fdfdff; /* Slightly off-white for topics */
-            border: 1px solid #e9ecef;
-            border-radius: 6px;
-        }}
-        .topic-block h3 {{ /* Rephrased Topic Title */
-            font-size: 1.5em;
-            color: #28a745; /* Success/Green for topic titles */
-            margin-top: 0;
-            margin-bottom: 15px;
-            font-weight: 500;
-        }}
-        .question-block {{
-            margin-bottom: 15px;
-            padding-left: 15px;
-            border-left: 3px solid #17a2b8; /* Info/Blue accent for questions */
-        }}
-        .question-block strong.question-text {{ /* Rephrased Question */
-            font-size: 1.15em;
-            color: #343a40;
-            display: block;
-            margin-bottom: 8px;
-            font-weight: 500;
-        }}
-        .answer-text {{ /* ELI5 Answer */
-            font-size: 1em;
-            color: #495057;
-            padding-left: 10px; /* Indent answer slightly */
-        }}
-        .answer-text p, .answer-text ol, .answer-text ul {{
-            margin-top: 5px; 
-            margin-bottom: 10px;
-        }}
-        .answer-text b {{ color: #dc3545; }}
-        .answer-text i {{ color: #666; }}
-        .no-content {{
-            text-align: center;
-            color: #6c757d;
-            font-style: italic;
-            padding: 20px;
-        }}
-        a {{ color: #007bff; text-decoration: none; }}
-        a:hover {{ text-decoration: underline; }}
-    </style>
-</head>
-<body>
-    <div class="generated-by">Generated by <a href="{v_url_placeholder}" target="_blank">YouTube Made Simple</a></div>
-    <div class="container">
-        <header class="video-header">
-            <h1>{v_title_placeholder}</h1>
-            {thumbnail_html_placeholder}
-        </header>
-
-        <h2 class="section-title">ELI5 Summary: Key Topics & Questions</h2>
-        {topics_html_placeholder}
-    </div>
-</body>
-</html>"""
-    
-    # Use .format() to insert the dynamic content into the template
-    final_html = html_template.format(
-        v_title_placeholder=video_title_val,
-        v_url_placeholder=video_url_val,
-        thumbnail_html_placeholder=thumbnail_html_content,
-        topics_html_placeholder=topics_final_html
-    )
-    return final_html
+        yield "</section>"
+
+def iter_html_report(video_info: dict, topics_data: list):
+    """Yield the HTML report in chunks: the static page parts and one or a few chunks per topic and question."""
+    thumbnail_url_val = video_info.get("thumbnail_url", "")
+    values = {
+        "title": video_info.get("title", "YouTube Video Summary"),
+        "url": video_info.get("url", "#"),
+        "thumbnail": f'<img src="{thumbnail_url_val}" alt="Video Thumbnail" class="thumbnail">' if thumbnail_url_val else "",
+    }
+    for literal, field in _PAGE:
+        yield literal
+        if field == "topics":
+            yield from _iter_topics_html(topics_data)
+        elif field is not None:
+            yield values[field]
+
+def render_html_report(video_info: dict, topics_data: list, out) -> None:
+    """Write the HTML report to `out` (any object with write(), e.g. an open file or io.StringIO)."""
+    for chunk in iter_html_report(video_info, topics_data):
+        out.write(chunk)
+
+def generate_html_report(video_info: dict, topics_data: list) -> str:
+    """Generates an HTML report from video info and processed topics data with improved styling."""
+    logger.debug("Generating HTML report with improved styling...")
+    buffer = io.StringIO()
+    render_html_report(video_info, topics_data, buffer)
+    return buffer.getvalue()
+
+def _atomic_write(path: str, write) -> None:
+    # Unique per thread, so concurrent writers of the same file don't share a temp file
+    tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def write_html_report(video_info: dict, topics_data: list, path: str) -> None:
+    """
+    Stream the HTML report straight to `path` without building it in memory. It is written to a
+    temp file that replaces `path` at the end, so a crash never leaves a half-written report.
+    """
+    _atomic_write(path, lambda f: render_html_report(video_info, topics_data, f))
+
+# Video info fields the report does not use; the transcript is kept in the transcript store instead
+_ARTIFACT_SKIP_FIELDS = ("transcript", "segments")
+
+def artifact_path_for(report_path: str) -> str:
+    """The JSON artifact stored next to a report: examples/<name>.html -> examples/<name>.json."""
+    return os.path.splitext(report_path)[0] + ".json"
+
+def save_report_artifact(video_info: dict, topics_data: list, path: str) -> None:
+    """Persist the inputs of a report so it can be re-rendered later without the LLM stages."""
+    artifact = {
+        "video_info": {k: v for k, v in video_info.items() if k not in _ARTIFACT_SKIP_FIELDS},
+        "topics": topics_data,
+    }
+    _atomic_write(path, lambda f: json.dump(artifact, f, ensure_ascii=False, indent=2))
+
+def load_report_artifact(path: str):
+    """(video_info, topics_data) from a report artifact. Raises ValueError if the file is not one."""
+    with open(path, "r", encoding="utf-8") as f:
+        artifact = json.load(f)
+    if not (isinstance(artifact, dict) and isinstance(artifact.get("video_info"), dict)
+            and isinstance(artifact.get("topics"), list)):
+        raise ValueError(f"{path} is not a report artifact")
+    return artifact["video_info"], artifact["topics"]
+
+def _compute_template_hash() -> str:
+    # The page template, the stylesheet and the markup produced by this module all shape the output
+    digest = hashlib.sha256()
+    for path in (os.path.join(TEMPLATES_DIR, "report.html"), os.path.join(TEMPLATES_DIR, "report.css"), os.path.abspath(__file__)):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+# Changes whenever the rendered output may change; see rerender.py
+TEMPLATE_HASH = _compute_template_hash()
 
 if __name__ == "__main__":
     # Dummy data for testing the new HTML structure
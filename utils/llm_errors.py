@@ -0,0 +1,15 @@
+class LLMError(Exception):
+    """An LLM call failed in a way that retrying the same request won't fix."""
+
+class RetryableLLMError(LLMError):
+    """A transient LLM failure (timeouts, 5xx, connection errors); the same request may succeed later."""
+
+class RateLimitError(RetryableLLMError):
+    """The provider rejected the request because of rate limits or quota (HTTP 429 / ResourceExhausted)."""
+
+class EmptyResponseError(LLMError):
+    """The model returned no content, e.g. because the prompt or response was blocked."""
+
+def is_retryable_llm_error(exc: Exception) -> bool:
+    """Retry-on predicate for nodes that call the LLM."""
+    return isinstance(exc, RetryableLLMError)
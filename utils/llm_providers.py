@@ -0,0 +1,604 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import weakref
+from collections import Counter
+
+from utils.llm_errors import LLMError, RetryableLLMError, RateLimitError, EmptyResponseError
+
+DEFAULT_SYSTEM_MESSAGE = "You are a helpful assistant."
+
+logger = logging.getLogger(__name__)
+
+
+class LLMProvider:
+    """
+    A backend that turns (prompt, system_message, model_name) into response text.
+    Implementations raise the typed errors from utils.llm_errors so callers can
+    tell transient failures (RetryableLLMError) from permanent ones (LLMError).
+    When the API reports token usage, it is written into the optional `usage` dict
+    as {"input_tokens": int, "output_tokens": int}.
+    With a `response_schema` (JSON Schema subset, see utils.structured_output.validate) the
+    response should be JSON; providers with a native JSON / structured-output mode use it,
+    the others rely on the prompt. call_llm validates the result either way.
+    generate_async is the coroutine version used by call_llm_async; providers with an async
+    SDK client implement it natively, the others run generate in a worker thread.
+    """
+    name = ""
+    default_model = ""
+    cacheable = True # Whether call_llm may store this provider's responses in the response cache
+
+    def generate(self, prompt: str, system_message: str, model_name: str, usage: dict = None, response_schema: dict = None) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, system_message: str, model_name: str, usage: dict = None, response_schema: dict = None):
+        """Yield the response in text chunks as they arrive. Providers without streaming yield it whole."""
+        yield self.generate(prompt, system_message, model_name, usage, response_schema)
+
+    async def generate_async(self, prompt: str, system_message: str, model_name: str, usage: dict = None, response_schema: dict = None) -> str:
+        return await asyncio.to_thread(self.generate, prompt, system_message, model_name, usage, response_schema)
+
+    def stats(self) -> dict:
+        return {"provider": self.name}
+
+
+class GeminiProvider(LLMProvider):
+    """
+    Google Gemini via google-generativeai, using GOOGLE_API_KEY.
+    Model objects are kept in a thread-safe registry keyed by (model_name, system_instruction);
+    genai.configure() runs once per API key and the client is shared by every thread.
+    generate_async uses the thread-pool default: the SDK's grpc.aio client is bound to the
+    event loop that created it, which doesn't fit the shared, cached model objects.
+    """
+    name = "gemini"
+    default_model = "gemini-2.5-flash-preview-04-17"
+
+    def __init__(self, api_key: str = None):
+        self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
+        self._models = {}
+        self._lock = threading.Lock()
+        self._configured_key = None
+        self._stats = {"configures": 0, "models_created": 0, "model_reuses": 0}
+
+    def _get_model(self, model_name: str, system_instruction: str = None):
+        import google.generativeai as genai
+        key = (model_name, system_instruction)
+        with self._lock:
+            if self._configured_key != self.api_key:
+                genai.configure(api_key=self.api_key)
+                self._configured_key = self.api_key
+                self._models.clear() # Models built with the old key must not be reused
+                self._stats["configures"] += 1
+            model = self._models.get(key)
+            if model is None:
+                model = genai.GenerativeModel(model_name, system_instruction=system_instruction)
+                self._models[key] = model
+                self._stats["models_created"] += 1
+            else:
+                self._stats["model_reuses"] += 1
+            return model
+
+    def _model_for(self, system_message, model_name):
+        if not self.api_key:
+            raise LLMError("GOOGLE_API_KEY environment variable not found")
+        # The system message goes in the model's native system_instruction rather than being
+        # prepended to the prompt; the generic default adds nothing, so it is left out.
+        system_instruction = None
+        if system_message and system_message != DEFAULT_SYSTEM_MESSAGE:
+            system_instruction = system_message
+        return self._get_model(model_name, system_instruction)
+
+    # Schema keywords Gemini's response_schema accepts; validation-only ones (minLength, ...) are dropped
+    _SCHEMA_KEYS = ("type", "properties", "required", "items", "enum", "description")
+
+    @classmethod
+    def _gemini_schema(cls, schema: dict) -> dict:
+        converted = {k: v for k, v in schema.items() if k in cls._SCHEMA_KEYS}
+        if "properties" in converted:
+            converted["properties"] = {k: cls._gemini_schema(v) for k, v in converted["properties"].items()}
+        if "items" in converted:
+            converted["items"] = cls._gemini_schema(converted["items"])
+        return converted
+
+    @classmethod
+    def _generation_config(cls, response_schema):
+        if response_schema is None:
+            return None
+        return {"response_mime_type": "application/json", "response_schema": cls._gemini_schema(response_schema)}
+
+    @staticmethod
+    def _record_usage(response, usage):
+        metadata = getattr(response, "usage_metadata", None)
+        if usage is not None and metadata is not None and metadata.prompt_token_count:
+            usage["input_tokens"] = metadata.prompt_token_count
+            usage["output_tokens"] = metadata.candidates_token_count or 0
+
+    def stream(self, prompt, system_message, model_name, usage=None, response_schema=None):
+        model = self._model_for(system_message, model_name)
+        produced = False
+        try:
+            for chunk in model.generate_content(prompt, stream=True, generation_config=self._generation_config(response_schema)):
+                self._record_usage(chunk, usage) # The last chunk carries the totals
+                if chunk.parts:
+                    produced = True
+                    yield chunk.text
+        except Exception as e:
+            logger.warning("Error calling Gemini: %s", e)
+            raise self._classify_error(e) from e
+        if not produced:
+            raise EmptyResponseError("Gemini returned an empty or blocked response")
+
+    def generate(self, prompt, system_message, model_name, usage=None, response_schema=None):
+        model = self._model_for(system_message, model_name)
+        try:
+            response = model.generate_content(prompt, generation_config=self._generation_config(response_schema))
+        except Exception as e:
+            logger.warning("Error calling Gemini: %s", e)
+            raise self._classify_error(e) from e
+        self._record_usage(response, usage)
+
+        if response.parts:
+            return response.text
+
+        # Handle cases where the response might be empty or blocked
+        logger.warning("Gemini response was empty or potentially blocked. Block reason: %s",
+                       response.prompt_feedback.block_reason if response.prompt_feedback else "N/A")
+        if logger.isEnabledFor(logging.DEBUG):
+            safety_ratings_str = ", ".join([f"{rating.category}: {rating.probability}" for rating in response.prompt_feedback.safety_ratings]) if response.prompt_feedback else "N/A"
+            logger.debug("Safety ratings: %s", safety_ratings_str)
+        raise EmptyResponseError("Gemini returned an empty or blocked response")
+
+    @staticmethod
+    def _classify_error(e: Exception) -> LLMError:
+        try:
+            from google.api_core import exceptions as google_exceptions
+            if isinstance(e, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+                return RateLimitError(str(e))
+            if isinstance(e, (google_exceptions.ServiceUnavailable, google_exceptions.DeadlineExceeded,
+                              google_exceptions.InternalServerError, google_exceptions.GatewayTimeout,
+                              google_exceptions.Aborted)):
+                return RetryableLLMError(str(e))
+        except ImportError:
+            pass
+        return _classify_generic_error(e)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, provider=self.name, cached_models=len(self._models))
+
+
+class OpenAIProvider(LLMProvider):
+    """
+    OpenAI or any OpenAI-compatible endpoint (vLLM, Ollama, OpenRouter, ...).
+    Uses OPENAI_API_KEY and, for compatible servers, OPENAI_BASE_URL.
+    """
+    name = "openai"
+    default_model = "gpt-4o-mini"
+
+    def __init__(self, api_key: str = None, base_url: str = None):
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL")
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary() # Event loop -> AsyncOpenAI
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        with self._lock:
+            if self._client is None:
+                from openai import OpenAI
+                self._client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+            return self._client
+
+    def _get_async_client(self):
+        # Async HTTP connections belong to one event loop, so each loop gets its own client
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                from openai import AsyncOpenAI
+                client = self._async_clients[loop] = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+            return client
+
+    @staticmethod
+    def _messages(prompt, system_message):
+        messages = []
+        if system_message:
+            messages.append({"role": "system", "content": system_message})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def _response_format(self, response_schema):
+        if response_schema is None:
+            return {}
+        if self.base_url:
+            # Compatible servers support plain JSON mode far more widely than json_schema
+            return {"response_format": {"type": "json_object"}}
+        # Not strict: strict mode would require additionalProperties=false and every property to be required
+        return {"response_format": {"type": "json_schema",
+                                    "json_schema": {"name": "response", "schema": response_schema, "strict": False}}}
+
+    @staticmethod
+    def _record_usage(response, usage):
+        if usage is not None and getattr(response, "usage", None) is not None:
+            usage["input_tokens"] = response.usage.prompt_tokens
+            usage["output_tokens"] = response.usage.completion_tokens
+
+    def stream(self, prompt, system_message, model_name, usage=None, response_schema=None):
+        produced = False
+        kwargs = self._response_format(response_schema)
+        if not self.base_url:
+            # Compatible servers don't all accept stream_options, so only ask OpenAI itself
+            kwargs["stream_options"] = {"include_usage": True}
+        try:
+            response = self._get_client().chat.completions.create(
+                model=model_name, messages=self._messages(prompt, system_message), stream=True, **kwargs
+            )
+            for chunk in response:
+                self._record_usage(chunk, usage) # Only the final, choice-less chunk has usage
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    produced = True
+                    yield delta
+        except Exception as e:
+            logger.warning("Error calling OpenAI-compatible API: %s", e)
+            raise self._classify_error(e) from e
+        if not produced:
+            raise EmptyResponseError("OpenAI-compatible API returned an empty response")
+
+    def generate(self, prompt, system_message, model_name, usage=None, response_schema=None):
+        try:
+            response = self._get_client().chat.completions.create(
+                model=model_name, messages=self._messages(prompt, system_message), **self._response_format(response_schema)
+            )
+        except Exception as e:
+            logger.warning("Error calling OpenAI-compatible API: %s", e)
+            raise self._classify_error(e) from e
+        return self._content(response, usage)
+
+    async def generate_async(self, prompt, system_message, model_name, usage=None, response_schema=None):
+        try:
+            response = await self._get_async_client().chat.completions.create(
+                model=model_name, messages=self._messages(prompt, system_message), **self._response_format(response_schema)
+            )
+        except Exception as e:
+            logger.warning("Error calling OpenAI-compatible API: %s", e)
+            raise self._classify_error(e) from e
+        return self._content(response, usage)
+
+    def _content(self, response, usage):
+        self._record_usage(response, usage)
+        content = response.choices[0].message.content if response.choices else None
+        if not content:
+            raise EmptyResponseError("OpenAI-compatible API returned an empty response")
+        return content
+
+    @staticmethod
+    def _classify_error(e: Exception) -> LLMError:
+        try:
+            import openai
+            if isinstance(e, openai.RateLimitError):
+                return RateLimitError(str(e))
+            if isinstance(e, (openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)):
+                return RetryableLLMError(str(e))
+        except ImportError:
+            pass
+        return _classify_generic_error(e)
+
+
+class AnthropicProvider(LLMProvider):
+    """
+    Anthropic Messages API, using ANTHROPIC_API_KEY.
+    There is no JSON mode, so for a response_schema the assistant turn is prefilled with "{",
+    which makes the model continue with a bare JSON object.
+    """
+    name = "anthropic"
+    default_model = "claude-3-5-haiku-latest"
+    max_tokens = 8192
+
+    def __init__(self, api_key: str = None):
+        self.api_key = api_key or os.getenv("ANTHROPIC_API_KEY")
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary() # Event loop -> AsyncAnthropic
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        with self._lock:
+            if self._client is None:
+                from anthropic import Anthropic
+                self._client = Anthropic(api_key=self.api_key)
+            return self._client
+
+    def _get_async_client(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                from anthropic import AsyncAnthropic
+                client = self._async_clients[loop] = AsyncAnthropic(api_key=self.api_key)
+            return client
+
+    @staticmethod
+    def _record_usage(message, usage):
+        if usage is not None and getattr(message, "usage", None) is not None:
+            usage["input_tokens"] = message.usage.input_tokens
+            usage["output_tokens"] = message.usage.output_tokens
+
+    @staticmethod
+    def _messages(prompt, response_schema):
+        messages = [{"role": "user", "content": prompt}]
+        if response_schema is not None:
+            messages.append({"role": "assistant", "content": "{"})
+        return messages
+
+    def stream(self, prompt, system_message, model_name, usage=None, response_schema=None):
+        kwargs = {}
+        if system_message:
+            kwargs["system"] = system_message
+        produced = False
+        try:
+            with self._get_client().messages.stream(
+                model=model_name,
+                max_tokens=self.max_tokens,
+                messages=self._messages(prompt, response_schema),
+                **kwargs
+            ) as response:
+                if response_schema is not None:
+                    yield "{" # The prefilled start of the object is not part of the streamed text
+                for text in response.text_stream:
+                    if text:
+                        produced = True
+                        yield text
+                self._record_usage(response.get_final_message(), usage)
+        except Exception as e:
+            logger.warning("Error calling Anthropic: %s", e)
+            raise self._classify_error(e) from e
+        if not produced:
+            raise EmptyResponseError("Anthropic returned an empty response")
+
+    def generate(self, prompt, system_message, model_name, usage=None, response_schema=None):
+        kwargs = {}
+        if system_message:
+            kwargs["system"] = system_message
+        try:
+            response = self._get_client().messages.create(
+                model=model_name,
+                max_tokens=self.max_tokens,
+                messages=self._messages(prompt, response_schema),
+                **kwargs
+            )
+        except Exception as e:
+            logger.warning("Error calling Anthropic: %s", e)
+            raise self._classify_error(e) from e
+        return self._text(response, usage, response_schema)
+
+    async def generate_async(self, prompt, system_message, model_name, usage=None, response_schema=None):
+        kwargs = {}
+        if system_message:
+            kwargs["system"] = system_message
+        try:
+            response = await self._get_async_client().messages.create(
+                model=model_name,
+                max_tokens=self.max_tokens,
+                messages=self._messages(prompt, response_schema),
+                **kwargs
+            )
+        except Exception as e:
+            logger.warning("Error calling Anthropic: %s", e)
+            raise self._classify_error(e) from e
+        return self._text(response, usage, response_schema)
+
+    def _text(self, response, usage, response_schema):
+        self._record_usage(response, usage)
+        text = "".join(block.text for block in response.content if getattr(block, "type", "") == "text")
+        if not text:
+            raise EmptyResponseError("Anthropic returned an empty response")
+        return "{" + text if response_schema is not None else text
+
+    @staticmethod
+    def _classify_error(e: Exception) -> LLMError:
+        try:
+            import anthropic
+            if isinstance(e, anthropic.RateLimitError):
+                return RateLimitError(str(e))
+            retryable = tuple(
+                cls for cls in (getattr(anthropic, name, None) for name in
+                                ("APITimeoutError", "APIConnectionError", "InternalServerError", "OverloadedError"))
+                if cls is not None
+            )
+            if isinstance(e, retryable):
+                return RetryableLLMError(str(e))
+        except ImportError:
+            pass
+        return _classify_generic_error(e)
+
+
+class StubProvider(LLMProvider):
+    """
+    Local deterministic backend for offline runs, load tests and benchmarks.
+    Recognises the prompts used by nodes.py and answers with schema-valid JSON derived
+    from the prompt itself, so the whole flow runs end to end without an API key: bare JSON
+    when a response_schema is given (like a native JSON mode), otherwise in a ```json fence.
+
+    latency/jitter (seconds) simulate round trips; failure_rate is the probability that a
+    call raises RateLimitError. Configurable via LLM_STUB_LATENCY, LLM_STUB_JITTER,
+    LLM_STUB_FAILURE_RATE and LLM_STUB_SEED.
+    """
+    name = "stub"
+    default_model = "stub"
+    cacheable = False # Serving stub output from the cache would hide the simulated latency and failures
+
+    _STOPWORDS = {"about", "after", "again", "their", "there", "these", "those", "which", "while",
+                  "would", "could", "should", "where", "because", "being", "other", "really", "things"}
+
+    def __init__(self, latency: float = None, jitter: float = None, failure_rate: float = None, seed: int = None):
+        self.latency = float(os.getenv("LLM_STUB_LATENCY", "0")) if latency is None else latency
+        self.jitter = float(os.getenv("LLM_STUB_JITTER", "0")) if jitter is None else jitter
+        self.failure_rate = float(os.getenv("LLM_STUB_FAILURE_RATE", "0")) if failure_rate is None else failure_rate
+        seed = int(os.getenv("LLM_STUB_SEED", "0")) if seed is None else seed
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "failures": 0}
+
+    stream_chunk_size = 64 # Characters per streamed chunk
+
+    def _draw(self):
+        with self._lock:
+            self._stats["calls"] += 1
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            fail = self._rng.random() < self.failure_rate
+            if fail:
+                self._stats["failures"] += 1
+        return delay, fail
+
+    def generate(self, prompt, system_message, model_name, usage=None, response_schema=None):
+        delay, fail = self._draw()
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise RateLimitError("stub provider: simulated rate limit")
+        return self._respond(prompt, response_schema)
+
+    async def generate_async(self, prompt, system_message, model_name, usage=None, response_schema=None):
+        delay, fail = self._draw()
+        if delay:
+            await asyncio.sleep(delay)
+        if fail:
+            raise RateLimitError("stub provider: simulated rate limit")
+        return self._respond(prompt, response_schema)
+
+    def stream(self, prompt, system_message, model_name, usage=None, response_schema=None):
+        # The simulated latency is spread evenly over the chunks, like tokens arriving over time
+        delay, fail = self._draw()
+        if fail:
+            raise RateLimitError("stub provider: simulated rate limit")
+        response = self._respond(prompt, response_schema)
+        chunks = [response[i:i + self.stream_chunk_size] for i in range(0, len(response), self.stream_chunk_size)]
+        for chunk in chunks:
+            if delay:
+                time.sleep(delay / len(chunks))
+            yield chunk
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, provider=self.name)
+
+    def _respond(self, prompt: str, response_schema: dict = None) -> str:
+        if "ORIGINAL TOPIC TITLE:" in prompt and "ORIGINAL QUESTIONS:" in prompt:
+            data = self._process_topic_response(prompt)
+        elif "CANDIDATE TOPICS:" in prompt:
+            data = self._reduce_topics_response(prompt)
+        elif "TRANSCRIPT:" in prompt and "topics" in prompt:
+            data = self._extract_topics_response(prompt)
+        else:
+            return f"Stub response ({len(prompt)} prompt characters)."
+        if response_schema is not None:
+            return json.dumps(data, ensure_ascii=False)
+        return "```json\n" + json.dumps(data, ensure_ascii=False, indent=2) + "\n```\n"
+
+    def _keywords(self, text: str, count: int) -> list:
+        words = [w.lower() for w in re.findall(r"[^\W\d_]{5,}", text)]
+        counts = Counter(w for w in words if w not in self._STOPWORDS)
+        # Most frequent first, ties broken by first appearance so the output is deterministic
+        first_seen = {}
+        for idx, word in enumerate(words):
+            first_seen.setdefault(word, idx)
+        ranked = sorted(counts, key=lambda w: (-counts[w], first_seen[w]))
+        return ranked[:count]
+
+    def _extract_topics_response(self, prompt: str) -> dict:
+        match = re.search(r"TRANSCRIPT:\n(.*?)\n\s*Format your", prompt, re.DOTALL)
+        transcript = match.group(1) if match else prompt
+        keywords = self._keywords(transcript, 5) or ["video"]
+        return {"topics": [
+            {
+                "title": f"All about {word}",
+                "questions": [
+                    f"What does {word} mean in this video?",
+                    f"Why does {word} matter?",
+                    f"How could {word} change in the future?",
+                ],
+            }
+            for word in keywords
+        ]}
+
+    def _reduce_topics_response(self, prompt: str) -> dict:
+        # Keeps the first five candidates, which the caller already ranked
+        match = re.search(r"CANDIDATE TOPICS:\s*```json\n(.*?)```", prompt, re.DOTALL)
+        candidates = json.loads(match.group(1)).get("topics", []) if match else []
+        return {"topics": candidates[:5]}
+
+    def _process_topic_response(self, prompt: str) -> dict:
+        title_match = re.search(r"ORIGINAL TOPIC TITLE:\s*(.+)", prompt)
+        topic_title = title_match.group(1).strip() if title_match else "this topic"
+        questions_block = prompt.split("ORIGINAL QUESTIONS:", 1)[1].split("TRANSCRIPT EXCERPT", 1)[0]
+        questions = [line[2:].strip() for line in questions_block.splitlines() if line.startswith("- ")]
+        return {
+            "rephrased_title": f"Let's explore {topic_title}!",
+            "questions": [
+                {
+                    "original": question,
+                    "rephrased": f"Can you tell me: {question}",
+                    "answer": f"<p><b>Good question!</b> This is a simple answer about <i>{topic_title}</i>.</p>",
+                }
+                for question in questions
+            ],
+        }
+
+
+def _classify_generic_error(e: Exception) -> LLMError:
+    if isinstance(e, (ConnectionError, TimeoutError)):
+        return RetryableLLMError(str(e))
+    return LLMError(str(e))
+
+
+PROVIDERS = {
+    "gemini": GeminiProvider,
+    "openai": OpenAIProvider,
+    "anthropic": AnthropicProvider,
+    "stub": StubProvider,
+}
+
+_providers = {}
+_providers_lock = threading.Lock()
+_warned_stub_fallback = False
+
+
+def default_provider_name() -> str:
+    """
+    LLM_PROVIDER selects the backend (gemini, openai, anthropic or stub). When it is not set,
+    Gemini is used if GOOGLE_API_KEY is present and the local stub otherwise.
+    """
+    global _warned_stub_fallback
+    name = os.getenv("LLM_PROVIDER", "").strip().lower()
+    if name:
+        return name
+    if os.getenv("GOOGLE_API_KEY"):
+        return "gemini"
+    if not _warned_stub_fallback:
+        _warned_stub_fallback = True
+        logger.warning("LLM_PROVIDER is not set and GOOGLE_API_KEY was not found; using the local stub LLM provider.")
+    return "stub"
+
+
+def get_provider(name: str = None) -> LLMProvider:
+    """Return the process-wide provider instance for `name` (default: from the environment)."""
+    name = name or default_provider_name()
+    with _providers_lock:
+        provider = _providers.get(name)
+        if provider is None:
+            if name not in PROVIDERS:
+                raise ValueError(f"Unknown LLM provider '{name}'. Choose one of: {', '.join(PROVIDERS)}")
+            provider = PROVIDERS[name]()
+            _providers[name] = provider
+        return provider
+
+
+def register_provider(name: str, provider: LLMProvider):
+    """Install a provider instance under `name`, e.g. a StubProvider configured for a benchmark."""
+    with _providers_lock:
+        _providers[name] = provider
@@ -0,0 +1,43 @@
+import logging
+import os
+
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(threadName)s] %(name)s: %(message)s"
+
+# Characters of a large payload (e.g. a raw LLM response) kept in a log message
+DEFAULT_PAYLOAD_CHARS = int(os.getenv("LOG_PAYLOAD_CHARS", "300"))
+
+
+class Truncated:
+    """
+    Log argument that shortens a large payload only when the record is actually formatted,
+    so a disabled log call never copies or slices the payload:
+
+        logger.debug("LLM response: %s", truncated(response))
+    """
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit: int = None):
+        self.value = value
+        self.limit = DEFAULT_PAYLOAD_CHARS if limit is None else limit
+
+    def __str__(self):
+        text = str(self.value)
+        if len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}... [{len(text) - self.limit} more chars]"
+
+
+def truncated(value, limit: int = None) -> Truncated:
+    return Truncated(value, limit)
+
+
+def configure_logging(level: str = None, quiet: bool = False):
+    """
+    Send log records to stderr at `level` (default: LOG_LEVEL, else INFO).
+    quiet=True (or LOG_QUIET=1) keeps only warnings and errors; INFO and DEBUG calls are
+    then disabled process-wide via logging.disable(), which makes them near free.
+    """
+    quiet = quiet or os.getenv("LOG_QUIET", "").lower() in ("1", "true", "yes")
+    level = "WARNING" if quiet else (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    logging.basicConfig(format=LOG_FORMAT, level=level, force=True)
+    logging.disable(logging.INFO if quiet else logging.NOTSET)
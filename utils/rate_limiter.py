@@ -0,0 +1,298 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `per_minute` tokens per minute, holding at most `capacity`
+    (default: one minute's worth). reserve() never blocks: it takes the tokens right away,
+    going into debt if needed, and returns how long the caller must wait before using them.
+    Callers are served in the order they reserve, and one wait works for threads and coroutines alike.
+    """
+    def __init__(self, per_minute: float, capacity: float = None, clock=time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else per_minute)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Take `amount` tokens; returns the seconds to wait until the bucket has covered them."""
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+            return max(0.0, -self._tokens / self.rate)
+
+    def refund(self, amount: float):
+        """Give back tokens reserved but not used; a negative amount charges extra ones."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budget of one model; either limit may be None (unlimited).
+    A request reserves one request and its estimated tokens before it is sent, and settle()
+    corrects the token count once the real usage is known.
+    """
+    def __init__(self, rpm: float = None, tpm: float = None, clock=time.monotonic):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = TokenBucket(rpm, clock=clock) if rpm else None
+        self._tokens = TokenBucket(tpm, clock=clock) if tpm else None
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "throttled": 0, "waiting": 0, "max_waiting": 0,
+                       "wait_s_total": 0.0, "wait_s_max": 0.0}
+
+    def reserve(self, tokens: int) -> float:
+        """Reserve one request and `tokens` tokens; returns the seconds to wait before sending it."""
+        delay = 0.0
+        if self._requests is not None:
+            delay = self._requests.reserve(1)
+        if self._tokens is not None:
+            delay = max(delay, self._tokens.reserve(tokens))
+        with self._lock:
+            self._stats["requests"] += 1
+            if delay > 0:
+                self._stats["throttled"] += 1
+                self._stats["wait_s_total"] += delay
+                self._stats["wait_s_max"] = max(self._stats["wait_s_max"], delay)
+        return delay
+
+    def _waiting(self, change: int):
+        with self._lock:
+            self._stats["waiting"] += change
+            self._stats["max_waiting"] = max(self._stats["max_waiting"], self._stats["waiting"])
+
+    def acquire(self, tokens: int) -> float:
+        """reserve() and sleep until the request may be sent. Returns the time waited."""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            self._waiting(1)
+            try:
+                time.sleep(delay)
+            finally:
+                self._waiting(-1)
+        return delay
+
+    async def acquire_async(self, tokens: int) -> float:
+        """acquire() for coroutines: waits with asyncio.sleep."""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            self._waiting(1)
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                self._waiting(-1)
+        return delay
+
+    def settle(self, reserved_tokens: int, used_tokens: int):
+        """Correct the token budget with the tokens a request really used."""
+        if self._tokens is not None and used_tokens != reserved_tokens:
+            self._tokens.refund(reserved_tokens - used_tokens)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats, rpm=self.rpm, tpm=self.tpm)
+        stats["wait_s_total"] = round(stats["wait_s_total"], 3)
+        stats["wait_s_max"] = round(stats["wait_s_max"], 3)
+        if self._tokens is not None:
+            stats["tokens_available"] = int(self._tokens.available())
+        return stats
+
+
+class _Waiter:
+    def __init__(self, wake):
+        self.wake = wake
+        self.granted = False
+
+
+class AdaptiveConcurrency:
+    """
+    Cap on requests in flight, shared by threads (acquire/release) and coroutines (acquire_async),
+    that adapts AIMD style: every rate-limit error halves the limit (at most once per `cooldown`
+    seconds, since one overload usually fails several requests at once), and every success raises
+    it by 1/limit, i.e. by one per full window of successes, back up to `max_limit`.
+    Waiters are served first come, first served.
+    """
+    def __init__(self, max_limit: int, min_limit: int = 1, cooldown: float = 1.0, clock=time.monotonic):
+        self.max_limit = max(1, int(max_limit))
+        self.min_limit = max(1, min(int(min_limit), self.max_limit))
+        self.cooldown = cooldown
+        self._clock = clock
+        self._limit = float(self.max_limit)
+        self._in_flight = 0
+        self._waiters = deque()
+        self._last_decrease = None
+        self._lock = threading.Lock()
+        self._stats = {"acquired": 0, "queued": 0, "max_queue_depth": 0, "wait_s_total": 0.0,
+                       "wait_s_max": 0.0, "rate_limited": 0, "decreases": 0}
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def _try_acquire_locked(self) -> bool:
+        if not self._waiters and self._in_flight < int(self._limit):
+            self._in_flight += 1
+            self._stats["acquired"] += 1
+            return True
+        return False
+
+    def _enqueue_locked(self, waiter):
+        self._waiters.append(waiter)
+        self._stats["queued"] += 1
+        self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._waiters))
+
+    def _grant_locked(self):
+        while self._waiters and self._in_flight < int(self._limit):
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            self._in_flight += 1
+            self._stats["acquired"] += 1
+            waiter.wake()
+
+    def _record_wait(self, waited):
+        with self._lock:
+            self._stats["wait_s_total"] += waited
+            self._stats["wait_s_max"] = max(self._stats["wait_s_max"], waited)
+
+    def acquire(self):
+        with self._lock:
+            if self._try_acquire_locked():
+                return
+            event = threading.Event()
+            self._enqueue_locked(_Waiter(event.set))
+        started = time.perf_counter()
+        event.wait()
+        self._record_wait(time.perf_counter() - started)
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            # May run on another thread: the loop resolves the future itself
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        with self._lock:
+            if self._try_acquire_locked():
+                return
+            waiter = _Waiter(wake)
+            self._enqueue_locked(waiter)
+        started = time.perf_counter()
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.granted:
+                    granted = True
+                else:
+                    granted = False
+                    self._waiters.remove(waiter)
+            if granted:
+                self.release() # The slot was handed over just as the task was cancelled
+            raise
+        self._record_wait(time.perf_counter() - started)
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+            self._grant_locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def on_success(self):
+        with self._lock:
+            if self._limit < self.max_limit:
+                self._limit = min(self.max_limit, self._limit + 1.0 / self._limit)
+                self._grant_locked()
+
+    def on_rate_limited(self):
+        with self._lock:
+            self._stats["rate_limited"] += 1
+            now = self._clock()
+            if self._last_decrease is not None and now - self._last_decrease < self.cooldown:
+                return
+            self._last_decrease = now
+            if self._limit > self.min_limit:
+                self._limit = max(float(self.min_limit), self._limit / 2)
+                self._stats["decreases"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats, limit=int(self._limit), max_limit=self.max_limit,
+                         in_flight=self._in_flight, queue_depth=len(self._waiters))
+        stats["wait_s_total"] = round(stats["wait_s_total"], 3)
+        stats["wait_s_max"] = round(stats["wait_s_max"], 3)
+        return stats
+
+
+def parse_rate_limits(spec: str) -> dict:
+    """
+    Per-model limits from "model=rpm:tpm,other-model=rpm:tpm" (LLM_RATE_LIMITS); either number
+    may be left empty, e.g. "gpt-4o-mini=500:" limits requests only. Returns {model: (rpm, tpm)}.
+    """
+    limits = {}
+    for entry in filter(None, (part.strip() for part in (spec or "").split(","))):
+        model, _, values = entry.partition("=")
+        rpm, _, tpm = values.partition(":")
+        if not model.strip() or not values:
+            raise ValueError(f"Invalid rate limit entry {entry!r}, expected model=rpm:tpm")
+        limits[model.strip()] = (float(rpm) if rpm.strip() else None, float(tpm) if tpm.strip() else None)
+    return limits
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(model_name: str) -> RateLimiter:
+    """
+    The process-wide limiter of a model. Limits come from LLM_RATE_LIMITS for that model, else
+    LLM_RPM / LLM_TPM for every model; unset means unlimited. set_rate_limit() overrides them.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(model_name)
+        if limiter is None:
+            per_model = parse_rate_limits(os.getenv("LLM_RATE_LIMITS", ""))
+            if model_name in per_model:
+                rpm, tpm = per_model[model_name]
+            else:
+                rpm = float(os.getenv("LLM_RPM", "0")) or None
+                tpm = float(os.getenv("LLM_TPM", "0")) or None
+            limiter = _limiters[model_name] = RateLimiter(rpm, tpm)
+        return limiter
+
+
+def set_rate_limit(model_name: str, rpm: float = None, tpm: float = None):
+    """Set the requests and tokens per minute allowed for a model (None: unlimited)."""
+    with _limiters_lock:
+        _limiters[model_name] = RateLimiter(rpm, tpm)
+
+
+def rate_limiter_stats() -> dict:
+    """{model: stats} of every limiter used so far."""
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {model: limiter.stats() for model, limiter in limiters.items()}
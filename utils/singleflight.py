@@ -0,0 +1,92 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class _Abandoned(Exception):
+    """The leading call was interrupted (e.g. its task was cancelled); waiting callers start over."""
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller (the leader) runs the function,
+    and callers arriving while it is in flight wait for its result or exception instead of
+    repeating the work. Threads (do) and asyncio tasks (do_async) share the same in-flight calls,
+    so a task can wait on a call led by a thread and vice versa. Nothing is kept once a call
+    completes; caching results is up to the caller.
+
+    `clone`, if given, is applied to the result handed to each waiting caller (e.g. copy.deepcopy),
+    so callers can't affect each other by mutating a shared result.
+    """
+    def __init__(self, clone=None):
+        self.clone = clone
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "coalesced": 0}
+
+    def _join(self, key):
+        # (future, is_leader) for key
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self._stats["coalesced"] += 1
+                return future, False
+            future = self._calls[key] = Future()
+            self._stats["leaders"] += 1
+            return future, True
+
+    def _finish(self, key, future, result=None, exc=None):
+        with self._lock:
+            del self._calls[key]
+        if exc is not None:
+            future.set_exception(exc)
+        else:
+            future.set_result(result)
+
+    def _shared(self, result):
+        return self.clone(result) if self.clone is not None else result
+
+    def do(self, key, fn, *args, **kwargs):
+        """fn(*args, **kwargs), or the result of the identical call already in flight. Returns (result, is_leader)."""
+        while True:
+            future, leader = self._join(key)
+            if not leader:
+                try:
+                    return self._shared(future.result()), False
+                except _Abandoned:
+                    continue
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self._finish(key, future, exc=e)
+                raise
+            except BaseException:
+                self._finish(key, future, exc=_Abandoned())
+                raise
+            self._finish(key, future, result)
+            return result, True
+
+    async def do_async(self, key, coro_fn, *args, **kwargs):
+        """await coro_fn(*args, **kwargs), or the result of the identical call already in flight. Returns (result, is_leader)."""
+        while True:
+            future, leader = self._join(key)
+            if not leader:
+                try:
+                    # shield: a cancelled waiter must not cancel the call it shares with others
+                    return self._shared(await asyncio.shield(asyncio.wrap_future(future))), False
+                except _Abandoned:
+                    continue
+            try:
+                result = await coro_fn(*args, **kwargs)
+            except Exception as e:
+                self._finish(key, future, exc=e)
+                raise
+            except BaseException:
+                self._finish(key, future, exc=_Abandoned())
+                raise
+            self._finish(key, future, result)
+            return result, True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
@@ -0,0 +1,77 @@
+import json
+
+class IncrementalJSONListParser:
+    """
+    Incrementally parses a streamed response in JSON mode of the form
+
+        {"topics": [{"title": ..., "questions": [...]}, {"title": ...}]}
+
+    Each object in the top-level `list_key` array is emitted as soon as its closing brace
+    arrives. Text before the first "{" (prose, a ```json fence) is ignored. The scanner keeps
+    its position between chunks, so every character is looked at once.
+    """
+
+    def __init__(self, list_key: str = "topics"):
+        self.list_key = list_key
+        self.text = ""
+        self._pos = 0              # Next character of `text` to scan
+        self._started = False
+        self._done = False
+        self._depth = 0            # Nesting of {} and [] outside strings
+        self._in_string = False
+        self._escaped = False
+        self._string_start = None
+        self._last_key = None      # Last string seen directly inside the root object
+        self._list_depth = None    # Depth inside the list_key array, once it has opened
+        self._item_start = None
+
+    def feed(self, chunk: str) -> list:
+        self.text += chunk
+        items = []
+        text, pos = self.text, self._pos
+        while pos < len(text) and not self._done:
+            char = text[pos]
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._depth = 1
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._list_depth is None:
+                        self._last_key = text[self._string_start + 1:pos]
+            elif char == '"':
+                self._in_string = True
+                self._string_start = pos
+            elif char in "{[":
+                if self._list_depth is None and self._depth == 1 and char == "[" and self._last_key == self.list_key:
+                    self._list_depth = 2
+                elif self._depth == self._list_depth and char == "{":
+                    self._item_start = pos
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._item_start is not None and self._depth == self._list_depth:
+                    items.extend(self._parse_item(text[self._item_start:pos + 1]))
+                    self._item_start = None
+                elif (self._list_depth is not None and self._depth < self._list_depth) or self._depth == 0:
+                    self._done = True # The list (or the whole document) has ended
+            pos += 1
+        self._pos = pos
+        return items
+
+    def close(self) -> list:
+        self._done = True
+        return [] # An object still open at the end of the stream is incomplete
+
+    @staticmethod
+    def _parse_item(block: str) -> list:
+        try:
+            parsed = json.loads(block)
+        except ValueError:
+            return [] # A malformed item is skipped; the others are still usable
+        return [parsed] if isinstance(parsed, dict) else []
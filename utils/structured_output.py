@@ -0,0 +1,257 @@
+import copy
+import json
+import re
+
+import yaml
+
+from utils.llm_errors import RetryableLLMError
+
+# libyaml's C loader is several times faster than the pure-Python one; not every PyYAML build has it
+YAMLLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+REASK_SYSTEM_MESSAGE = "You fix malformed structured data. Reply with the corrected data only, in a fenced code block."
+
+_FENCE_RE = re.compile(r"```[ \t]*([A-Za-z]*)[^\n]*\n(.*?)(?:```|\Z)", re.DOTALL)
+_KEY_LINE_RE = re.compile(r"^(\s*(?:-\s+)?)([A-Za-z_][\w-]*):[ \t]+(.*)$")
+_LIST_ITEM_RE = re.compile(r"^(\s*-\s+)(.*)$")
+_BLOCK_SCALAR_RE = re.compile(r"^(\s*)(-\s+)?[A-Za-z_][\w-]*:\s*[|>][-+]?\s*$")
+_STRUCTURAL_RE = re.compile(r"^\s*(-(\s|$)|[A-Za-z_][\w-]*:(\s|$)|#)")
+
+
+class StructuredOutputError(ValueError):
+    """
+    An LLM response that could not be parsed or does not match its schema.
+    `errors` lists [(path, message)] for schema errors; `line` is the 0-based line of a syntax error.
+    """
+
+    def __init__(self, message, text="", errors=None, line=None):
+        super().__init__(message)
+        self.text = text
+        self.errors = errors or []
+        self.line = line
+
+
+def extract_block(text: str) -> str:
+    """The structured part of a response: the first yaml/json fenced block, else the first fence, else the text."""
+    fences = _FENCE_RE.findall(text)
+    for lang, body in fences:
+        if lang.lower() in ("yaml", "yml", "json"):
+            return body.strip("\n")
+    if fences:
+        return fences[0][1].strip("\n")
+    return text.strip()
+
+
+def load_yaml(text: str):
+    return yaml.load(text, Loader=YAMLLoader)
+
+
+def repair_json(text: str) -> str:
+    """Fix the usual LLM JSON slips: smart quotes and trailing commas."""
+    text = text.replace("“", '"').replace("”", '"')
+    return re.sub(r",(\s*[}\]])", r"\1", text)
+
+
+def _quote_scalar(value: str) -> str:
+    # A JSON string is a valid YAML double-quoted scalar
+    return json.dumps(value.strip(), ensure_ascii=False)
+
+
+def _needs_quotes(value: str) -> bool:
+    value = value.strip()
+    return bool(value) and value[0] not in "|>'\"[{&*!" and (": " in value or " #" in value)
+
+
+def repair_yaml(text: str) -> str:
+    """
+    Fix the usual LLM YAML slips: tab indentation, stray fence lines, plain scalars containing
+    ': ' (e.g. an unquoted question), and block scalar content that is not indented past its key.
+    """
+    lines = []
+    block_col = None # Column that the content of the current block scalar must be indented past
+    for line in text.replace("\r\n", "\n").split("\n"):
+        stripped = line.lstrip(" \t")
+        line = line[:len(line) - len(stripped)].replace("\t", "  ") + stripped
+        if stripped.startswith("```"):
+            continue
+
+        if block_col is not None:
+            indent = len(line) - len(stripped)
+            if not stripped or indent > block_col:
+                lines.append(line)
+                continue
+            if not _STRUCTURAL_RE.match(line):
+                lines.append(" " * (block_col + 2) + stripped)
+                continue
+            block_col = None
+
+        block = _BLOCK_SCALAR_RE.match(line)
+        if block:
+            block_col = len(block.group(1)) + len(block.group(2) or "")
+            lines.append(line)
+            continue
+
+        key_line = _KEY_LINE_RE.match(line)
+        if key_line:
+            prefix, key, value = key_line.groups()
+            if _needs_quotes(value):
+                line = f"{prefix}{key}: {_quote_scalar(value)}"
+        else:
+            item = _LIST_ITEM_RE.match(line)
+            if item and _needs_quotes(item.group(2)):
+                line = f"{item.group(1)}{_quote_scalar(item.group(2))}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def loads(block: str):
+    """Parse a JSON or YAML block, trying the JSON fast path first and local repairs before giving up."""
+    stripped = block.strip()
+    if stripped[:1] in ("{", "["):
+        for candidate in (stripped, repair_json(stripped)):
+            try:
+                return json.loads(candidate)
+            except ValueError:
+                pass # JSON-looking text may still be valid YAML flow style
+    try:
+        return load_yaml(block)
+    except yaml.YAMLError as first_error:
+        error = first_error
+    try:
+        return load_yaml(repair_yaml(block))
+    except yaml.YAMLError:
+        pass
+    mark = getattr(error, "problem_mark", None)
+    raise StructuredOutputError(f"Malformed structured output: {error}", block, line=mark.line if mark else None)
+
+
+_TYPES = {"object": dict, "array": list, "string": str, "integer": int, "number": (int, float), "boolean": bool}
+
+
+def validate(data, schema: dict, path: tuple = ()) -> list:
+    """
+    Check `data` against a JSON Schema subset (type, properties, required, items, minItems,
+    minLength, enum). Returns [(path, message)], empty when valid.
+    """
+    expected = schema.get("type")
+    if expected:
+        if not isinstance(data, _TYPES[expected]) or (expected in ("integer", "number") and isinstance(data, bool)):
+            return [(path, f"expected {expected}, got {type(data).__name__}")]
+    if "enum" in schema and data not in schema["enum"]:
+        return [(path, f"expected one of {schema['enum']}")]
+    errors = []
+    if isinstance(data, dict):
+        for key in schema.get("required", []):
+            if key not in data:
+                errors.append((path, f"missing required property '{key}'"))
+        for key, sub_schema in schema.get("properties", {}).items():
+            if key in data:
+                errors.extend(validate(data[key], sub_schema, path + (key,)))
+    elif isinstance(data, list):
+        if len(data) < schema.get("minItems", 0):
+            errors.append((path, f"expected at least {schema['minItems']} items"))
+        if "items" in schema:
+            for index, item in enumerate(data):
+                errors.extend(validate(item, schema["items"], path + (index,)))
+    elif isinstance(data, str) and len(data.strip()) < schema.get("minLength", 0):
+        errors.append((path, f"expected at least {schema['minLength']} characters"))
+    return errors
+
+
+def format_path(path: tuple) -> str:
+    return "$" + "".join(f"[{p}]" if isinstance(p, int) else f".{p}" for p in path)
+
+
+def _schema_at(schema: dict, path: tuple) -> dict:
+    for part in path:
+        schema = schema.get("items", {}) if isinstance(part, int) else schema.get("properties", {}).get(part, {})
+    return schema
+
+
+def _value_at(data, path: tuple):
+    for part in path:
+        data = data[part]
+    return data
+
+
+def _reask_fragment(response: str) -> str:
+    fences = _FENCE_RE.findall(response)
+    return fences[0][1].rstrip("\n") if fences else response.strip("\n")
+
+
+def _fix_syntax(block: str, error: StructuredOutputError, reask, context_lines: int) -> str:
+    # Sends only the lines around the error back to the LLM and splices its correction in
+    lines = block.split("\n")
+    line = error.line if error.line is not None else 0
+    start, end = max(0, line - context_lines), min(len(lines), line + context_lines + 1)
+    fragment = "\n".join(lines[start:end])
+    fmt = "json" if block.lstrip()[:1] in ("{", "[") else "yaml"
+    prompt = (f"This fragment of a {fmt.upper()} document has a syntax error: {error}\n\n"
+              f"```{fmt}\n{fragment}\n```\n\n"
+              f"Return only the corrected fragment in a ```{fmt} code block, keeping its indentation and content otherwise unchanged.")
+    fixed = _reask_fragment(reask(prompt))
+    return "\n".join(lines[:start] + fixed.split("\n") + lines[end:])
+
+
+def _fix_schema(data, errors: list, schema: dict, reask):
+    # Sends only the smallest enclosing object of the first error back to the LLM
+    path, message = errors[0]
+    if path and not message.startswith("missing required"):
+        path = path[:-1] # Re-ask for the object holding the bad value, so the model sees its context
+    value, sub_schema = _value_at(data, path), _schema_at(schema, path)
+    prompt = (f"This JSON value at {format_path(path)} does not match its schema: {message}\n\n"
+              f"Value:\n```json\n{json.dumps(value, ensure_ascii=False, indent=2)}\n```\n\n"
+              f"Schema:\n```json\n{json.dumps(sub_schema)}\n```\n\n"
+              "Return only the corrected value as JSON in a ```json code block.")
+    fixed = loads(_reask_fragment(reask(prompt)))
+    if not path:
+        return fixed
+    data = copy.deepcopy(data)
+    _value_at(data, path[:-1])[path[-1]] = fixed
+    return data
+
+
+def parse_structured(text: str, schema: dict = None, reask=None, max_reasks: int = 1, context_lines: int = 3):
+    """
+    Parse an LLM response (fenced or bare JSON/YAML) and validate it against `schema`.
+
+    When the response is malformed or invalid and `reask` (prompt -> response text, e.g. a
+    call_llm wrapper) is given, up to `max_reasks` small follow-up prompts ask the model to fix
+    only the broken fragment: the lines around a syntax error, or the object holding a schema
+    violation. Raises StructuredOutputError if the result still does not parse or validate;
+    a RetryableLLMError from `reask` propagates unchanged so the caller can retry the call.
+    """
+    block = extract_block(text)
+    reasks = 0
+    while True:
+        try:
+            data = loads(block)
+            break
+        except StructuredOutputError as e:
+            if reask is None or reasks >= max_reasks:
+                raise
+            reasks += 1
+            try:
+                block = _fix_syntax(block, e, reask, context_lines)
+            except RetryableLLMError:
+                raise # The reask call itself failed transiently; left to the caller's retry policy
+            except Exception as reask_error:
+                raise e from reask_error
+
+    while schema is not None:
+        errors = validate(data, schema)
+        if not errors:
+            break
+        error = StructuredOutputError(
+            f"Structured output does not match the schema at {format_path(errors[0][0])}: {errors[0][1]}",
+            block, errors=errors)
+        if reask is None or reasks >= max_reasks:
+            raise error
+        reasks += 1
+        try:
+            data = _fix_schema(data, errors, schema, reask)
+        except RetryableLLMError:
+            raise # The reask call itself failed transiently; left to the caller's retry policy
+        except Exception as reask_error:
+            raise error from reask_error
+    return data
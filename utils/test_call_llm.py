@@ -0,0 +1,106 @@
+import contextvars
+import os
+import threading
+import tempfile
+import unittest
+from unittest import mock
+# Imported through the utils package, like nodes.py does, so the provider registry and cache are the ones call_llm uses
+from utils import call_llm as llm_client
+from utils import llm_providers
+from utils.llm_cache import LLMCache, make_cache_key
+from utils.llm_providers import StubProvider, register_provider, DEFAULT_SYSTEM_MESSAGE
+from utils.token_usage import get_usage_tracker, usage_scope
+from nodes import ExtractTopicsAndQuestionsNode, TOPICS_SCHEMA
+
+TRANSCRIPT = "Volcanoes erupt when magma pressure builds. Magma rises through cracks in the crust."
+
+class CacheableStub(StubProvider):
+    """The stub, with its responses cached like a real provider's."""
+    name = "cacheable-stub"
+    cacheable = True
+
+class LLMCacheTestCase(unittest.TestCase):
+    """Runs call_llm against a registered CacheableStub and a temporary LLM cache."""
+
+    def setUp(self):
+        self.provider = CacheableStub(latency=0, failure_rate=0)
+        register_provider(self.provider.name, self.provider)
+        self.addCleanup(llm_providers._providers.pop, self.provider.name, None)
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.cache = LLMCache(os.path.join(tmp_dir.name, "llm_cache.sqlite"))
+        self.addCleanup(self.cache.close)
+        patchers = [mock.patch.object(llm_client, "get_default_cache", return_value=self.cache),
+                    mock.patch.dict(os.environ, {"LLM_CACHE_DISABLE": "", "LLM_MODEL": ""})]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def cached(self, prompt, response_schema=None):
+        key = make_cache_key(self.provider.default_model, DEFAULT_SYSTEM_MESSAGE, prompt, response_schema)
+        return self.cache.get(key)
+
+class TestCallLLMStream(LLMCacheTestCase):
+
+    def stream(self, prompt, response_schema=None):
+        return "".join(llm_client.call_llm_stream(prompt, provider=self.provider.name, response_schema=response_schema))
+
+    def test_valid_structured_stream_is_cached(self):
+        prompt = ExtractTopicsAndQuestionsNode().build_prompt(TRANSCRIPT, "Volcanoes")
+        text = self.stream(prompt, TOPICS_SCHEMA)
+        self.assertEqual(self.cached(prompt, TOPICS_SCHEMA), text)
+        with mock.patch.object(self.provider, "stream") as stream:
+            self.assertEqual(self.stream(prompt, TOPICS_SCHEMA), text) # Served from the cache
+        stream.assert_not_called()
+
+    def test_invalid_structured_stream_is_not_cached(self):
+        prompt = "Not a prompt the stub knows" # Answered with plain text, which is not a topics object
+        text = self.stream(prompt, TOPICS_SCHEMA)
+        self.assertTrue(text.startswith("Stub response"))
+        self.assertIsNone(self.cached(prompt, TOPICS_SCHEMA))
+
+        self.stream(prompt) # Plain text is fine without a schema
+        self.assertEqual(self.cached(prompt), text)
+
+class TestCoalescing(LLMCacheTestCase):
+
+    def test_concurrent_identical_calls_reach_the_provider_once(self):
+        self.provider.latency = 0.3 # Long enough for every caller to join the leader's request
+        prompt = ExtractTopicsAndQuestionsNode().build_prompt(TRANSCRIPT, "Volcanoes")
+        before = llm_client._llm_flight.stats()
+        callers = 5
+        barrier = threading.Barrier(callers)
+        results = [None] * callers
+
+        def call(index):
+            barrier.wait()
+            results[index] = llm_client.call_llm(prompt, provider=self.provider.name, caller="Extract",
+                                                 response_schema=TOPICS_SCHEMA)
+
+        with usage_scope("coalescing-test"):
+            threads = [threading.Thread(target=contextvars.copy_context().run, args=(call, i)) for i in range(callers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(self.provider.stats()["calls"], 1)
+        self.assertTrue(all(result == results[0] for result in results))
+        self.assertEqual(len({id(result) for result in results}), callers) # Each caller gets its own copy
+
+        usage = get_usage_tracker().summary(video="coalescing-test")["total"]
+        self.assertEqual((usage["calls"], usage["cached_calls"]), (1, callers - 1))
+
+        self.assertIsNotNone(self.cached(prompt, TOPICS_SCHEMA))
+        with mock.patch.dict(os.environ, {"LLM_PROVIDER": self.provider.name}):
+            coalescing = llm_client.get_llm_client_stats()["coalescing"]
+        self.assertEqual(coalescing["leaders"] - before["leaders"], 1)
+        self.assertEqual(coalescing["coalesced"] - before["coalesced"], callers - 1)
+        self.assertEqual(coalescing["in_flight"], 0)
+
+        # Later identical calls are cache hits that never reach the provider
+        llm_client.call_llm(prompt, provider=self.provider.name, response_schema=TOPICS_SCHEMA)
+        self.assertEqual(self.provider.stats()["calls"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from checkpoint import FileCheckpointer, checkpointer_for
+
+class TestFileCheckpointer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "nested", "run.json")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_save_load_clear(self):
+        checkpointer = FileCheckpointer(self.path)
+        self.assertIsNone(checkpointer.load())
+        checkpointer.save({"next": "1.Node", "shared": {"title": "标题"}})
+        self.assertEqual(checkpointer.load(), {"next": "1.Node", "shared": {"title": "标题"}})
+        checkpointer.clear()
+        self.assertFalse(checkpointer.exists())
+        checkpointer.clear() # Clearing twice is fine
+
+    def test_failed_save_keeps_previous_state(self):
+        """A save that dies halfway leaves the previous checkpoint intact and no temp file behind."""
+        checkpointer = FileCheckpointer(self.path)
+        checkpointer.save({"step": 1})
+
+        def partial_dump(state, f, **kwargs):
+            f.write('{"step": 2, "shared": {')
+            raise KeyboardInterrupt
+
+        with mock.patch("checkpoint.json.dump", side_effect=partial_dump):
+            with self.assertRaises(KeyboardInterrupt):
+                checkpointer.save({"step": 2})
+        self.assertEqual(checkpointer.load(), {"step": 1})
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ["run.json"])
+
+    def test_unreadable_checkpoint_is_ignored(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write('{"step": ')
+        self.assertIsNone(FileCheckpointer(self.path).load())
+
+    def test_checkpointer_for_sanitizes_the_video_id(self):
+        checkpointer = checkpointer_for("../a b", directory=self.tmp_dir.name)
+        self.assertEqual(checkpointer.path, os.path.join(self.tmp_dir.name, "___a_b.json"))
+
+if __name__ == "__main__":
+    unittest.main()
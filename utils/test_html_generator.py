@@ -1,5 +1,7 @@
+import os
+import tempfile
 import unittest
-from html_generator import generate_html_report
+from html_generator import generate_html_report, write_html_report, REPORT_CSS, save_report_artifact, load_report_artifact
 
 class TestHTMLGenerator(unittest.TestCase):
 
@@ -178,5 +180,33 @@ class TestHTMLGenerator(unittest.TestCase):
         self.assertIn("<h3>Unnamed Topic 1</h3>", html_output)
         self.assertIn("<strong class=\"question-text\">A question</strong>", html_output)
 
+    def test_streamed_file_matches_string(self):
+        """write_html_report streams the same bytes generate_html_report returns, with the CSS inlined."""
+        video_info = {"title": "Stream Test", "url": "http://example.com/v", "thumbnail_url": "http://example.com/t.jpg"}
+        topics_data = [
+            {"title": f"Topic {i}", "questions": [{"rephrased": f"Q{i}", "answer": "<p>{braces} stay as-is</p>"}]}
+            for i in range(3)
+        ]
+        expected = generate_html_report(video_info, topics_data)
+        self.assertIn(REPORT_CSS, expected)
+        self.assertIn("<p>{braces} stay as-is</p>", expected)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "report.html")
+            write_html_report(video_info, topics_data, path)
+            with open(path, "r", encoding="utf-8") as f:
+                self.assertEqual(f.read(), expected)
+            self.assertEqual(os.listdir(tmp_dir), ["report.html"]) # No temp file left behind
+
+    def test_artifact_round_trip(self):
+        """A saved artifact re-renders the same report, without the transcript."""
+        video_info = {"title": "Artifact Test", "url": "http://example.com/v", "transcript": "long text", "segments": [{"text": "x"}]}
+        topics_data = [{"title": "T", "rephrased_title": "T!", "questions": [{"rephrased": "Q?", "answer": "<p>A</p>"}]}]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "report.json")
+            save_report_artifact(video_info, topics_data, path)
+            loaded_info, loaded_topics = load_report_artifact(path)
+        self.assertNotIn("transcript", loaded_info)
+        self.assertEqual(generate_html_report(loaded_info, loaded_topics), generate_html_report(video_info, topics_data))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
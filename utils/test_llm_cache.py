@@ -0,0 +1,72 @@
+import os
+import tempfile
+import time
+import unittest
+from llm_cache import LLMCache, make_cache_key
+
+class TestLLMCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "cache.sqlite")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_key_depends_on_all_inputs(self):
+        """Changing model, system message, prompt or response schema changes the key."""
+        base = make_cache_key("model-a", "system", "prompt")
+        self.assertEqual(base, make_cache_key("model-a", "system", "prompt"))
+        self.assertNotEqual(base, make_cache_key("model-b", "system", "prompt"))
+        self.assertNotEqual(base, make_cache_key("model-a", "other system", "prompt"))
+        self.assertNotEqual(base, make_cache_key("model-a", "system", "other prompt"))
+        self.assertNotEqual(base, make_cache_key("model-a", "system", "prompt", {"type": "object"}))
+
+    def test_hit_miss_counters(self):
+        """A miss followed by a set and a hit is reflected in stats()."""
+        cache = LLMCache(self.path)
+        key = make_cache_key("m", "s", "p")
+        self.assertIsNone(cache.get(key))
+        cache.set(key, "response")
+        self.assertEqual(cache.get(key), "response")
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["entries"], 1)
+        cache.close()
+
+    def test_persists_across_instances(self):
+        """Entries survive reopening the cache file."""
+        cache = LLMCache(self.path)
+        cache.set("k", "persisted")
+        cache.close()
+        reopened = LLMCache(self.path)
+        self.assertEqual(reopened.get("k"), "persisted")
+        reopened.close()
+
+    def test_ttl_expiry(self):
+        """Entries older than the TTL are treated as misses and removed."""
+        cache = LLMCache(self.path, ttl_seconds=0.05)
+        cache.set("k", "short lived")
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("k"))
+        self.assertEqual(cache.stats()["entries"], 0)
+        cache.close()
+
+    def test_lru_eviction_under_size_cap(self):
+        """The least recently used entry is evicted first once the cap is exceeded."""
+        cache = LLMCache(self.path, max_bytes=25)
+        cache.set("a", "x" * 10)
+        time.sleep(0.01)
+        cache.set("b", "y" * 10)
+        time.sleep(0.01)
+        cache.get("a")  # "a" is now more recently used than "b"
+        time.sleep(0.01)
+        cache.set("c", "z" * 10)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), "x" * 10)
+        self.assertEqual(cache.get("c"), "z" * 10)
+        cache.close()
+
+if __name__ == '__main__':
+    unittest.main()
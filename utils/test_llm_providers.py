@@ -0,0 +1,79 @@
+import json
+import os
+import unittest
+from unittest import mock
+# Imported through the utils package, like call_llm does, so the provider registry is the one call_llm uses
+from utils import llm_providers
+from utils.llm_providers import StubProvider, get_provider, default_provider_name, register_provider
+from utils.llm_errors import RateLimitError, RetryableLLMError
+from utils.call_llm import call_llm
+from utils.structured_output import validate, parse_structured
+from nodes import ExtractTopicsAndQuestionsNode, ProcessTopicNode, TOPICS_SCHEMA, PROCESSED_TOPIC_SCHEMA
+
+TRANSCRIPT = ("Volcanoes erupt when magma pressure builds. Magma rises through cracks in the crust. "
+              "Scientists monitor volcanoes with seismometers, because magma movement causes small earthquakes.")
+
+class TestProviderSelection(unittest.TestCase):
+
+    def test_llm_provider_selects_the_backend(self):
+        for name in ("openai", "anthropic", "stub"):
+            with mock.patch.dict(os.environ, {"LLM_PROVIDER": f" {name.upper()} ", "GOOGLE_API_KEY": "key"}):
+                self.assertEqual(default_provider_name(), name)
+        self.assertIsInstance(get_provider("stub"), StubProvider)
+        with self.assertRaisesRegex(ValueError, "Unknown LLM provider 'nope'"):
+            get_provider("nope")
+
+    def test_stub_is_the_fallback_without_an_api_key(self):
+        with mock.patch.dict(os.environ, {"LLM_PROVIDER": "", "GOOGLE_API_KEY": ""}):
+            self.assertEqual(default_provider_name(), "stub")
+        with mock.patch.dict(os.environ, {"LLM_PROVIDER": "", "GOOGLE_API_KEY": "key"}):
+            self.assertEqual(default_provider_name(), "gemini")
+
+    def test_llm_model_overrides_the_default_model(self):
+        stub = StubProvider(latency=0, failure_rate=0)
+        register_provider("test-stub", stub)
+        self.addCleanup(llm_providers._providers.pop, "test-stub", None)
+        with mock.patch.object(stub, "generate", wraps=stub.generate) as generate:
+            with mock.patch.dict(os.environ, {"LLM_MODEL": ""}):
+                call_llm("first prompt", provider="test-stub")
+            with mock.patch.dict(os.environ, {"LLM_MODEL": "custom-model"}):
+                call_llm("second prompt", provider="test-stub")
+                call_llm("third prompt", provider="test-stub", model_name="explicit-model")
+        self.assertEqual([c.args[2] for c in generate.call_args_list], ["stub", "custom-model", "explicit-model"])
+
+class TestStubProvider(unittest.TestCase):
+
+    def test_failure_rate_raises_rate_limit_errors(self):
+        with mock.patch.dict(os.environ, {"LLM_STUB_FAILURE_RATE": "1"}):
+            stub = StubProvider(latency=0)
+        with self.assertRaises(RateLimitError) as raised:
+            stub.generate("prompt", None, "stub")
+        self.assertIsInstance(raised.exception, RetryableLLMError)
+        with self.assertRaises(RateLimitError):
+            list(stub.stream("prompt", None, "stub"))
+        self.assertEqual(stub.stats()["failures"], 2)
+        StubProvider(latency=0, failure_rate=0).generate("prompt", None, "stub") # Never fails
+
+    def test_responses_match_the_node_schemas(self):
+        stub = StubProvider(latency=0, failure_rate=0)
+        extract_prompt = ExtractTopicsAndQuestionsNode().build_prompt(TRANSCRIPT, "Volcanoes")
+        topics = json.loads(stub.generate(extract_prompt, None, "stub", response_schema=TOPICS_SCHEMA))
+        self.assertEqual(validate(topics, TOPICS_SCHEMA), [])
+        self.assertEqual(topics["topics"][0]["title"], "All about magma")
+        # Without a schema the same data comes in a ```json fence
+        self.assertEqual(parse_structured(stub.generate(extract_prompt, None, "stub"), TOPICS_SCHEMA), topics)
+
+        candidates = [{"title": f"Topic {i}", "questions": [{"original": f"Question {i}?"}]} for i in range(7)]
+        reduce_prompt = ExtractTopicsAndQuestionsNode().build_reduce_prompt(candidates, "Volcanoes")
+        reduced = json.loads(stub.generate(reduce_prompt, None, "stub", response_schema=TOPICS_SCHEMA))
+        self.assertEqual(validate(reduced, TOPICS_SCHEMA), [])
+        self.assertEqual(len(reduced["topics"]), 5)
+
+        topic = {"title": "All about magma", "questions": [{"original": q} for q in topics["topics"][0]["questions"]]}
+        simplify_prompt = ProcessTopicNode().build_prompt(topic, TRANSCRIPT)
+        simplified = json.loads(stub.generate(simplify_prompt, None, "stub", response_schema=PROCESSED_TOPIC_SCHEMA))
+        self.assertEqual(validate(simplified, PROCESSED_TOPIC_SCHEMA), [])
+        self.assertEqual([q["original"] for q in simplified["questions"]], topics["topics"][0]["questions"])
+
+if __name__ == "__main__":
+    unittest.main()
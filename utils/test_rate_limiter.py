@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+import unittest
+from rate_limiter import TokenBucket, RateLimiter, AdaptiveConcurrency, parse_rate_limits
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_reserve_goes_into_debt_and_refills(self):
+        """Reservations beyond the budget return the wait until the bucket has refilled enough."""
+        clock = FakeClock()
+        bucket = TokenBucket(60, clock=clock) # One token per second
+        self.assertEqual(bucket.reserve(60), 0.0)
+        self.assertAlmostEqual(bucket.reserve(1), 1.0)
+        self.assertAlmostEqual(bucket.reserve(2), 3.0) # Queued behind the previous reservation
+        clock.now = 10.0
+        self.assertAlmostEqual(bucket.available(), 7.0)
+        bucket.refund(100)
+        self.assertEqual(bucket.available(), 60.0) # Never above capacity
+
+    def test_rate_limiter_settles_actual_tokens(self):
+        """TPM reservations use the estimate and are corrected with the real usage."""
+        clock = FakeClock()
+        limiter = RateLimiter(rpm=120, tpm=600, clock=clock)
+        self.assertEqual(limiter.reserve(500), 0.0)
+        limiter.settle(500, 100) # The request used far fewer tokens than estimated
+        self.assertEqual(limiter.reserve(450), 0.0)
+        self.assertAlmostEqual(limiter.reserve(100), 5.0) # 50 tokens short at 10 tokens per second
+        stats = limiter.stats()
+        self.assertEqual((stats["requests"], stats["throttled"]), (3, 1))
+
+    def test_parse_rate_limits(self):
+        self.assertEqual(parse_rate_limits("m1=60:1000, m2=500:"), {"m1": (60.0, 1000.0), "m2": (500.0, None)})
+        with self.assertRaises(ValueError):
+            parse_rate_limits("m1")
+
+class TestAdaptiveConcurrency(unittest.TestCase):
+
+    def test_backs_off_on_rate_limits_and_ramps_up(self):
+        """The limit halves on a rate-limit error (once per cooldown) and grows back with successes."""
+        clock = FakeClock()
+        governor = AdaptiveConcurrency(8, cooldown=1.0, clock=clock)
+        governor.on_rate_limited()
+        governor.on_rate_limited() # Same burst: ignored
+        self.assertEqual(governor.limit, 4)
+        clock.now = 2.0
+        governor.on_rate_limited()
+        self.assertEqual(governor.limit, 2)
+        for _ in range(20):
+            governor.on_success()
+        self.assertEqual(governor.limit, 6)
+        for _ in range(100):
+            governor.on_success()
+        self.assertEqual(governor.limit, 8)
+
+    def test_threads_and_coroutines_share_the_limit(self):
+        """Never more than `limit` holders at once, whether they wait in threads or on an event loop."""
+        governor = AdaptiveConcurrency(2)
+        lock = threading.Lock()
+        active, peak = [0], [0]
+
+        def enter():
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+
+        def leave():
+            with lock:
+                active[0] -= 1
+
+        def thread_worker():
+            with governor:
+                enter()
+                time.sleep(0.02)
+                leave()
+
+        async def task_worker():
+            await governor.acquire_async()
+            try:
+                enter()
+                await asyncio.sleep(0.02)
+                leave()
+            finally:
+                governor.release()
+
+        async def run_tasks():
+            await asyncio.gather(*(task_worker() for _ in range(4)))
+
+        threads = [threading.Thread(target=thread_worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        asyncio.run(run_tasks())
+        for thread in threads:
+            thread.join()
+        stats = governor.stats()
+        self.assertEqual(peak[0], 2)
+        self.assertEqual((stats["acquired"], stats["in_flight"], stats["queue_depth"]), (8, 0, 0))
+        self.assertGreater(stats["max_queue_depth"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
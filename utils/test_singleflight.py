@@ -0,0 +1,110 @@
+import asyncio
+import copy
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from singleflight import SingleFlight
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_concurrent_threads_share_one_call(self):
+        """Identical calls in flight run once; waiting callers get their own copy of the result."""
+        flight = SingleFlight(clone=copy.deepcopy)
+        calls = []
+
+        def fetch(key):
+            calls.append(key)
+            time.sleep(0.05)
+            return {"key": key}
+
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            results = list(pool.map(lambda _: flight.do("a", fetch, "a"), range(5)))
+        self.assertEqual(calls, ["a"])
+        self.assertEqual(sum(leader for _, leader in results), 1)
+        self.assertTrue(all(result == {"key": "a"} for result, _ in results))
+        self.assertEqual(len({id(result) for result, _ in results}), 5)
+        self.assertEqual(flight.stats(), {"leaders": 1, "coalesced": 4, "in_flight": 0})
+
+        # Nothing is kept once the call completed
+        flight.do("a", fetch, "a")
+        self.assertEqual(len(calls), 2)
+
+    def test_errors_are_shared(self):
+        flight = SingleFlight()
+        started = threading.Event()
+
+        def fail():
+            started.set()
+            time.sleep(0.05)
+            raise ValueError("boom")
+
+        errors = []
+
+        def call():
+            try:
+                flight.do("k", fail)
+            except ValueError as e:
+                errors.append(str(e))
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=call)
+        follower.start()
+        leader.join()
+        follower.join()
+        self.assertEqual(errors, ["boom", "boom"])
+        self.assertEqual(flight.stats()["leaders"], 1)
+
+    def test_tasks_and_threads_share_calls(self):
+        """A task waits on a call led by a thread, and tasks coalesce among themselves."""
+        flight = SingleFlight()
+        calls = []
+
+        def slow_fetch():
+            calls.append("thread")
+            time.sleep(0.1)
+            return "from thread"
+
+        async def async_fetch():
+            calls.append("task")
+            await asyncio.sleep(0.05)
+            return "from task"
+
+        async def main():
+            await asyncio.sleep(0.02) # Let the thread lead
+            shared = await flight.do_async("t", async_fetch)
+            coalesced = await asyncio.gather(*(flight.do_async("u", async_fetch) for _ in range(3)))
+            return shared, coalesced
+
+        thread = threading.Thread(target=flight.do, args=("t", slow_fetch))
+        thread.start()
+        shared, coalesced = asyncio.run(main())
+        thread.join()
+        self.assertEqual(shared, ("from thread", False))
+        self.assertEqual([result for result, _ in coalesced], ["from task"] * 3)
+        self.assertEqual(calls, ["thread", "task"])
+
+    def test_cancelled_leader_hands_over(self):
+        """When the leading task is cancelled, a waiting task runs the call itself instead of failing."""
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return len(calls)
+
+        async def main():
+            leader = asyncio.ensure_future(flight.do_async("c", fetch))
+            await asyncio.sleep(0.01)
+            follower = asyncio.ensure_future(flight.do_async("c", fetch))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await follower
+
+        self.assertEqual(asyncio.run(main()), (2, True))
+
+if __name__ == "__main__":
+    unittest.main()
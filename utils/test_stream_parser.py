@@ -0,0 +1,27 @@
+import unittest
+from stream_parser import IncrementalJSONListParser
+
+class TestIncrementalJSONListParser(unittest.TestCase):
+
+    def test_items_emitted_before_stream_ends(self):
+        """Objects are emitted when their closing brace arrives; braces and quotes inside strings are ignored."""
+        text = ('```json\n{"note": "x", "topics": [{"title": "A {b}", "questions": ["Why \\"so\\"?"]},\n'
+                ' {"title": "C", "questions": ["D]"]}], "extra": [{"title": "ignored"}]}\n```')
+        parser = IncrementalJSONListParser("topics")
+        emitted_at = []
+        for start in range(0, len(text), 3):
+            emitted_at.extend((start, item) for item in parser.feed(text[start:start + 3]))
+        emitted_at.extend((None, item) for item in parser.close())
+        self.assertEqual([item["title"] for _, item in emitted_at], ["A {b}", "C"])
+        self.assertLess(emitted_at[0][0], text.index('"C"'))
+        self.assertEqual(emitted_at[0][1]["questions"], ['Why "so"?'])
+        self.assertEqual(parser.text, text)
+
+    def test_truncated_stream(self):
+        """An object cut off by the end of the stream is not emitted."""
+        parser = IncrementalJSONListParser("topics")
+        self.assertEqual(parser.feed('{"topics": [{"title": "A"}, {"title": "B'), [{"title": "A"}])
+        self.assertEqual(parser.close(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+from structured_output import StructuredOutputError, parse_structured, extract_block
+from utils.llm_errors import RateLimitError, EmptyResponseError # The classes structured_output imports
+
+TOPICS_SCHEMA = {
+    "type": "object",
+    "required": ["topics"],
+    "properties": {"topics": {"type": "array", "items": {
+        "type": "object",
+        "required": ["title", "questions"],
+        "properties": {"title": {"type": "string"}, "questions": {"type": "array", "items": {"type": "string"}}},
+    }}},
+}
+
+class TestStructuredOutput(unittest.TestCase):
+
+    def test_fenced_yaml_with_prose(self):
+        """The yaml fence is picked out of surrounding prose."""
+        text = "Sure!\n```yaml\ntopics:\n  - title: Space\n    questions:\n      - Why?\n```\nEnjoy."
+        self.assertEqual(parse_structured(text, TOPICS_SCHEMA), {"topics": [{"title": "Space", "questions": ["Why?"]}]})
+
+    def test_json_fast_path_with_trailing_comma(self):
+        """JSON is parsed directly, after removing trailing commas."""
+        text = '```json\n{"topics": [{"title": "Space", "questions": ["Why?",],},]}\n```'
+        self.assertEqual(parse_structured(text, TOPICS_SCHEMA)["topics"][0]["questions"], ["Why?"])
+
+    def test_repairs_tabs_and_colons(self):
+        """Tab indentation and unquoted ': ' inside values are repaired locally."""
+        text = "topics:\n\t- title: Light: wave or particle?\n\t  questions:\n\t\t- What is light: a wave?"
+        data = parse_structured(text, TOPICS_SCHEMA)
+        self.assertEqual(data["topics"][0]["title"], "Light: wave or particle?")
+        self.assertEqual(data["topics"][0]["questions"], ["What is light: a wave?"])
+
+    def test_repairs_underindented_block_scalar(self):
+        """Block scalar content at the key's own indentation is re-indented."""
+        text = "topics:\n  - title: |\n    Black holes\n    questions:\n      - |\n        Why?"
+        self.assertEqual(parse_structured(text, TOPICS_SCHEMA)["topics"][0]["title"].strip(), "Black holes")
+
+    def test_schema_error_without_reask(self):
+        """Schema violations raise with the path of the offending value."""
+        with self.assertRaises(StructuredOutputError) as ctx:
+            parse_structured("topics:\n  - title: Space\n    questions: none", TOPICS_SCHEMA)
+        self.assertEqual(ctx.exception.errors[0][0], ("topics", 0, "questions"))
+
+    def test_schema_reask_sends_only_the_broken_object(self):
+        """The re-ask prompt contains only the invalid topic, and its answer is spliced back in."""
+        prompts = []
+        def reask(prompt):
+            prompts.append(prompt)
+            return '```json\n{"title": "Space", "questions": ["Why?"]}\n```'
+        text = "topics:\n  - title: Ocean\n    questions: [Deep?]\n  - title: Space\n    questions: none"
+        data = parse_structured(text, TOPICS_SCHEMA, reask=reask)
+        self.assertEqual(data["topics"][1]["questions"], ["Why?"])
+        self.assertEqual(len(prompts), 1)
+        self.assertNotIn("Ocean", prompts[0])
+
+    def test_syntax_reask_fixes_fragment(self):
+        """Unrepairable syntax errors are fixed by re-asking for the lines around the error."""
+        text = "topics:\n  - title: Space\n    questions: [Why?\n  - title: Ocean\n    questions: [Deep?]"
+        def reask(prompt):
+            fragment = extract_block(prompt.split("syntax error", 1)[1])
+            return "```yaml\n" + fragment.replace("[Why?\n", "[Why?]\n") + "\n```"
+        data = parse_structured(text, TOPICS_SCHEMA, reask=reask, context_lines=1)
+        self.assertEqual([t["title"] for t in data["topics"]], ["Space", "Ocean"])
+
+    def test_transient_reask_failures_propagate(self):
+        """A rate-limited reask is raised as-is for the caller's retries; other reask failures become parse errors."""
+        def rate_limited(prompt):
+            raise RateLimitError("429")
+        def empty(prompt):
+            raise EmptyResponseError("blocked")
+        schema_error = "topics:\n  - title: Space\n    questions: none"
+        syntax_error = "topics:\n  - title: Space\n    questions: [Why?\n  - title: Ocean\n    questions: [Deep?]"
+        for text in (schema_error, syntax_error):
+            with self.assertRaises(RateLimitError):
+                parse_structured(text, TOPICS_SCHEMA, reask=rate_limited)
+            with self.assertRaises(StructuredOutputError) as ctx:
+                parse_structured(text, TOPICS_SCHEMA, reask=empty)
+            self.assertIsInstance(ctx.exception.__cause__, EmptyResponseError)
+
+    def test_extract_block_without_fence(self):
+        """Unfenced responses are used as-is."""
+        self.assertEqual(extract_block("  a: 1\n"), "a: 1")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import contextvars
+import threading
+import unittest
+from token_usage import UsageTracker, usage_scope, trim_to_budget, format_usage_report
+from transcript_index import estimate_tokens
+
+class TestUsageTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.tracker = UsageTracker()
+
+    def test_aggregates_per_video_and_node(self):
+        usage = {"input_tokens": 100, "output_tokens": 20}
+        with usage_scope("video-a"):
+            self.tracker.record("ExtractTopics", "model-x", "p", "r", usage=usage, latency=1.0)
+            self.tracker.record("ProcessTopic", "model-x", "p", "r", usage=usage, latency=0.5)
+            # Worker threads started with a copy of the caller's context are attributed to the same video
+            context = contextvars.copy_context()
+            worker = threading.Thread(target=context.run, args=(self.tracker.record, "ProcessTopic", "model-y", "p", "r", usage))
+            worker.start()
+            worker.join()
+        with usage_scope("video-b"):
+            self.tracker.record("ExtractTopics", "model-x", "p", "r", usage=usage, latency=2.0)
+        self.tracker.record("ExtractTopics", "model-x", "p", "r", usage=usage) # Outside any scope
+
+        report = self.tracker.summary()
+        self.assertEqual(report["total"]["calls"], 5)
+        self.assertEqual(report["total"]["input_tokens"], 500)
+        self.assertEqual({video: totals["calls"] for video, totals in report["by_video"].items()},
+                         {"video-a": 3, "video-b": 1, "unknown": 1})
+        self.assertEqual({node: totals["calls"] for node, totals in report["by_node"].items()},
+                         {"ExtractTopics": 3, "ProcessTopic": 2})
+        self.assertEqual(report["by_model"]["model-y"]["output_tokens"], 20)
+
+        video_a = self.tracker.summary(video="video-a")
+        self.assertEqual(video_a["total"]["calls"], 3)
+        self.assertEqual(video_a["total"]["latency_s"], 1.5)
+        self.assertEqual(list(video_a["by_video"]), ["video-a"])
+        self.assertEqual(video_a["by_node"]["ProcessTopic"]["input_tokens"], 200)
+
+    def test_reported_usage_wins_over_the_estimate(self):
+        prompt, response = "word " * 40, "answer " * 10
+        self.tracker.record("Node", "model", prompt, response, usage={"input_tokens": 7, "output_tokens": 3})
+        self.tracker.record("Node", "model", prompt, response) # Nothing reported: both sides estimated
+        self.tracker.record("Node", "model", prompt, response, usage={"input_tokens": 5}) # Only the output is estimated
+        totals = self.tracker.summary()["total"]
+        self.assertEqual(totals["calls"], 3)
+        self.assertEqual(totals["estimated_calls"], 2)
+        self.assertEqual(totals["input_tokens"], 7 + estimate_tokens(prompt) + 5)
+        self.assertEqual(totals["output_tokens"], 3 + 2 * estimate_tokens(response))
+        self.assertIn("2 estimated", format_usage_report(self.tracker.summary()))
+
+    def test_cached_calls_cost_nothing(self):
+        self.tracker.record("Node", "model", "prompt", "response", usage={"input_tokens": 10, "output_tokens": 10}, latency=1.0)
+        self.tracker.record("Node", "model", "prompt", "response", usage={"input_tokens": 10, "output_tokens": 10},
+                            latency=1.0, cached=True)
+        totals = self.tracker.summary()["total"]
+        self.assertEqual((totals["calls"], totals["cached_calls"]), (1, 1))
+        self.assertEqual((totals["input_tokens"], totals["output_tokens"], totals["latency_s"]), (10, 10, 1.0))
+
+        self.tracker.reset()
+        self.assertEqual(self.tracker.summary()["total"]["calls"], 0)
+
+class TestTrimToBudget(unittest.TestCase):
+
+    def test_short_text_is_unchanged(self):
+        text = "a short transcript"
+        self.assertIs(trim_to_budget(text, 100), text)
+        self.assertIs(trim_to_budget(text, None), text)
+
+    def test_long_text_is_cut_at_a_word_boundary(self):
+        words = [f"word{i}" for i in range(200)]
+        text = " ".join(words)
+        trimmed = trim_to_budget(text, 50)
+        self.assertTrue(trimmed.endswith(" [...]"))
+        kept = trimmed[:-len(" [...]")]
+        self.assertTrue(text.startswith(kept + " ")) # Never ends mid-word
+        self.assertLessEqual(estimate_tokens(kept), 50)
+        self.assertGreater(estimate_tokens(kept), 25)
+
+    def test_text_without_spaces_is_cut_at_the_budget(self):
+        trimmed = trim_to_budget("x" * 400, 10)
+        self.assertEqual(trimmed, "x" * 40 + " [...]")
+
+if __name__ == "__main__":
+    unittest.main()
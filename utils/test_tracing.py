@@ -0,0 +1,91 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+from pocketflow import BatchNode, Flow
+from tracing import JsonlTraceSink, ChromeTraceSink, trace_to
+
+class FlakySquareNode(BatchNode):
+    """Squares shared["numbers"]; the first attempt at each item fails once."""
+
+    def __init__(self):
+        super().__init__(max_retries=2)
+        self.failed = set()
+
+    def prep(self, shared):
+        return shared["numbers"]
+
+    def exec(self, item):
+        if item not in self.failed:
+            self.failed.add(item)
+            raise ValueError(f"flaky {item}")
+        return item * item
+
+    def post(self, shared, prep_res, exec_res):
+        shared["squares"] = exec_res
+        return "default"
+
+def run_flow():
+    shared = {"numbers": [1, 2]}
+    Flow(FlakySquareNode()).run(shared)
+    return shared
+
+class TestTraceSinks(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir.name, "traces", name)
+
+    def test_spans_reach_both_sinks(self):
+        with trace_to(self.path("trace.jsonl")) as jsonl_sink, trace_to(self.path("trace.json")) as chrome_sink:
+            self.assertIsInstance(jsonl_sink, JsonlTraceSink)
+            self.assertIsInstance(chrome_sink, ChromeTraceSink)
+            self.assertEqual(run_flow()["squares"], [1, 4])
+
+        with open(self.path("trace.jsonl"), encoding="utf-8") as f:
+            spans = [json.loads(line) for line in f]
+        phases = [span["phase"] for span in spans if span["node"] == "FlakySquareNode"]
+        self.assertEqual(phases.count("prep"), 1)
+        self.assertEqual(phases.count("post"), 1)
+        self.assertEqual(phases.count("item"), 2)
+        self.assertEqual(phases.count("exec"), 4) # One span per attempt
+        self.assertEqual(phases.count("retry"), 2)
+        self.assertIn("flow", [span["phase"] for span in spans])
+        failed = [span for span in spans if span["phase"] == "exec" and span["error"]]
+        self.assertEqual([span["attempt"] for span in failed], [1, 1])
+        self.assertTrue(all(span["error"].startswith("ValueError: flaky") for span in failed))
+
+        with open(self.path("trace.json"), encoding="utf-8") as f:
+            trace = json.load(f)
+        events = trace["traceEvents"]
+        names = [event["name"] for event in events]
+        for phase, count in (("prep", 1), ("exec", 4), ("post", 1), ("item", 2), ("retry", 2)):
+            self.assertEqual(names.count(f"FlakySquareNode.{phase}"), count)
+        # Valid trace events: complete spans with a duration, instant retry events, thread name metadata
+        tids = {event["args"]["name"]: event["tid"] for event in events if event["ph"] == "M"}
+        for event in events:
+            self.assertIn(event["ph"], ("X", "i", "M"))
+            self.assertIn(event["tid"], tids.values())
+            self.assertEqual(event["pid"], os.getpid())
+            if event["ph"] == "X":
+                self.assertGreaterEqual(event["dur"], 0)
+                self.assertIn("cpu_ms", event["args"])
+            if event["ph"] == "i":
+                self.assertEqual((event["name"], event["s"]), ("FlakySquareNode.retry", "t"))
+
+    def test_nothing_is_recorded_outside_the_block(self):
+        with trace_to(self.path("trace.jsonl")):
+            pass
+        run_flow()
+        with open(self.path("trace.jsonl"), encoding="utf-8") as f:
+            self.assertEqual(f.read(), "")
+
+        with mock.patch.dict(os.environ, {"FLOW_TRACE": ""}), trace_to(None) as sink: # No path: tracing is off
+            self.assertIsNone(sink)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+from transcript_index import TranscriptIndex, build_chunks, estimate_tokens
+
+SEGMENTS = [
+    {"text": "Welcome to the show, today we talk about space.", "start": 0.0, "duration": 4.0},
+    {"text": "Black holes bend light because gravity is so strong.", "start": 4.0, "duration": 5.0},
+    {"text": "A black hole forms when a massive star collapses.", "start": 9.0, "duration": 5.0},
+    {"text": "Next, photosynthesis lets plants turn sunlight into sugar.", "start": 14.0, "duration": 5.0},
+    {"text": "Chlorophyll makes leaves green and captures sunlight.", "start": 19.0, "duration": 5.0},
+    {"text": "Thanks for watching, see you next week.", "start": 24.0, "duration": 3.0},
+]
+
+class TestTranscriptIndex(unittest.TestCase):
+
+    def test_chunks_follow_segment_boundaries(self):
+        """Chunks never split a segment and keep the start time of their first segment."""
+        chunks = build_chunks(SEGMENTS, target_chars=100)
+        joined = " ".join(chunk["text"] for chunk in chunks)
+        for segment in SEGMENTS:
+            self.assertIn(segment["text"], joined)
+        self.assertEqual(chunks[0]["start"], 0.0)
+        self.assertGreater(len(chunks), 1)
+
+    def test_chunks_without_segments(self):
+        """A plain transcript is split into bounded chunks on whitespace."""
+        transcript = " ".join(["word"] * 400)
+        chunks = build_chunks([], transcript, target_chars=200)
+        self.assertTrue(all(len(chunk["text"]) <= 200 for chunk in chunks))
+        self.assertEqual(" ".join(chunk["text"] for chunk in chunks).split(), transcript.split())
+
+    def test_search_ranks_relevant_chunk_first(self):
+        """The chunk about photosynthesis ranks highest for a plants query."""
+        index = TranscriptIndex.build(SEGMENTS, target_chars=60)
+        score, best = index.search("How do plants use sunlight?", k=1)[0]
+        self.assertGreater(score, 0)
+        self.assertIn("photosynthesis", index.chunks[best]["text"])
+
+    def test_excerpt_respects_budget_and_order(self):
+        """Excerpts stay within the token budget and keep transcript order."""
+        index = TranscriptIndex.build(SEGMENTS, target_chars=60)
+        excerpt = index.excerpt("black hole gravity sunlight", max_tokens=30)
+        self.assertLessEqual(estimate_tokens(excerpt.replace("\n...\n", " ")), 30)
+        parts = excerpt.split("\n...\n")
+        positions = [" ".join(s["text"] for s in SEGMENTS).index(part) for part in parts]
+        self.assertEqual(positions, sorted(positions))
+
+    def test_excerpt_falls_back_to_opening(self):
+        """With no matching terms the excerpt is the start of the transcript."""
+        index = TranscriptIndex.build(SEGMENTS, target_chars=60)
+        self.assertTrue(index.excerpt("zzz qqq", max_tokens=20).startswith("Welcome to the show"))
+
+    def test_round_trip(self):
+        """An index restored from to_dict() returns the same results."""
+        index = TranscriptIndex.build(SEGMENTS, target_chars=60)
+        restored = TranscriptIndex.from_dict(index.to_dict())
+        self.assertEqual(restored.search("black hole", k=3), index.search("black hole", k=3))
+        self.assertEqual(restored.fingerprint, index.fingerprint)
+
+if __name__ == '__main__':
+    unittest.main()
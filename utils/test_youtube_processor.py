@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import youtube_processor
+from youtube_processor import get_youtube_video_info
+from utils.transcript_store import TranscriptStore, OfflineStoreMiss # The module youtube_processor imports
+
+URL = "https://www.youtube.com/watch?v=abcdefghijk"
+SEGMENTS = [{"text": "hello", "start": 0.0, "duration": 1.0}, {"text": "world", "start": 1.0, "duration": 1.0}]
+
+class TestVideoInfoStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = TranscriptStore(self.tmp_dir.name)
+        patchers = [
+            mock.patch.object(youtube_processor, "get_default_store", return_value=self.store),
+            mock.patch.object(youtube_processor, "_fetch_transcript_segments", return_value=SEGMENTS),
+            mock.patch.object(youtube_processor.requests, "get"),
+            mock.patch.dict(os.environ, {"YOUTUBE_OFFLINE": ""}),
+        ]
+        _, self.fetch_segments, self.http_get, _ = [patcher.start() for patcher in patchers]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+        self.http_get.return_value.status_code = 200
+        self.http_get.return_value.json.return_value = {"title": "Stored title"}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_store_is_read_before_the_network(self):
+        self.store.save({"video_id": "abcdefghijk", "title": "Cached", "thumbnail_url": "thumb", "segments": SEGMENTS})
+        with mock.patch.object(youtube_processor, "_fetch_video_info") as fetch:
+            info = get_youtube_video_info(URL)
+        fetch.assert_not_called()
+        self.assertEqual((info["title"], info["transcript"], info["url"]), ("Cached", "hello world", URL))
+
+    def test_complete_fetch_is_saved(self):
+        info = get_youtube_video_info(URL)
+        self.assertEqual((info["title"], info["transcript"]), ("Stored title", "hello world"))
+        self.assertEqual(self.store.load("abcdefghijk")["segments"], SEGMENTS)
+
+        get_youtube_video_info(URL) # Now served from the store
+        self.assertEqual((self.fetch_segments.call_count, self.http_get.call_count), (1, 1))
+
+    def test_partial_fetches_are_not_saved(self):
+        self.http_get.return_value.status_code = 500
+        info = get_youtube_video_info(URL)
+        self.assertIn("abcdefghijk", info["title"]) # Placeholder title
+        self.assertFalse(self.store.contains("abcdefghijk"))
+
+        self.http_get.return_value.status_code = 200
+        self.fetch_segments.side_effect = RuntimeError("no transcript")
+        info = get_youtube_video_info(URL)
+        self.assertIn("no transcript", info["transcript"])
+        self.assertFalse(self.store.contains("abcdefghijk"))
+
+    def test_offline_miss_never_touches_the_network(self):
+        with mock.patch.dict(os.environ, {"YOUTUBE_OFFLINE": "1"}), \
+             mock.patch.object(youtube_processor, "_fetch_video_info") as fetch:
+            with self.assertRaises(OfflineStoreMiss):
+                get_youtube_video_info(URL)
+        fetch.assert_not_called()
+        self.fetch_segments.assert_not_called()
+        self.http_get.assert_not_called()
+
+if __name__ == "__main__":
+    unittest.main()
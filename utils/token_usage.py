@@ -0,0 +1,108 @@
+import contextvars
+import threading
+from contextlib import contextmanager
+
+from utils.transcript_index import estimate_tokens
+
+# The video being processed; set around a flow run and inherited by worker threads
+# that are started with a copy of the caller's context (pocketflow does this).
+_current_video = contextvars.ContextVar("usage_video", default=None)
+
+
+@contextmanager
+def usage_scope(video: str = None):
+    """Attribute every LLM call made inside this block (and its worker threads) to `video`."""
+    token = _current_video.set(video)
+    try:
+        yield
+    finally:
+        _current_video.reset(token)
+
+
+def trim_to_budget(text: str, max_tokens: int) -> str:
+    """Cut `text` at a word boundary so that it fits in roughly `max_tokens` tokens."""
+    if max_tokens is None:
+        return text
+    tokens = estimate_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    keep = int(len(text) * max_tokens / tokens)
+    cut = text.rfind(" ", keep // 2, keep)
+    return text[:cut if cut != -1 else keep] + " [...]"
+
+
+def _empty_totals() -> dict:
+    return {"calls": 0, "cached_calls": 0, "input_tokens": 0, "output_tokens": 0, "estimated_calls": 0, "latency_s": 0.0}
+
+
+class UsageTracker:
+    """
+    Thread-safe token and latency accounting for LLM calls, aggregated per (video, caller).
+    Provider-reported usage is used when available, the local estimator otherwise
+    (such calls are counted in `estimated_calls`). Cache hits cost nothing and are
+    only counted in `cached_calls`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {} # (video, caller, model) -> totals
+
+    def record(self, caller: str, model: str, prompt: str, response: str, usage: dict = None,
+               latency: float = 0.0, cached: bool = False):
+        key = (_current_video.get(), caller or "unknown", model)
+        with self._lock:
+            totals = self._totals.setdefault(key, _empty_totals())
+            if cached:
+                totals["cached_calls"] += 1
+                return
+            usage = usage or {}
+            input_tokens = usage.get("input_tokens")
+            output_tokens = usage.get("output_tokens")
+            if input_tokens is None or output_tokens is None:
+                totals["estimated_calls"] += 1
+                input_tokens = estimate_tokens(prompt) if input_tokens is None else input_tokens
+                output_tokens = estimate_tokens(response) if output_tokens is None else output_tokens
+            totals["calls"] += 1
+            totals["input_tokens"] += input_tokens
+            totals["output_tokens"] += output_tokens
+            totals["latency_s"] += latency
+
+    def summary(self, video: str = None) -> dict:
+        """Totals overall, per caller (node), per model and per video; restricted to one video if given."""
+        report = {"total": _empty_totals(), "by_node": {}, "by_model": {}, "by_video": {}}
+        with self._lock:
+            items = [(key, dict(totals)) for key, totals in self._totals.items()]
+        for (item_video, caller, model), totals in items:
+            if video is not None and item_video != video:
+                continue
+            for bucket in (report["total"],
+                           report["by_node"].setdefault(caller, _empty_totals()),
+                           report["by_model"].setdefault(model, _empty_totals()),
+                           report["by_video"].setdefault(item_video or "unknown", _empty_totals())):
+                for stat, value in totals.items():
+                    bucket[stat] += value
+        for bucket in [report["total"]] + [b for group in ("by_node", "by_model", "by_video") for b in report[group].values()]:
+            bucket["latency_s"] = round(bucket["latency_s"], 3)
+        return report
+
+    def reset(self):
+        with self._lock:
+            self._totals.clear()
+
+
+def format_usage_report(report: dict) -> str:
+    """Human-readable lines for a UsageTracker.summary() report."""
+    def line(label, totals):
+        estimated = f", {totals['estimated_calls']} estimated" if totals["estimated_calls"] else ""
+        return (f"  {label}: {totals['calls']} calls ({totals['cached_calls']} cached{estimated}), "
+                f"{totals['input_tokens']} input + {totals['output_tokens']} output tokens, {totals['latency_s']}s LLM time")
+    lines = [line("Total", report["total"])]
+    lines += [line(node, totals) for node, totals in sorted(report["by_node"].items())]
+    return "\n".join(lines)
+
+
+_tracker = UsageTracker()
+
+
+def get_usage_tracker() -> UsageTracker:
+    return _tracker
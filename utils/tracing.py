@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+from pocketflow import Instrument, add_instrument, remove_instrument
+
+logger = logging.getLogger(__name__)
+
+
+class JsonlTraceSink(Instrument):
+    """Appends one JSON object per span or retry event to a file, as they happen."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def span_end(self, span):
+        self._write(span)
+
+    def event(self, span):
+        self._write(span)
+
+    def _write(self, span):
+        line = json.dumps(span, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class ChromeTraceSink(Instrument):
+    """
+    Collects spans as Chrome trace events and writes them on close(). Open the file in
+    chrome://tracing or https://ui.perfetto.dev to see a per-thread timeline of the run.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._events = []
+        self._threads = {}
+        self._pid = os.getpid()
+
+    def _tid(self, thread_name):
+        # Chrome traces identify threads by number; names are attached as metadata events
+        tid = self._threads.get(thread_name)
+        if tid is None:
+            tid = self._threads[thread_name] = len(self._threads) + 1
+        return tid
+
+    def span_end(self, span):
+        args = {k: v for k, v in span.items() if k not in ("node", "phase", "start", "wall", "thread")}
+        args["cpu_ms"] = round(args.pop("cpu") * 1000, 3)
+        with self._lock:
+            self._events.append({
+                "name": f"{span['node']}.{span['phase']}", "cat": span["phase"], "ph": "X",
+                "ts": span["start"] * 1e6, "dur": span["wall"] * 1e6,
+                "pid": self._pid, "tid": self._tid(span["thread"]), "args": args,
+            })
+
+    def event(self, span):
+        args = {k: v for k, v in span.items() if k not in ("node", "phase", "start", "thread")}
+        with self._lock:
+            self._events.append({
+                "name": f"{span['node']}.{span['phase']}", "cat": span["phase"], "ph": "i", "s": "t",
+                "ts": span["start"] * 1e6, "pid": self._pid, "tid": self._tid(span["thread"]), "args": args,
+            })
+
+    def close(self):
+        with self._lock:
+            metadata = [
+                {"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": name}}
+                for name, tid in self._threads.items()
+            ]
+            trace = {"traceEvents": metadata + self._events, "displayTimeUnit": "ms"}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(trace, f, ensure_ascii=False, default=str)
+
+
+def make_trace_sink(path: str) -> Instrument:
+    """A JSONL sink for *.jsonl paths, a Chrome trace sink otherwise."""
+    return JsonlTraceSink(path) if path.endswith(".jsonl") else ChromeTraceSink(path)
+
+
+@contextmanager
+def trace_to(path: str = None):
+    """
+    Record node timings of everything run inside this block to `path` (default: the FLOW_TRACE
+    environment variable). Does nothing when no path is given.
+    """
+    path = path or os.getenv("FLOW_TRACE")
+    if not path:
+        yield None
+        return
+    sink = make_trace_sink(path)
+    add_instrument(sink)
+    try:
+        yield sink
+    finally:
+        remove_instrument(sink)
+        sink.close()
+        logger.info("Trace written to %s", path)
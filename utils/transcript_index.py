@@ -0,0 +1,151 @@
+import hashlib
+import math
+import re
+from collections import Counter, defaultdict
+
+INDEX_VERSION = 1
+
+# Latin/digit words are one token each; CJK text has no spaces, so each character is a token
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af"
+_CJK_RE = re.compile(f"[{_CJK}]")
+_TOKEN_RE = re.compile(f"[{_CJK}]|[^\\W_{_CJK}]+")
+_STOPWORDS = {
+    "the", "a", "an", "and", "or", "but", "of", "to", "in", "on", "for", "with", "is", "are", "was",
+    "were", "be", "it", "that", "this", "as", "at", "by", "from", "what", "why", "how", "do", "does",
+    "you", "we", "they", "i", "so", "if", "about", "can", "could", "would", "should", "not", "have", "has",
+}
+
+
+def tokenize(text: str) -> list:
+    return [t for t in (m.lower() for m in _TOKEN_RE.findall(text)) if t not in _STOPWORDS]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough LLM token estimate: ~4 characters per token, CJK characters count as one token each."""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def build_chunks(segments: list, transcript: str = "", target_chars: int = 600) -> list:
+    """
+    Group timed transcript segments into chunks of roughly `target_chars` characters, never
+    splitting a segment. Without segments the plain transcript is split on whitespace instead.
+    Returns [{"text": str, "start": float or None}, ...] in transcript order.
+    """
+    chunks = []
+    if segments:
+        parts, length, start = [], 0, None
+        for segment in segments:
+            text = segment.get("text", "").strip()
+            if not text:
+                continue
+            if start is None:
+                start = segment.get("start")
+            parts.append(text)
+            length += len(text) + 1
+            if length >= target_chars:
+                chunks.append({"text": " ".join(parts), "start": start})
+                parts, length, start = [], 0, None
+        if parts:
+            chunks.append({"text": " ".join(parts), "start": start})
+        return chunks
+
+    position = 0
+    while position < len(transcript):
+        end = min(len(transcript), position + target_chars)
+        if end < len(transcript):
+            space = transcript.rfind(" ", position + target_chars // 2, end)
+            if space != -1:
+                end = space
+        text = transcript[position:end].strip()
+        if text:
+            chunks.append({"text": text, "start": None})
+        position = end
+    return chunks
+
+
+def transcript_fingerprint(transcript: str, target_chars: int) -> str:
+    """Identifies the transcript and chunking an index was built from, so stale cached indexes are ignored."""
+    return hashlib.sha256(f"{INDEX_VERSION}:{target_chars}:{transcript}".encode("utf-8")).hexdigest()
+
+
+class TranscriptIndex:
+    """
+    Okapi BM25 index over transcript chunks, built once per video.
+    An inverted index keeps scoring proportional to the query's postings rather than the
+    number of chunks, which is plenty fast for transcripts without pulling in NumPy.
+    """
+
+    def __init__(self, chunks: list, term_freqs: list = None, fingerprint: str = "", k1: float = 1.5, b: float = 0.75):
+        self.chunks = chunks
+        self.fingerprint = fingerprint
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = term_freqs if term_freqs is not None else [dict(Counter(tokenize(c["text"]))) for c in chunks]
+        self.doc_lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_doc_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+        self.postings = defaultdict(list)
+        for doc_id, tf in enumerate(self.term_freqs):
+            for term, count in tf.items():
+                self.postings[term].append((doc_id, count))
+        n_docs = len(self.chunks)
+        self.idf = {
+            term: math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, docs in self.postings.items()
+        }
+
+    @classmethod
+    def build(cls, segments: list, transcript: str = "", target_chars: int = 600):
+        chunks = build_chunks(segments, transcript, target_chars)
+        return cls(chunks, fingerprint=transcript_fingerprint(transcript, target_chars))
+
+    def search(self, query: str, k: int = 5) -> list:
+        """Return up to k (score, chunk_index) pairs with a positive score, best first."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, count in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / (self.avg_doc_length or 1))
+                scores[doc_id] += idf * count * (self.k1 + 1) / (count + norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(score, doc_id) for doc_id, score in ranked[:k]]
+
+    def excerpt(self, query: str, max_tokens: int = 500, k: int = 6) -> str:
+        """
+        The most relevant chunks for `query` that fit in `max_tokens`, in transcript order.
+        Falls back to the opening of the transcript when nothing matches.
+        """
+        candidates = [doc_id for _, doc_id in self.search(query, k)]
+        matched = bool(candidates)
+        if not matched:
+            candidates = list(range(len(self.chunks)))
+        selected, used = [], 0
+        for doc_id in candidates:
+            cost = estimate_tokens(self.chunks[doc_id]["text"])
+            if used + cost > max_tokens:
+                if not selected:
+                    # Even the best chunk is over budget: keep a trimmed prefix of it
+                    selected.append((doc_id, self.chunks[doc_id]["text"][:max_tokens * 4]))
+                if not matched:
+                    break # The fallback excerpt stays a contiguous opening
+                continue
+            selected.append((doc_id, self.chunks[doc_id]["text"]))
+            used += cost
+        selected.sort()
+        return "\n...\n".join(text for _, text in selected)
+
+    def to_dict(self) -> dict:
+        return {
+            "version": INDEX_VERSION,
+            "fingerprint": self.fingerprint,
+            "chunks": self.chunks,
+            "term_freqs": self.term_freqs,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported transcript index version: {data.get('version')}")
+        return cls(data["chunks"], term_freqs=data["term_freqs"], fingerprint=data.get("fingerprint", ""))
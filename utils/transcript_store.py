@@ -0,0 +1,98 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+
+DEFAULT_STORE_DIR = os.path.join(".cache", "transcripts")
+
+logger = logging.getLogger(__name__)
+
+
+class OfflineStoreMiss(LookupError):
+    """Raised in offline mode when a video is not present in the local store."""
+
+
+class TranscriptStore:
+    """
+    Local store of fetched YouTube video data, one JSON file per video_id:
+
+        {"video_id": str, "title": str, "thumbnail_url": str,
+         "segments": [{"text": str, "start": float, "duration": float}, ...]}
+
+    The files double as offline fixtures: copy them into a store directory and
+    run with YOUTUBE_OFFLINE=1 to process those videos without any network access.
+    """
+
+    def __init__(self, directory: str = DEFAULT_STORE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def path_for(self, video_id: str) -> str:
+        # video ids are [0-9A-Za-z_-]{11}; sanitize anyway so a bad id can't escape the directory
+        safe_id = re.sub(r'[^0-9A-Za-z_-]', '_', video_id)
+        return os.path.join(self.directory, f"{safe_id}.json")
+
+    def index_path_for(self, video_id: str) -> str:
+        return self.path_for(video_id)[:-len(".json")] + ".index.json"
+
+    def load(self, video_id: str):
+        """Return the stored record for `video_id`, or None if it has not been fetched yet."""
+        return self._read_json(self.path_for(video_id))
+
+    def load_index(self, video_id: str):
+        """Return the cached retrieval index data for `video_id` (see utils/transcript_index.py), or None."""
+        return self._read_json(self.index_path_for(video_id))
+
+    def _read_json(self, path: str):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning("无法读取本地字幕存储 %s: %s", path, e)
+            return None
+
+    def save(self, record: dict):
+        """Atomically write a record (write to a temp file, then rename over the target)."""
+        self._write_json(self.path_for(record["video_id"]), record)
+
+    def save_index(self, video_id: str, index_data: dict):
+        """Cache a video's retrieval index next to its transcript record."""
+        self._write_json(self.index_path_for(video_id), index_data)
+
+    def _write_json(self, path: str, data: dict):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+    def contains(self, video_id: str) -> bool:
+        return os.path.exists(self.path_for(video_id))
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store() -> TranscriptStore:
+    """Process-wide store rooted at TRANSCRIPT_STORE_DIR (default .cache/transcripts)."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = TranscriptStore(os.getenv("TRANSCRIPT_STORE_DIR", DEFAULT_STORE_DIR))
+        return _default_store
+
+
+def offline_mode() -> bool:
+    """YOUTUBE_OFFLINE=1 serves video data only from the local store and never touches the network."""
+    return os.getenv("YOUTUBE_OFFLINE", "").lower() in ("1", "true", "yes")
@@ -2,6 +2,15 @@ from youtube_transcript_api import YouTubeTranscriptApi
 import requests
 import re
 import json
+import logging
+import copy
+from utils.transcript_store import get_default_store, offline_mode, OfflineStoreMiss
+from utils.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# 同一视频的并发获取（如批量列表中重复的URL）只请求一次网络，其余调用共享结果的副本
+_video_flight = SingleFlight(clone=copy.deepcopy)
 
 def extract_video_id(video_url: str) -> str:
     """从YouTube URL中提取视频ID"""
@@ -17,16 +26,45 @@ def extract_video_id(video_url: str) -> str:
     if re.match(r'^[0-9A-Za-z_-]{11}$', video_url):
         return video_url
     
-    print(f"警告: 无法从URL提取视频ID: {video_url}")
+    logger.warning("无法从URL提取视频ID: %s", video_url)
     return "unknown_video_id"
 
-def get_youtube_video_info(video_url: str) -> dict:
+def _fetch_transcript_segments(video_id: str) -> list:
+    """获取带时间信息的字幕片段: [{"text", "start", "duration"}, ...]"""
+    languages = ['zh-CN', 'zh', 'en']
+    if hasattr(YouTubeTranscriptApi, "get_transcript"):
+        segments = YouTubeTranscriptApi.get_transcript(video_id, languages=languages)
+    else:
+        # youtube-transcript-api >= 1.0 移除了类方法 get_transcript
+        segments = YouTubeTranscriptApi().fetch(video_id, languages=languages).to_raw_data()
+    return [
+        {"text": entry["text"], "start": entry.get("start", 0.0), "duration": entry.get("duration", 0.0)}
+        for entry in segments
+    ]
+
+def _video_info_from_record(video_url: str, record: dict) -> dict:
+    """将本地存储中的记录转换为video_info字典"""
+    segments = record.get("segments", [])
+    return {
+        "url": video_url,
+        "title": record.get("title", ""),
+        "transcript": " ".join([segment["text"] for segment in segments]),
+        "segments": segments,
+        "thumbnail_url": record.get("thumbnail_url", ""),
+        "video_id": record["video_id"]
+    }
+
+def get_youtube_video_info(video_url: str, offline: bool = None, use_store: bool = True) -> dict:
     """
     从YouTube URL获取视频信息，包括标题、缩略图URL、视频ID和字幕。
     使用youtube_transcript_api获取字幕，使用简单的元数据抓取获取标题和缩略图。
+    首次成功获取后结果会保存到本地字幕存储中，之后优先从存储读取，不再访问网络。
+    离线模式 (offline=True 或 YOUTUBE_OFFLINE=1) 只从本地存储读取，未命中时抛出 OfflineStoreMiss。
     """
-    print(f"处理YouTube URL: {video_url}")
-    
+    logger.debug("处理YouTube URL: %s", video_url)
+    if offline is None:
+        offline = offline_mode()
+
     video_id = extract_video_id(video_url)
     if video_id == "unknown_video_id":
         # 返回占位符数据
@@ -34,30 +72,58 @@ def get_youtube_video_info(video_url: str) -> dict:
             "url": video_url,
             "title": "无法获取视频标题 (未知视频ID)",
             "transcript": "无法获取字幕。请检查YouTube URL是否有效。",
+            "segments": [],
             "thumbnail_url": "",
             "video_id": "unknown_video_id"
         }
-    
+
+    store = get_default_store() if (use_store or offline) else None
+    if store is not None:
+        record = store.load(video_id)
+        if record is not None:
+            logger.info("从本地存储读取视频信息: %s", video_id)
+            return _video_info_from_record(video_url, record)
+    if offline:
+        raise OfflineStoreMiss(f"离线模式: 本地存储中没有视频 {video_id}")
+
+    result, leader = _video_flight.do((video_id, store is not None), _fetch_video_info, video_url, video_id, store)
+    if not leader:
+        logger.info("共享同一视频正在进行的获取: %s", video_id)
+        result["url"] = video_url # 其他调用者可能使用了不同形式的URL
+    return result
+
+def _fetch_video_info(video_url: str, video_id: str, store) -> dict:
+    """从网络获取视频信息，成功后保存到本地存储"""
+    if store is not None:
+        # 刚完成的相同获取可能已经写入了存储
+        record = store.load(video_id)
+        if record is not None:
+            return _video_info_from_record(video_url, record)
+
     # 创建结果字典
     result = {
         "url": video_url,
         "title": "",
         "transcript": "",
+        "segments": [],
         "thumbnail_url": f"https://i.ytimg.com/vi/{video_id}/maxresdefault.jpg",
         "video_id": video_id
     }
-    
+    fetched_ok = True
+
     # 尝试获取字幕
     try:
-        transcript_list = YouTubeTranscriptApi.get_transcript(video_id, languages=['zh-CN', 'zh', 'en'])
+        segments = _fetch_transcript_segments(video_id)
         # 将字幕转换为纯文本
-        full_transcript = " ".join([entry["text"] for entry in transcript_list])
+        full_transcript = " ".join([segment["text"] for segment in segments])
+        result["segments"] = segments
         result["transcript"] = full_transcript
-        print(f"成功获取字幕，长度: {len(full_transcript)} 字符")
+        logger.info("成功获取字幕，长度: %d 字符", len(full_transcript))
     except Exception as e:
         error_message = f"获取字幕时出错: {str(e)}"
-        print(error_message)
+        logger.warning(error_message)
         result["transcript"] = error_message
+        fetched_ok = False
     
     # 尝试获取视频标题
     try:
@@ -67,14 +133,25 @@ def get_youtube_video_info(video_url: str) -> dict:
         if response.status_code == 200:
             oembed_data = response.json()
             result["title"] = oembed_data.get("title", "未知标题")
-            print(f"成功获取视频标题: '{result['title']}'")
+            logger.info("成功获取视频标题: '%s'", result["title"])
         else:
-            print(f"获取视频元数据失败，HTTP状态码: {response.status_code}")
+            logger.warning("获取视频元数据失败，HTTP状态码: %s", response.status_code)
             result["title"] = f"未知视频标题 (ID: {video_id})"
+            fetched_ok = False
     except Exception as e:
-        print(f"获取视频标题时出错: {str(e)}")
+        logger.warning("获取视频标题时出错: %s", e)
         result["title"] = f"未知视频标题 (ID: {video_id})"
-        
+        fetched_ok = False
+
+    # 只保存完整获取成功的结果，失败的部分下次运行时会重新获取
+    if store is not None and fetched_ok:
+        store.save({
+            "video_id": video_id,
+            "title": result["title"],
+            "thumbnail_url": result["thumbnail_url"],
+            "segments": result["segments"]
+        })
+
     return result
 
 if __name__ == "__main__":
@@ -84,7 +161,9 @@ if __name__ == "__main__":
     
     print("\nYouTube视频信息:")
     for key, value in info.items():
-        if key == "transcript" and value:
+        if key == "segments":
+            print(f"  {key.capitalize()}: {len(value)} 段")
+        elif key == "transcript" and value:
             print(f"  {key.capitalize()}: {value[:100]}...")  # 只显示字幕的前100个字符
         else:
             print(f"  {key.capitalize()}: {value}") 
\ No newline at end of file